@@ -1,11 +1,48 @@
 import os
+import sys
+import argparse
+import atexit
+import copy
+import csv
+import difflib
+import io
 import json
+import gzip
+import zlib
+import hashlib
+import multiprocessing
+import pickle
 import re
+import select
 import sqlite3
-from functools import lru_cache
+import struct
+import tempfile
+import time
+import threading
+import ctypes
+import ctypes.util
+import zipfile
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, wraps
 from pathlib import Path
-from threading import Lock
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify
+from urllib.parse import parse_qs, unquote
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
+from threading import Condition, Event, Lock, Thread
+from flask import Flask, abort, make_response, render_template, stream_template, request, redirect, url_for, send_file, jsonify
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it /images always serves the original
+    Image = ImageOps = None
+try:
+    import brotli
+except ImportError:  # optional: without it large responses are gzip-compressed only
+    brotli = None
 
 # --- Resolve paths relative to this repository for templates/static ---
 BASE_DIR = Path(__file__).resolve().parent
@@ -24,12 +61,12 @@ app = Flask(
     static_folder=str(STATIC_DIR) if STATIC_DIR else None,  # None if served by Nginx
 )
 
-# --- Paths ---
-JSON_DIR = r"/home/developer/Output_jason_api"
-IMG_DIR  = r"/home/developer/Capture_photos_upload"
+# --- Paths (env overrides let the benchmark harness point the app at a synthetic fleet) ---
+JSON_DIR = os.environ.get("JSON_DIR", r"/home/developer/Output_jason_api")
+IMG_DIR  = os.environ.get("IMG_DIR", r"/home/developer/Capture_photos_upload")
 
 # --- SQLite DB ---
-DB_PATH = r"/home/developer/asset_capture_app_dev/data/QR_codes.db"
+DB_PATH = os.environ.get("DB_PATH", r"/home/developer/asset_capture_app_dev/data/QR_codes.db")
 
 # Tables/columns
 QR_CODES_TABLE   = "QR_codes"
@@ -37,6 +74,9 @@ QR_CODE_ID_COL   = "QR_code_ID"
 QR_APPROVED_COL  = "Approved"
 
 SDI_TABLE = "sdi_dataset"
+SDI_KEY_COLS = ["QR Code", "Building"]
+# Rows per transaction chunk in the bulk upsert path
+BULK_UPSERT_CHUNK = 400
 # Target column names (intersected with actual schema at runtime)
 SDI_TARGET_COLS = [
     "QR Code",
@@ -53,6 +93,9 @@ SDI_TARGET_COLS = [
     "Technical Safety BC",
     "Approved",
 ]
+# Assets already exported to Planon (written by the export job)
+SDI_PRINT_OUT_TABLE = "sdi_print_out"
+SDI_PRINT_OUT_QR_COL = "QR Code"
 
 # Dropdown sources
 ASSET_GROUP_TABLE = "Asset_Group"
@@ -71,19 +114,539 @@ SEQ_SHOW  = ['-0', '-1', '-2', '-3']
 JSON_NAME_RE = re.compile(r"^(\d+)_([A-Za-z]+)_(\d+(?:-\d+)?)\.json$")
 
 
+# --- Metrics (Server-Timing header + Prometheus /metrics) ---
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_HELP = {
+    "apr_request_duration_seconds": ("histogram", "Request latency by endpoint."),
+    "apr_requests_total": ("counter", "Requests by endpoint and status code."),
+    "apr_phase_duration_seconds": (
+        "histogram", "Time per instrumented phase: images, json, db (connection held), render, sync_images, sync_json."),
+    "apr_sync_files_total": ("counter", "Files recorded by directory sync passes, by kind and status."),
+    "apr_db_statements_total": ("counter", "SQL statements run on pooled connections."),
+    "apr_cache_requests_total": ("counter", "Cache lookups by cache and result."),
+}
+
+
+class Metrics:
+    """Thread-safe counters and histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts (last is +Inf), sum, count]
+
+    def inc(self, name: str, value=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value, **labels):
+        """Overwrite a counter with a total kept elsewhere (copied in at scrape time)."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = value
+
+    def counter_values(self, name: str) -> dict:
+        """{labels dict as sorted tuple: value} for one counter."""
+        with self._lock:
+            return {labels: value for (n, labels), value in self._counters.items() if n == name}
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(METRICS_BUCKETS) + 1), 0.0, 0]
+            hist[0][bisect_left(METRICS_BUCKETS, seconds)] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        def esc(v):
+            return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+    def render(self, extra=()) -> str:
+        """
+        Exposition text. `extra` is a list of (name, type, help, [(labels dict, value), ...])
+        computed at scrape time (index sizes, cache stats, ...).
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+        lines = []
+        for name in sorted({n for n, _ in counters} | {n for n, _ in histograms}):
+            kind, help_text = METRICS_HELP.get(name, ("untyped", name))
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+            for (n, labels), (buckets, total, count) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, hits in zip(METRICS_BUCKETS + ("+Inf",), buckets):
+                    cumulative += hits
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {count}")
+        for name, kind, help_text, samples in extra:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{self._labels(sorted(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+_TIMING = threading.local()  # per-request phase totals: .phases = {phase: [seconds, calls]}, .statements
+
+
+class _Phase:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        phases = getattr(_TIMING, "phases", None)
+        if phases is not None:
+            totals = phases.setdefault(self.name, [0.0, 0])
+            totals[0] += elapsed
+            totals[1] += 1
+        METRICS.observe("apr_phase_duration_seconds", elapsed, phase=self.name)
+
+
+_NO_PHASE = nullcontext()
+
+
+def timed(phase: str):
+    """Context manager timing one phase (shared no-op when metrics are off)."""
+    return _Phase(phase) if METRICS_ENABLED else _NO_PHASE
+
+
+def timed_phase(phase: str):
+    """Decorator form of timed()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            with _Phase(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _count_statement(_sql):
+    """sqlite3 trace callback installed on pooled connections when metrics are on."""
+    _TIMING.statements = getattr(_TIMING, "statements", 0) + 1
+    METRICS.inc("apr_db_statements_total")
+
+
+# --- Storage layout (flat or sharded JSON_DIR / IMG_DIR) ---
+# "flat": every file directly in the directory (the original layout).
+# "building": one subdirectory per building ("<dir>/<building>/<file>"); files
+# still at the top level are found too, so migrate-layout can run while serving.
+STORAGE_LAYOUT = os.environ.get("STORAGE_LAYOUT", "flat")
+# Building part of a photo name ("<QR> <Building> <type> - <seq>.<ext>")
+IMG_BUILDING_RE = re.compile(r"^\d+\s+(.+?)\s+[A-Za-z]+\s+-\s+\d+\.[^.]+$")
+
+
+def _shard_name(building: str) -> str:
+    """Directory name for a building (kept filesystem-safe and deterministic)."""
+    return re.sub(r"[^\w.-]", "_", building.strip()).strip(".") or "_"
+
+
+class FlatLayout:
+    """Every file directly in the root directory."""
+    name = "flat"
+
+    def shard(self, filename: str) -> str:
+        """Subdirectory `filename` belongs in ("" = top level)."""
+        return ""
+
+    def directories(self, root: str) -> list:
+        """Directories holding files: the root, then any shards."""
+        return [root]
+
+    def path(self, root: str, filename: str) -> str:
+        """Where `filename` belongs; new files are written here."""
+        return os.path.join(root, self.shard(filename), filename)
+
+    def locate(self, root: str, filename: str):
+        """Existing path of `filename` (its shard first, then the top level) or None; rejects '..' tricks."""
+        for shard in dict.fromkeys((self.shard(filename), "")):
+            path = safe_join(root, shard, filename) if shard else safe_join(root, filename)
+            if path is not None and os.path.isfile(path):
+                return path
+        return None
+
+    def scan(self, root: str):
+        """DirEntry of every file, one os.scandir per directory (callers reuse entry.stat())."""
+        for directory in self.directories(root):
+            shard = "" if directory == root else os.path.basename(directory)
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        # Other subdirectories' files are not ours (e.g. an "archive" folder)
+                        if entry.is_file() and (not shard or self.shard(entry.name) == shard):
+                            yield entry
+            except FileNotFoundError:
+                continue
+
+
+class BuildingLayout(FlatLayout):
+    """One subdirectory per building, so listing a shard costs its size, not the fleet's."""
+    name = "building"
+
+    def __init__(self, pattern, group: int):
+        self._pattern = pattern
+        self._group = group
+        self._lock = Lock()
+        self._dirs = {}  # root -> (root mtime_ns, directories)
+
+    def shard(self, filename: str) -> str:
+        m = self._pattern.match(filename)
+        return _shard_name(m.group(self._group)) if m else ""
+
+    def directories(self, root: str) -> list:
+        """Root plus its subdirectories, re-listed only when the root's mtime changes."""
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            cached = self._dirs.get(root)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        with os.scandir(root) as it:
+            dirs = [root] + sorted(e.path for e in it
+                                   if e.is_dir(follow_symlinks=False) and not e.name.startswith("."))
+        # Same slack as the image index: a very recent mtime may hide another change
+        if time.time_ns() - mtime_ns >= IMG_INDEX_MTIME_SLACK_NS:
+            with self._lock:
+                self._dirs[root] = (mtime_ns, dirs)
+        return dirs
+
+
+def make_layout(name: str, pattern, group: int):
+    if name == "flat":
+        return FlatLayout()
+    if name == "building":
+        return BuildingLayout(pattern, group)
+    raise ValueError(f"Unknown STORAGE_LAYOUT {name!r} (use 'flat' or 'building')")
+
+
+JSON_LAYOUT = make_layout(STORAGE_LAYOUT, JSON_NAME_RE, 3)
+IMG_LAYOUT = make_layout(STORAGE_LAYOUT, IMG_BUILDING_RE, 1)
+
+
+def migrate_storage(target: str, dry_run: bool = False) -> dict:
+    """
+    Move JSON_DIR / IMG_DIR files into their building shard (target "building")
+    or back to the top level ("flat"). Renames stay on one filesystem, so each
+    move is atomic; a file whose destination already exists is left alone.
+    Returns {"json": {...}, "images": {...}} with moved / conflict counts.
+    """
+    report = {}
+    for label, root, pattern, group in (("json", JSON_DIR, JSON_NAME_RE, 3),
+                                        ("images", IMG_DIR, IMG_BUILDING_RE, 1)):
+        layout = make_layout(target, pattern, group)
+        moved = conflicts = 0
+        # The sharded view sees top-level files and files already in their shard
+        for entry in list(BuildingLayout(pattern, group).scan(root)):
+            dest = layout.path(root, entry.name)
+            if os.path.abspath(entry.path) == os.path.abspath(dest):
+                continue
+            if os.path.exists(dest):
+                conflicts += 1
+                print(f"?? {dest} already exists; leaving {entry.path}")
+                continue
+            if not dry_run:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.rename(entry.path, dest)
+            moved += 1
+        if target == "flat" and not dry_run and os.path.isdir(root):
+            for directory in BuildingLayout(pattern, group).directories(root)[1:]:
+                try:
+                    os.rmdir(directory)  # only succeeds once the shard is empty
+                except OSError:
+                    pass
+        report[label] = {"moved": moved, "conflicts": conflicts}
+    return report
+
+
+def migrate_layout_cli(argv) -> int:
+    """python asset_plate_reviewer.py migrate-layout building|flat [--dry-run]"""
+    parser = argparse.ArgumentParser(
+        prog="asset_plate_reviewer.py migrate-layout",
+        description="Move JSON_DIR / IMG_DIR files between the flat and per-building layouts. "
+                    "Run the app with STORAGE_LAYOUT=building before moving files into shards "
+                    "(it reads both) and switch back to flat only after flattening.",
+    )
+    parser.add_argument("target", choices=["building", "flat"])
+    parser.add_argument("--dry-run", action="store_true", help="count the moves without making them")
+    args = parser.parse_args(argv)
+    report = migrate_storage(args.target, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+    return 1 if any(r["conflicts"] for r in report.values()) else 0
+
+
 # --- START: Directory Sync Logic ---
 
 # --- Image Sync ---
 DATA_DIR = Path(DB_PATH).parent
-PROCESSED_LOG = DATA_DIR / "processed_images.log"
+PROCESSED_LOG = DATA_DIR / "processed_images.log"  # legacy; imported into sync_state once
 IMG_NAME_RE = re.compile(r"^(\d+)\s+(.+?)\s+ME\s+-\s+[0-3]\.(?:jpe?g|png)$", re.IGNORECASE)
 image_sync_lock = Lock()
 
 # --- JSON Sync ---
-PROCESSED_JSON_LOG = DATA_DIR / "processed_json.log"
+PROCESSED_JSON_LOG = DATA_DIR / "processed_json.log"  # legacy; imported into sync_state once
 json_sync_lock = Lock()
 
+# --- Sync State Store ---
+SYNC_STATE_TABLE = "sync_state"
+SYNC_MAX_ATTEMPTS = 5  # failed files are retried this many times, then reported as stuck
+# Legacy JSON log mtimes were float seconds; treat sub-microsecond drift as unchanged
+SYNC_MTIME_TOLERANCE_NS = 1_000
+
+
+class SyncStateStore:
+    """
+    Per-file sync state kept in the SQLite DB (replaces the processed_*.log files).
+
+    One row per (kind, filename) with mtime, size, status ('ok', 'skipped',
+    'error'), attempts and last error. Rows are only written for files that
+    changed, in the same transaction as the sdi_dataset upserts they describe.
+    A per-process copy of the table avoids re-reading it on every pass; it is
+    updated only after the matching commit succeeded.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._path = None
+        self._cache = {}  # kind -> {filename: (mtime_ns, size, status, attempts)}
+
+    def _ensure(self, conn):
+        cur = conn.cursor()
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {_quote(SYNC_STATE_TABLE)} (
+                kind TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                mtime_ns INTEGER,
+                size INTEGER,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (kind, filename)
+            )
+        """)
+        cur.execute(
+            f'CREATE INDEX IF NOT EXISTS "idx_{SYNC_STATE_TABLE}_status" '
+            f'ON {_quote(SYNC_STATE_TABLE)} (status, kind)'
+        )
+        conn.commit()
+
+    def _import_legacy_logs(self, conn):
+        """One-time import of processed_images.log / processed_json.log."""
+        cur = conn.cursor()
+        legacy = []
+        if PROCESSED_LOG.exists():
+            with open(PROCESSED_LOG, 'r', encoding='utf-8') as f:
+                legacy += [("image", line.strip(), None) for line in f if line.strip()]
+        if PROCESSED_JSON_LOG.exists():
+            with open(PROCESSED_JSON_LOG, 'r', encoding='utf-8') as f:
+                try:
+                    legacy += [("json", name, int(mtime * 1e9)) for name, mtime in json.load(f).items()]
+                except (json.JSONDecodeError, AttributeError, TypeError):
+                    print("SYNC-STATE-WARN: Could not read processed_json.log, skipping import.")
+        if not legacy:
+            return
+        now = time.time()
+        cur.executemany(
+            f'INSERT OR IGNORE INTO {_quote(SYNC_STATE_TABLE)} '
+            f'(kind, filename, mtime_ns, size, status, attempts, updated_at) VALUES (?, ?, ?, NULL, ?, 0, ?)',
+            [(kind, name, mtime_ns, "ok", now) for kind, name, mtime_ns in legacy],
+        )
+        conn.commit()
+        print(f"SYNC-STATE: Imported {len(legacy)} entries from legacy log files.")
+
+    def load(self, kind: str) -> dict:
+        """filename -> (mtime_ns, size, status, attempts) for one kind."""
+        with self._lock:
+            if self._path != DB_PATH:
+                self._path = DB_PATH
+                self._cache = {}
+            if kind not in self._cache:
+                with _db_connection() as conn:
+                    self._ensure(conn)
+                    cur = conn.cursor()
+                    cur.execute(f"SELECT COUNT(*) FROM {_quote(SYNC_STATE_TABLE)}")
+                    if cur.fetchone()[0] == 0:
+                        self._import_legacy_logs(conn)
+                    cur.execute(
+                        f"SELECT filename, mtime_ns, size, status, attempts FROM {_quote(SYNC_STATE_TABLE)} WHERE kind = ?",
+                        (kind,),
+                    )
+                    self._cache[kind] = {r[0]: tuple(r[1:]) for r in cur.fetchall()}
+            return self._cache[kind]
+
+    def needs_sync(self, kind: str, filename: str, mtime_ns=None, size=None) -> bool:
+        """
+        True for new files, files whose mtime/size changed (when given), and
+        failed files that still have retry attempts left.
+        """
+        state = self.load(kind).get(filename)
+        if state is None:
+            return True
+        old_mtime_ns, old_size, status, attempts = state
+        if status == "error" and attempts < SYNC_MAX_ATTEMPTS:
+            return True
+        if mtime_ns is not None:
+            if old_mtime_ns is None or abs(mtime_ns - old_mtime_ns) > SYNC_MTIME_TOLERANCE_NS:
+                return True
+            if old_size is not None and size is not None and size != old_size:
+                return True
+        return False
 
+    def write(self, cur, kind: str, entries):
+        """
+        Upsert state rows inside the caller's transaction.
+        `entries` are (filename, mtime_ns, size, status, error) tuples.
+        Returns the cache updates to pass to remember() once committed.
+        """
+        known = self.load(kind)
+        now = time.time()
+        rows = []
+        updates = []
+        for filename, mtime_ns, size, status, error in entries:
+            previous = known.get(filename)
+            if status != "error":
+                attempts = 0
+            elif previous and previous[2] == "error" and previous[0] == mtime_ns:
+                attempts = previous[3] + 1
+            else:
+                attempts = 1
+            rows.append((kind, filename, mtime_ns, size, status, attempts, error, now))
+            updates.append((filename, (mtime_ns, size, status, attempts)))
+            METRICS.inc("apr_sync_files_total", kind=kind, status=status)
+        cur.executemany(f"""
+            INSERT INTO {_quote(SYNC_STATE_TABLE)}
+                (kind, filename, mtime_ns, size, status, attempts, last_error, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(kind, filename) DO UPDATE SET
+                mtime_ns = excluded.mtime_ns,
+                size = excluded.size,
+                status = excluded.status,
+                attempts = excluded.attempts,
+                last_error = excluded.last_error,
+                updated_at = excluded.updated_at
+        """, rows)
+        return kind, updates
+
+    def remember(self, pending):
+        """Apply cache updates returned by write() after their commit."""
+        for kind, updates in pending:
+            cache = self.load(kind)
+            with self._lock:
+                cache.update(updates)
+
+    def record(self, kind: str, entries):
+        """write() + commit + remember() in a transaction of its own."""
+        if not entries:
+            return
+        with _db_connection() as conn:
+            pending = self.write(conn.cursor(), kind, entries)
+            conn.commit()
+        self.remember([pending])
+
+    def query(self, status=None, kind=None, limit: int = 100):
+        """Rows for /sync_state; status='stuck' means errors out of retry attempts."""
+        where, params = [], []
+        if status == "stuck":
+            where.append("status = 'error' AND attempts >= ?")
+            params.append(SYNC_MAX_ATTEMPTS)
+        elif status:
+            where.append("status = ?")
+            params.append(status)
+        if kind:
+            where.append("kind = ?")
+            params.append(kind)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with _db_connection() as conn:
+            self._ensure(conn)
+            cur = conn.cursor()
+            cur.row_factory = sqlite3.Row
+            cur.execute(
+                f"SELECT kind, status, COUNT(*) AS n FROM {_quote(SYNC_STATE_TABLE)} GROUP BY kind, status"
+            )
+            counts = {}
+            for r in cur.fetchall():
+                counts.setdefault(r["kind"], {})[r["status"]] = r["n"]
+            cur.execute(
+                f"SELECT kind, filename, mtime_ns, size, status, attempts, last_error, updated_at "
+                f"FROM {_quote(SYNC_STATE_TABLE)} {clause} ORDER BY updated_at DESC LIMIT ?",
+                params + [limit],
+            )
+            return counts, [dict(r) for r in cur.fetchall()]
+
+
+SYNC_STATE = SyncStateStore()
+
+
+def _sync_to_db(kind: str, batch: dict, update_existing: bool, tag: str):
+    """
+    Bulk-upsert one sync pass and record per-file state in the same transactions.
+    `batch` maps (qr, building) -> ([(filename, mtime_ns, size), ...], structured).
+    """
+    if not batch:
+        return
+    pending = []
+
+    def record_chunk(cur, written_keys, failures):
+        entries = [
+            (filename, mtime_ns, size, "ok", None)
+            for key in written_keys for filename, mtime_ns, size in batch[key][0]
+        ]
+        for key, error in failures:
+            for filename, mtime_ns, size in batch[key][0]:
+                print(f"SYNC-{tag}-ERROR: DB upsert failed for {filename}: {error}")
+                entries.append((filename, mtime_ns, size, "error", error))
+        pending.append(SYNC_STATE.write(cur, kind, entries))
+
+    try:
+        _db_bulk_upsert_sdi_dataset(
+            ((qr, building, structured) for (qr, building), (_files, structured) in batch.items()),
+            update_existing=update_existing,
+            before_commit=record_chunk,
+        )
+        SYNC_STATE.remember(pending)
+    except Exception as e:
+        print(f"SYNC-{tag}-ERROR: Bulk DB upsert failed: {e}")
+        SYNC_STATE.remember(pending)  # chunks committed before the failure
+        done = {filename for _kind, updates in pending for filename, _state in updates}
+        SYNC_STATE.record(kind, [
+            (filename, mtime_ns, size, "error", str(e))
+            for files, _structured in batch.values()
+            for filename, mtime_ns, size in files if filename not in done
+        ])
+
+
+@timed_phase("sync_images")
 def sync_image_directory_to_db():
     """
     Scans IMG_DIR for new image files and upserts placeholder entries into sdi_dataset.
@@ -93,43 +656,47 @@ def sync_image_directory_to_db():
         return
 
     try:
-        if not os.path.isdir(IMG_DIR):
+        if not os.path.isdir(IMG_DIR) or not _connectable():
             return
 
-        processed_files = set()
-        if PROCESSED_LOG.exists():
-            with open(PROCESSED_LOG, 'r', encoding='utf-8') as f:
-                processed_files = {line.strip() for line in f if line.strip()}
-
-        current_files = {f for f in os.listdir(IMG_DIR) if f.lower().endswith(tuple(VALID_IMAGE_EXTS))}
-        new_files = sorted(list(current_files - processed_files))
+        # Image names are immutable captures: only new (or failed) names need work
+        new_entries = sorted(
+            (e for e in IMG_LAYOUT.scan(IMG_DIR)
+             if e.name.lower().endswith(tuple(VALID_IMAGE_EXTS)) and SYNC_STATE.needs_sync("image", e.name)),
+            key=lambda e: e.name,
+        )
 
-        if not new_files:
+        if not new_entries:
             return
 
-        print(f"SYNC-IMG: Found {len(new_files)} new image(s).")
-        successfully_processed = []
-        for filename in new_files:
-            match = IMG_NAME_RE.match(filename)
+        print(f"SYNC-IMG: Found {len(new_entries)} new image(s).")
+        IMAGE_INDEX.invalidate()
+        skipped = []
+        batch = {}
+        for entry in new_entries:
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            match = IMG_NAME_RE.match(entry.name)
             if not match:
-                successfully_processed.append(filename)
+                skipped.append((entry.name, st.st_mtime_ns, st.st_size, "skipped", None))
                 continue
 
             qr, building = match.groups()
-            try:
-                _db_upsert_sdi_dataset(qr=qr.strip(), building=building.strip(), structured={})
-                successfully_processed.append(filename)
-            except Exception as e:
-                print(f"SYNC-IMG-ERROR: DB upsert failed for {filename}: {e}")
+            files, _structured = batch.get((qr.strip(), building.strip()), ([], {}))
+            batch[(qr.strip(), building.strip())] = (files + [(entry.name, st.st_mtime_ns, st.st_size)], {})
+
+        SYNC_STATE.record("image", skipped)
+        # Placeholders only: never blank out a row the JSON sync already filled in
+        _sync_to_db("image", batch, update_existing=False, tag="IMG")
 
-        if successfully_processed:
-            with open(PROCESSED_LOG, 'a', encoding='utf-8') as f:
-                for filename in successfully_processed:
-                    f.write(f"{filename}\n")
+        pregenerate_renditions(f for files, _structured in batch.values() for f, _m, _s in files)
     finally:
         image_sync_lock.release()
 
 
+@timed_phase("sync_json")
 def sync_json_directory_to_db():
     """
     Scans JSON_DIR for new or modified JSON files and upserts their structured data
@@ -139,35 +706,30 @@ def sync_json_directory_to_db():
         return
 
     try:
-        if not os.path.isdir(JSON_DIR):
+        if not os.path.isdir(JSON_DIR) or not _connectable():
             return
 
-        # Load the log of processed JSON files and their modification times
-        processed_files = {}
-        if PROCESSED_JSON_LOG.exists():
-            with open(PROCESSED_JSON_LOG, 'r', encoding='utf-8') as f:
-                try:
-                    processed_files = json.load(f)
-                except json.JSONDecodeError:
-                    print("SYNC-JSON-WARN: Could not read processed_json.log, starting fresh.")
-
-        files_to_process = {}
-        for filename in os.listdir(JSON_DIR):
-            if not _is_me_filename(filename):
+        files_to_process = []
+        paths = {}
+        for entry in JSON_LAYOUT.scan(JSON_DIR):
+            if not _is_me_filename(entry.name):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
                 continue
-            
-            filepath = os.path.join(JSON_DIR, filename)
-            current_mtime = os.path.getmtime(filepath)
-            
             # Process if the file is new or has been modified since last sync
-            if filename not in processed_files or current_mtime > processed_files[filename]:
-                files_to_process[filename] = current_mtime
+            if SYNC_STATE.needs_sync("json", entry.name, st.st_mtime_ns, st.st_size):
+                files_to_process.append((entry.name, st.st_mtime_ns, st.st_size))
+                paths[entry.name] = entry.path
 
         if not files_to_process:
             return
 
         print(f"SYNC-JSON: Found {len(files_to_process)} new/updated JSON file(s).")
-        for filename, mtime in files_to_process.items():
+        batch = {}  # (qr, building) -> ([(filename, mtime_ns, size), ...], structured)
+        other = []  # state rows that don't go through the upsert
+        for filename, mtime_ns, size in files_to_process:
             m = JSON_NAME_RE.match(filename)
             if not m:
                 continue
@@ -175,52 +737,433 @@ def sync_json_directory_to_db():
             qr, _, building = m.groups()
             
             try:
-                with open(os.path.join(JSON_DIR, filename), 'r', encoding='utf-8') as f:
+                with open(paths[filename], 'r', encoding='utf-8') as f:
                     content = json.load(f)
                 
                 structured_data = content.get("structured_data", {})
                 if isinstance(structured_data, dict):
                     print(f"   -> Syncing data from {filename}")
-                    _db_upsert_sdi_dataset(qr=qr, building=building, structured=structured_data)
-                    processed_files[filename] = mtime # Update log on success
+                    files, _previous = batch.get((qr, building), ([], None))
+                    batch[(qr, building)] = (files + [(filename, mtime_ns, size)], structured_data)
                 else:
                     print(f"SYNC-JSON-WARN: 'structured_data' in {filename} is not a dict.")
-                    processed_files[filename] = mtime # Log as processed to avoid re-checking
+                    other.append((filename, mtime_ns, size, "skipped", "'structured_data' is not a dict"))
 
             except Exception as e:
                 print(f"SYNC-JSON-ERROR: Failed to process {filename}: {e}")
-        
-        # Write the updated log back to the file
-        with open(PROCESSED_JSON_LOG, 'w', encoding='utf-8') as f:
-            json.dump(processed_files, f, indent=2)
+                other.append((filename, mtime_ns, size, "error", str(e)))
+
+        SYNC_STATE.record("json", other)
+        _sync_to_db("json", batch, update_existing=True, tag="JSON")
 
     finally:
         json_sync_lock.release()
 
 
+# --- Background Sync Worker ---
+# Set SYNC_WORKER_ENABLED=0 when the worker runs as its own process (`sync-worker` CLI)
+SYNC_WORKER_ENABLED = os.environ.get("SYNC_WORKER_ENABLED", "1") != "0"
+SYNC_DEBOUNCE_SECONDS = 1.0      # quiet period that ends a burst of new files
+SYNC_MAX_DELAY_SECONDS = 10.0    # never hold a burst longer than this
+SYNC_POLL_SECONDS = 5.0          # polling fallback: how often to stat the directories
+SYNC_FULL_RESCAN_SECONDS = 60.0  # periodic pass to catch in-place rewrites
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+INOTIFY_EVENT  = struct.Struct("iIII")
+
+
+class _InotifyWatcher:
+    """Linux inotify via ctypes; raises OSError where it is not available."""
+    mode = "inotify"
+
+    def __init__(self, paths):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux-only")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # IN_CREATE: a new shard directory in a sharded layout
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_MODIFY | IN_CREATE
+        for path in paths:
+            if libc.inotify_add_watch(self._fd, os.fsencode(path), mask) < 0:
+                os.close(self._fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout: float) -> int:
+        """Block up to timeout seconds; return the number of events drained."""
+        ready, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        if not ready:
+            return 0
+        events = 0
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(buf):
+                _wd, _mask, _cookie, name_len = INOTIFY_EVENT.unpack_from(buf, offset)
+                offset += INOTIFY_EVENT.size + name_len
+                events += 1
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingWatcher:
+    """Fallback: stat the watched directories every SYNC_POLL_SECONDS."""
+    mode = "polling"
+
+    def __init__(self, paths):
+        self._paths = list(paths)
+        self._mtimes = self._snapshot()
+
+    def _snapshot(self):
+        mtimes = []
+        for path in self._paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def wait(self, timeout: float) -> int:
+        deadline = time.monotonic() + max(timeout, 0)
+        while True:
+            current = self._snapshot()
+            if current != self._mtimes:
+                self._mtimes = current
+                return 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return 0
+            time.sleep(min(SYNC_POLL_SECONDS, remaining))
+
+    def close(self):
+        pass
+
+
+class SyncWorker:
+    """
+    Runs the image/JSON directory syncs off the request path.
+
+    Change notifications come from inotify where available, otherwise from
+    polling the directory mtimes. Bursts of events are coalesced into a single
+    pass once the directories have been quiet for SYNC_DEBOUNCE_SECONDS, and a
+    full pass runs every SYNC_FULL_RESCAN_SECONDS regardless.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stop = Event()
+        self._wakeup = Event()
+        self._thread = None
+        self._mode = None
+        self._runs = 0
+        self._events = 0
+        self._pending_since = None
+        self._last_started = None
+        self._last_finished = None
+        self._last_duration = None
+        self._last_lag = None
+        self._last_error = None
+
+    def ensure_started(self):
+        """Start the worker thread once per process (cheap to call per request)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self.run_forever, name="sync-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        """True while this process's worker thread keeps the indexes fresh."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @staticmethod
+    def _watched_dirs():
+        """IMG_DIR and JSON_DIR plus their shard directories."""
+        return IMG_LAYOUT.directories(IMG_DIR) + JSON_LAYOUT.directories(JSON_DIR)
+
+    def _make_watcher(self, paths):
+        try:
+            return _InotifyWatcher(paths)
+        except OSError as e:
+            print(f"SYNC-WORKER: inotify unavailable ({e}); falling back to polling.")
+            return _PollingWatcher(paths)
+
+    def _wait_for_changes(self, watcher, timeout: float) -> int:
+        # Cap each wait so stop() is noticed promptly
+        deadline = time.monotonic() + timeout
+        while not self._stop.is_set():
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                return 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return 0
+            events = watcher.wait(min(remaining, SYNC_POLL_SECONDS))
+            if events:
+                return events
+        return 0
+
+    def run_forever(self):
+        watched = self._watched_dirs()
+        watcher = self._make_watcher(watched)
+        self._mode = watcher.mode
+        last_pass = 0.0
+        try:
+            while not self._stop.is_set():
+                timeout = SYNC_FULL_RESCAN_SECONDS - (time.monotonic() - last_pass)
+                events = self._wait_for_changes(watcher, timeout) if last_pass else 0
+                if events:
+                    with self._lock:
+                        self._events += events
+                        if self._pending_since is None:
+                            self._pending_since = time.time()
+                    # Coalesce the rest of the burst
+                    burst_deadline = time.monotonic() + SYNC_MAX_DELAY_SECONDS
+                    while time.monotonic() < burst_deadline and not self._stop.is_set():
+                        more = watcher.wait(SYNC_DEBOUNCE_SECONDS)
+                        if not more:
+                            break
+                        with self._lock:
+                            self._events += more
+                if self._stop.is_set():
+                    break
+                self.run_once()
+                last_pass = time.monotonic()
+                if self._watched_dirs() != watched:
+                    # Shards were added or removed: watch the new set
+                    watcher.close()
+                    watched = self._watched_dirs()
+                    watcher = self._make_watcher(watched)
+                    self._mode = watcher.mode
+        finally:
+            watcher.close()
+
+    def run_once(self):
+        """One sync pass: DB sync of both directories, then refresh the in-memory indexes."""
+        started = time.time()
+        with self._lock:
+            pending_since = self._pending_since
+            self._pending_since = None
+            self._last_started = started
+        error = None
+        try:
+            sync_image_directory_to_db()
+            sync_json_directory_to_db()
+            photo_changes = IMAGE_INDEX.refresh()
+            ASSET_INDEX.refresh()
+            if photo_changes:
+                ASSET_INDEX.apply_photo_changes(photo_changes)
+            if ASSET_INDEX.snapshot_due():
+                ASSET_INDEX.save_snapshot()
+        except Exception as e:
+            error = str(e)
+            print(f"SYNC-WORKER-ERROR: {e}")
+        finished = time.time()
+        with self._lock:
+            self._runs += 1
+            self._last_finished = finished
+            self._last_duration = finished - started
+            self._last_lag = (finished - pending_since) if pending_since else None
+            self._last_error = error
+
+    def status(self) -> dict:
+        with self._lock:
+            now = time.time()
+            return {
+                "enabled": SYNC_WORKER_ENABLED,
+                "running": self.running,
+                "mode": self._mode,
+                "runs": self._runs,
+                "events": self._events,
+                "pending": self._pending_since is not None,
+                "lag_seconds": (now - self._pending_since) if self._pending_since else 0.0,
+                "last_lag_seconds": self._last_lag,
+                "last_started": self._last_started,
+                "last_finished": self._last_finished,
+                "last_duration_seconds": self._last_duration,
+                "last_status": None if self._last_finished is None else ("error" if self._last_error else "ok"),
+                "last_error": self._last_error,
+            }
+
+
+SYNC_WORKER = SyncWorker()
+
+
 @app.before_request
 def before_request_handler():
     """
-    Runs before each request. First, syncs new images for placeholder records,
-    then syncs new/updated JSONs for detailed data.
+    Runs before each request. Makes sure the index warm-up and the background
+    sync worker are running; requests never wait on a sync pass themselves.
     """
+    if METRICS_ENABLED:
+        _TIMING.phases = {}
+        _TIMING.statements = 0
+        _TIMING.started = time.perf_counter()
     if request.endpoint in ('static', 'serve_image'):
         return
-    sync_image_directory_to_db()
-    sync_json_directory_to_db()
+    INDEX_WARMUP.ensure_started()
+    if SYNC_WORKER_ENABLED:
+        SYNC_WORKER.ensure_started()
+
+
+@app.after_request
+def after_request_metrics(response):
+    """Request latency metrics plus a Server-Timing header with the phase breakdown."""
+    if not METRICS_ENABLED:
+        return response
+    phases = getattr(_TIMING, "phases", None)
+    if phases is None:
+        return response
+    elapsed = time.perf_counter() - _TIMING.started
+    _TIMING.phases = None
+    endpoint = request.endpoint or "unmatched"
+    METRICS.observe("apr_request_duration_seconds", elapsed, endpoint=endpoint, method=request.method)
+    METRICS.inc("apr_requests_total", endpoint=endpoint, status=response.status_code)
+    parts = []
+    for name, (seconds, calls) in phases.items():
+        desc = f"{_TIMING.statements} statements" if name == "db" else (f"{calls} calls" if calls > 1 else "")
+        parts.append(f'{name};dur={seconds * 1000:.2f}' + (f';desc="{desc}"' if desc else ""))
+    parts.append(f"total;dur={elapsed * 1000:.2f}")
+    response.headers["Server-Timing"] = ", ".join(parts)
+    return response
+
+
+@app.route("/sync_status")
+def sync_status():
+    return jsonify(SYNC_WORKER.status())
 
 # --- END: Directory Sync Logic ---
 
 
+# --- Image Index ---
+# Exact-name pattern find_image() used to probe for: "<QR> <Building> ME - <seq><ext>"
+IMG_INDEX_RE = re.compile(r"^(\d+) (.+) ME - (\d+)(\.[^.]+)$")
+# Directory mtimes this recent may still change within the same timestamp tick
+IMG_INDEX_MTIME_SLACK_NS = 2_000_000_000
+
+
+class ImageIndex:
+    """
+    Snapshot of IMG_DIR mapping (qr, building, seq) -> filename, built from
+    os.scandir passes. Each directory (the top level and, in a sharded
+    layout, every shard) is re-listed only when its mtime changes or after
+    invalidate() (called by the image sync), so a new photo costs one
+    listing of its own shard.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._dirs = {}   # directory -> (mtime_ns or None, {(qr, building, seq): (rank, filename)})
+        self._built = False
+        self._files = {}  # (qr, building, seq) -> filename
+
+    def invalidate(self):
+        with self._lock:
+            self._dirs = {d: (None, found) for d, (_mtime, found) in self._dirs.items()}
+
+    @staticmethod
+    def _scan_dir(directory: str, shard: str) -> dict:
+        found = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                m = IMG_INDEX_RE.match(entry.name)
+                if not m or (shard and IMG_LAYOUT.shard(entry.name) != shard):
+                    continue
+                qr, building, seq, ext = m.groups()
+                if ext not in VALID_IMAGE_EXTS:
+                    continue
+                # Keep find_image's extension precedence
+                key = (qr, building, seq)
+                rank = VALID_IMAGE_EXTS.index(ext)
+                if key not in found or rank < found[key][0]:
+                    found[key] = (rank, entry.name)
+        return found
+
+    @timed_phase("images")
+    def refresh(self):
+        """
+        Re-list the directories of IMG_DIR that changed.
+        Returns the set of (qr, building) keys whose photos changed.
+        """
+        with self._lock:
+            directories = IMG_LAYOUT.directories(IMG_DIR) if os.path.isdir(IMG_DIR) else []
+            now = time.time_ns()
+            dirs = {}
+            changed_keys = set()
+            for directory in directories:
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                cached = self._dirs.get(directory)
+                if self._built and cached and cached[0] == mtime_ns:
+                    dirs[directory] = cached
+                    continue
+                shard = "" if directory == IMG_DIR else os.path.basename(directory)
+                try:
+                    found = self._scan_dir(directory, shard)
+                except OSError:
+                    continue
+                old = cached[1] if cached else {}
+                changed_keys.update(k for k in old.keys() | found.keys() if old.get(k) != found.get(k))
+                # A very recent mtime may hide another write in the same tick; rescan next time.
+                fresh = now - mtime_ns < IMG_INDEX_MTIME_SLACK_NS
+                dirs[directory] = (None if fresh else mtime_ns, found)
+            for directory, (_mtime, found) in self._dirs.items():
+                if directory not in dirs:
+                    changed_keys.update(found)  # directory removed
+            self._dirs = dirs
+            self._built = True
+
+            changed = set()
+            for key in changed_keys:
+                # Best extension across directories (a photo may sit in its shard and the top level)
+                best = min((found[key] for _mtime, found in dirs.values() if key in found), default=None)
+                filename = best[1] if best else None
+                if self._files.get(key) != filename:
+                    if filename is None:
+                        del self._files[key]
+                    else:
+                        self._files[key] = filename
+                    changed.add((key[0], key[1]))
+            return changed
+
+    def lookup(self, qr: str, building: str, seq: str):
+        if not self._built:
+            self.refresh()
+        return self._files.get((qr, building, seq))
+
+    def __len__(self):
+        return len(self._files)
+
+
+IMAGE_INDEX = ImageIndex()
+
+
 def find_image(qr: str, building: str, seq_tag: str):
-    """Find image by pattern: '<QR> <Building> ME - <seq>.<ext>'."""
+    """Find image by pattern: '<QR> <Building> ME - <seq>.<ext>' in the image index."""
     seq = seq_tag.replace('-', '').strip()
-    base = f"{qr} {building} ME - {seq}"
-    for ext in VALID_IMAGE_EXTS:
-        candidate = os.path.join(IMG_DIR, base + ext)
-        if os.path.exists(candidate):
-            return os.path.basename(candidate)
-    return None
+    return IMAGE_INDEX.lookup(qr, building, seq)
 
 
 @lru_cache(maxsize=1)
@@ -229,30 +1172,734 @@ def _connectable():
     return os.path.exists(DB_PATH)
 
 
-def _fetch_column_values(table: str, col: str):
-    """Return sorted unique non-empty strings for dropdowns."""
-    if not _connectable():
-        return []
+# --- Image Renditions (thumbnail / preview cache) ---
+RENDITION_DIR = Path(os.environ.get("RENDITION_DIR", DATA_DIR / "image_cache"))
+# Longest edge in pixels per rendition name; "full" (no size) is always the original
+RENDITION_SIZES = {"thumb": 240, "preview": 1600}
+RENDITION_FORMAT = os.environ.get("RENDITION_FORMAT", "WEBP").upper()  # WEBP or JPEG
+RENDITION_QUALITY = 80
+RENDITION_WORKERS = 2
+RENDITION_PREGENERATE = os.environ.get("RENDITION_PREGENERATE", "1") != "0"  # warm the cache on image sync
+RENDITION_MIMETYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+_rendition_pool = None
+_rendition_pool_lock = Lock()
+_rendition_builds = {}  # target path -> Lock held while that rendition is being built
+_rendition_builds_lock = Lock()
+
+
+def _rendition_path(filename: str, size: str, st) -> Path:
+    """Cache path keyed by source name, rendition size and source mtime/size."""
+    digest = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+    ext = "webp" if RENDITION_FORMAT == "WEBP" else "jpg"
+    return RENDITION_DIR / f"{digest}-{size}-{st.st_mtime_ns}-{st.st_size}.{ext}"
+
+
+def get_rendition(filename: str, size: str):
+    """
+    Path of the cached `size` rendition of IMG_DIR/filename, generating it on
+    first use. Returns None when renditions are unavailable (no Pillow, unknown
+    size, missing or unreadable source) so callers can fall back to the original.
+    """
+    if Image is None or size not in RENDITION_SIZES:
+        return None
+    src = IMG_LAYOUT.locate(IMG_DIR, filename)
+    if src is None:
+        return None
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            query = f'SELECT "{col}" AS val FROM "{table}" WHERE "{col}" IS NOT NULL'
-            cur.execute(query)
-            vals = [str(r["val"]).strip() for r in cur.fetchall() if str(r["val"]).strip()]
-            uniq = sorted(set(vals), key=lambda s: (s.lower(), s))
-            return uniq
+        st = os.stat(src)
+    except OSError:
+        return None
+
+    target = _rendition_path(filename, size, st)
+    if target.exists():
+        METRICS.inc("apr_cache_requests_total", cache="rendition", result="hit")
+        return target
+    METRICS.inc("apr_cache_requests_total", cache="rendition", result="miss")
+
+    # Single-flight: one thread builds each rendition, the others wait for it
+    with _rendition_builds_lock:
+        build = _rendition_builds.get(target)
+        owner = build is None
+        if owner:
+            build = _rendition_builds[target] = Lock()
+            build.acquire()
+    if not owner:
+        with build:
+            pass
+        return target if target.exists() else None
+    try:
+        if target.exists():  # finished between the check above and taking over
+            return target
+        return _build_rendition(src, filename, size, target)
+    finally:
+        with _rendition_builds_lock:
+            del _rendition_builds[target]
+        build.release()
+
+
+def _build_rendition(src: str, filename: str, size: str, target: Path):
+    """Write the `size` rendition of src to target; returns target, or None on failure."""
+    edge = RENDITION_SIZES[size]
+    tmp = None
+    try:
+        RENDITION_DIR.mkdir(parents=True, exist_ok=True)
+        with Image.open(src) as img:
+            img.draft("RGB", (edge, edge))  # JPEG: decode at reduced scale
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((edge, edge))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            # Unique per build: concurrent builders must not share a temp file
+            with tempfile.NamedTemporaryFile(dir=RENDITION_DIR, prefix=f"{target.name}.",
+                                             suffix=".tmp", delete=False) as f:
+                tmp = f.name
+                img.save(f, RENDITION_FORMAT, quality=RENDITION_QUALITY)
+        os.replace(tmp, target)
     except Exception as e:
-        print(f"?? DB fetch failed for {table}.{col}: {e}")
-        return []
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        if target.exists():
+            return target  # another build of the same rendition got there first
+        print(f"?? Rendition {size} failed for {filename}: {e}")
+        return None
+
+    # Drop renditions of older versions of the same source
+    stem = target.name.split("-", 2)[:2]
+    for stale in RENDITION_DIR.glob(f"{stem[0]}-{stem[1]}-*"):
+        if stale != target and not stale.name.endswith(".tmp"):
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+    return target
+
+
+def pregenerate_renditions(filenames):
+    """Queue every rendition size of `filenames` on the background pool."""
+    global _rendition_pool
+    if Image is None or not RENDITION_PREGENERATE:
+        return
+    with _rendition_pool_lock:
+        if _rendition_pool is None:
+            _rendition_pool = ThreadPoolExecutor(max_workers=RENDITION_WORKERS, thread_name_prefix="rendition")
+    for filename in filenames:
+        for size in RENDITION_SIZES:
+            _rendition_pool.submit(get_rendition, filename, size)
+
+
+# --- SQLite connection layer ---
+DB_POOL_SIZE = 8                 # idle connections kept per process
+DB_BUSY_TIMEOUT_MS = 5000
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")  # use DELETE if the DB lives on NFS
+DB_PRAGMAS = (
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    f"PRAGMA journal_mode={DB_JOURNAL_MODE}",
+    "PRAGMA synchronous=NORMAL",   # safe with WAL; fsync at checkpoints only
+    "PRAGMA cache_size=-16000",    # ~16 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    """
+    Small LIFO pool of tuned SQLite connections shared by all threads.
+
+    Connections are opened with check_same_thread=False and handed to one
+    borrower at a time. When every pooled connection is busy an overflow
+    connection is opened instead of blocking, and closed on release.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._lock = Lock()
+        self._idle = []
+        self._path = None
+        self._stats = {"opened": 0, "closed": 0, "reused": 0, "overflow": 0, "in_use": 0, "peak_in_use": 0}
+
+    def _open(self, path: str):
+        conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        ensure_schema(conn)
+        if METRICS_ENABLED:
+            conn.set_trace_callback(_count_statement)
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._path != DB_PATH:
+                # DB_PATH was repointed; don't hand out connections to the old file
+                self._close_idle()
+                self._path = DB_PATH
+            conn = self._idle.pop() if self._idle else None
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+            if conn is not None:
+                self._stats["reused"] += 1
+                return conn, self._path
+            self._stats["opened"] += 1
+            path = self._path
+        return self._open(path), path
+
+    def _release(self, conn, path: str):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if path == self._path and len(self._idle) < self._size:
+                self._idle.append(conn)
+                return
+            self._stats["overflow"] += 1
+            self._stats["closed"] += 1
+        conn.close()
+
+    def _close_idle(self):
+        while self._idle:
+            self._idle.pop().close()
+            self._stats["closed"] += 1
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; any transaction left open is rolled back on return."""
+        conn, path = self._acquire()
+        try:
+            with timed("db"):
+                yield conn
+        finally:
+            self._release(conn, path)
+
+    def close_all(self):
+        with self._lock:
+            self._close_idle()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "idle": len(self._idle), "size": self._size}
+
+
+DB_POOL = ConnectionPool(DB_POOL_SIZE)
+
+
+def _db_connection():
+    return DB_POOL.connection()
+
+
+# --- Schema bootstrap ---
+# (index name, table, columns, unique). The tables belong to the capture app and
+# the export job; only the indexes the lookups and upserts here depend on are added.
+SCHEMA_INDEXES = [
+    ("ux_sdi_dataset_qr_building", SDI_TABLE, SDI_KEY_COLS, True),
+    ("ux_qr_codes_id", QR_CODES_TABLE, [QR_CODE_ID_COL], True),
+    ("idx_sdi_print_out_qr", SDI_PRINT_OUT_TABLE, [SDI_PRINT_OUT_QR_COL], False),
+]
+# Lookups that must be answered through an index (checked with EXPLAIN QUERY PLAN)
+SCHEMA_KEY_LOOKUPS = {
+    "sdi_dataset by key": (SDI_TABLE, SDI_KEY_COLS),
+    "QR_codes by id": (QR_CODES_TABLE, [QR_CODE_ID_COL]),
+    "sdi_print_out by QR": (SDI_PRINT_OUT_TABLE, [SDI_PRINT_OUT_QR_COL]),
+}
+
+# (db path, index name) -> settled state: "ok", or "duplicates" until dedupe-keys runs
+_SCHEMA_DONE = {}
+_SCHEMA_LOCK = Lock()
+
+
+def _table_indexes(conn, table: str) -> list:
+    """[(columns tuple, unique)] for every index on `table`, primary key included."""
+    indexes = []
+    for row in conn.execute(f"PRAGMA index_list({_quote(table)})").fetchall():
+        name, unique = row[1], bool(row[2])
+        cols = tuple(r[2] for r in conn.execute(f"PRAGMA index_info({_quote(name)})").fetchall())
+        indexes.append((cols, unique))
+    pk = [r for r in conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall() if r[5]]
+    if pk:
+        # INTEGER PRIMARY KEY aliases the rowid and has no index_list entry
+        indexes.append((tuple(r[1] for r in sorted(pk, key=lambda r: r[5])), True))
+    return indexes
+
+
+def _has_index(conn, table: str, cols, unique: bool = False) -> bool:
+    """Is there an index led by `cols` (exactly `cols` when it must be unique)?"""
+    cols = tuple(cols)
+    for ix_cols, ix_unique in _table_indexes(conn, table):
+        if unique and ix_unique and ix_cols == cols:
+            return True
+        if not unique and ix_cols[:len(cols)] == cols:
+            return True
+    return False
+
+
+def _duplicate_rows(conn, table: str, key_cols: list) -> int:
+    """Rows sharing their key with a newer row (what _dedupe_rows would delete)."""
+    keys = ", ".join(_quote(c) for c in key_cols)
+    return conn.execute(
+        f"SELECT COALESCE(SUM(n - 1), 0) FROM "
+        f"(SELECT COUNT(*) AS n FROM {_quote(table)} GROUP BY {keys} HAVING n > 1)"
+    ).fetchone()[0]
+
+
+def _dedupe_rows(conn, table: str, key_cols: list) -> int:
+    """Keep the newest row (highest rowid) per key so a unique index can be built."""
+    keys = ", ".join(_quote(c) for c in key_cols)
+    cur = conn.execute(
+        f"DELETE FROM {_quote(table)} WHERE rowid NOT IN "
+        f"(SELECT MAX(rowid) FROM {_quote(table)} GROUP BY {keys})"
+    )
+    return cur.rowcount
+
+
+def _create_index(conn, name: str, table: str, cols, unique: bool):
+    conn.execute(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {_quote(name)} "
+        f"ON {_quote(table)} ({', '.join(_quote(c) for c in cols)})"
+    )
+
+
+def ensure_schema(conn) -> dict:
+    """
+    Create the SCHEMA_INDEXES that are missing on DB_PATH, then the full-text
+    search index over sdi_dataset; returns {index name: state}.
+    An equivalent existing index (see _has_index) counts as present.
+    Data is never changed here: a unique index whose key has duplicate rows
+    is left out (state "duplicates"), upserts keep the UPDATE-then-INSERT
+    path, and the `dedupe-keys` command resolves it on request.
+    Tables that do not exist yet are skipped and retried on the next call.
+    """
+    states = {}
+    with _SCHEMA_LOCK:
+        for name, table, cols, unique in SCHEMA_INDEXES:
+            if (DB_PATH, name) in _SCHEMA_DONE:
+                states[name] = _SCHEMA_DONE[(DB_PATH, name)]
+                continue
+            try:
+                if not conn.execute(f"PRAGMA table_info({_quote(table)})").fetchone():
+                    states[name] = "no table"
+                    continue
+                duplicates = 0
+                if _has_index(conn, table, cols, unique):
+                    states[name] = "ok"
+                elif unique:
+                    duplicates = _duplicate_rows(conn, table, cols)
+                if duplicates:
+                    states[name] = "duplicates"
+                    print(f"?? {table} has {duplicates} rows with a duplicate {cols} key; not creating {name} "
+                          f"(see `python asset_plate_reviewer.py dedupe-keys`)")
+                elif name not in states:
+                    with conn:
+                        _create_index(conn, name, table, cols, unique)
+                    states[name] = "created"
+                    print(f"?? Created index {name} on {table}")
+                _SCHEMA_DONE[(DB_PATH, name)] = "duplicates" if duplicates else "ok"
+            except sqlite3.Error as e:
+                print(f"?? Could not ensure index {name}: {e}")
+                states[name] = f"error: {e}"
+        if (DB_PATH, SEARCH_TABLE) in _SCHEMA_DONE:
+            states[SEARCH_TABLE] = _SCHEMA_DONE[(DB_PATH, SEARCH_TABLE)]
+        else:
+            try:
+                states[SEARCH_TABLE] = _ensure_search_index(conn)
+                if states[SEARCH_TABLE] != "no table":
+                    _SCHEMA_DONE[(DB_PATH, SEARCH_TABLE)] = "ok"
+            except sqlite3.Error as e:
+                # e.g. an SQLite build without FTS5: search answers 503, the rest works
+                print(f"?? Could not ensure search index: {e}")
+                states[SEARCH_TABLE] = f"error: {e}"
+                _SCHEMA_DONE[(DB_PATH, SEARCH_TABLE)] = "error"
+    return states
+
+
+def dedupe_keys(apply: bool = False) -> dict:
+    """
+    Report duplicate keys behind each unique SCHEMA_INDEXES entry; with
+    apply=True keep the newest row (highest rowid) per key and create the
+    missing unique index, one transaction per table.
+    Returns {index name: {"table", "key", "duplicates", "removed", "index"}}.
+    """
+    report = {}
+    with _db_connection() as conn:
+        for name, table, cols, unique in SCHEMA_INDEXES:
+            if not unique or not conn.execute(f"PRAGMA table_info({_quote(table)})").fetchone():
+                continue
+            indexed = _has_index(conn, table, cols, unique=True)
+            entry = {"table": table, "key": cols, "duplicates": _duplicate_rows(conn, table, cols),
+                     "removed": 0, "index": "ok" if indexed else "missing"}
+            if apply and not indexed:
+                with conn:
+                    entry["removed"] = _dedupe_rows(conn, table, cols)
+                    _create_index(conn, name, table, cols, unique=True)
+                entry["index"] = "created"
+                with _SCHEMA_LOCK:
+                    _SCHEMA_DONE[(DB_PATH, name)] = "ok"
+            report[name] = entry
+    return report
+
+
+def dedupe_keys_cli(argv) -> int:
+    """python asset_plate_reviewer.py dedupe-keys [--apply]"""
+    parser = argparse.ArgumentParser(
+        prog="asset_plate_reviewer.py dedupe-keys",
+        description="Find rows that share an upsert key (e.g. sdi_dataset QR Code + Building). "
+                    "Without --apply nothing is changed; with it the newest row per key is kept "
+                    "and the unique index the single-statement upsert needs is created.",
+    )
+    parser.add_argument("--apply", action="store_true", help="delete the older duplicates and create the indexes")
+    args = parser.parse_args(argv)
+    print(json.dumps(dedupe_keys(apply=args.apply), indent=2))
+    return 0
+
+
+# --- Full-text search index (FTS5 over sdi_dataset) ---
+SEARCH_TABLE = "sdi_search"
+SEARCH_KEYS_TABLE = "sdi_search_keys"  # (QR Code, Building) -> stable FTS rowid
+SEARCH_COLS = ["Manufacturer", "Model", "Serial", "UBC Tag"]
+# Serials and tags keep their separators ("SN-1042/B" is one token)
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '-_./'"
+# Triggers older versions installed on sdi_dataset (dropped by _ensure_search_index)
+_LEGACY_SEARCH_TRIGGERS = [SEARCH_TABLE + "_ai", SEARCH_TABLE + "_ad", SEARCH_TABLE + "_au"]
+
+
+def _ensure_search_index(conn) -> str:
+    """
+    FTS5 table over SEARCH_COLS holding its own copy of the text, plus the
+    fts5vocab tables used for fuzzy matching and the duplicate-serial report.
+    Rows are keyed by sdi_dataset's (QR Code, Building) through
+    SEARCH_KEYS_TABLE, whose INTEGER PRIMARY KEY gives each asset a rowid
+    that VACUUM cannot renumber. Nothing is installed on sdi_dataset itself:
+    this app's upserts re-index what they write (_index_search_rows), and
+    `search-index rebuild` catches up with changes made by other writers.
+    An index left by older versions (external content + triggers) is replaced.
+    Filled from sdi_dataset when first created.
+    """
+    if not _db_get_columns(conn, SDI_TABLE):
+        return "no table"
+    master = dict(conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE name IN (?, ?, ?, ?)",
+        [SEARCH_TABLE] + _LEGACY_SEARCH_TRIGGERS,
+    ).fetchall())
+    legacy = "content=" in (master.get(SEARCH_TABLE) or "")
+    created = legacy or SEARCH_TABLE not in master
+    fts = _quote(SEARCH_TABLE)
+    with conn:
+        for trigger in _LEGACY_SEARCH_TRIGGERS:
+            if trigger in master:
+                conn.execute(f"DROP TRIGGER {_quote(trigger)}")
+        if legacy:
+            for name in (SEARCH_TABLE + "_vocab", SEARCH_TABLE + "_vocab_col", SEARCH_TABLE):
+                conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {_quote(SEARCH_KEYS_TABLE)} '
+                     f'(id INTEGER PRIMARY KEY, "QR Code" TEXT NOT NULL, "Building" TEXT NOT NULL, '
+                     f'UNIQUE ("QR Code", "Building"))')
+        if created:
+            tokenize = SEARCH_TOKENIZER.replace("'", "''")
+            conn.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(_quote(c) for c in SEARCH_COLS)}, "
+                f"tokenize='{tokenize}', prefix='2 3')"
+            )
+        conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {_quote(SEARCH_TABLE + '_vocab')} "
+                     f"USING fts5vocab({fts}, 'row')")
+        conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {_quote(SEARCH_TABLE + '_vocab_col')} "
+                     f"USING fts5vocab({fts}, 'col')")
+    if created:
+        count = rebuild_search_index(conn)
+        print(f"?? {'Replaced' if legacy else 'Created'} search index {SEARCH_TABLE} ({count} rows)")
+        return "created"
+    return "ok"
+
+
+def _search_key(row: dict) -> tuple:
+    return tuple(str(row.get(k, "") or "") for k in SDI_KEY_COLS)
+
+
+def _write_search_rows(cur, rows, replace: bool = True):
+    """
+    (Re-)index sdi_dataset-shaped rows (dicts with SDI_KEY_COLS and SEARCH_COLS);
+    replace=False leaves keys that are already indexed alone.
+    """
+    keys, fts = _quote(SEARCH_KEYS_TABLE), _quote(SEARCH_TABLE)
+    names = ", ".join(_quote(c) for c in SEARCH_COLS)
+    for row in rows:
+        key = _search_key(row)
+        cur.execute(f'INSERT INTO {keys} ("QR Code", "Building") VALUES (?, ?) '
+                    f'ON CONFLICT ("QR Code", "Building") DO NOTHING', key)
+        if not replace and cur.rowcount == 0:
+            continue
+        rowid = cur.execute(f'SELECT id FROM {keys} WHERE "QR Code" = ? AND "Building" = ?', key).fetchone()[0]
+        cur.execute(f"DELETE FROM {fts} WHERE rowid = ?", (rowid,))
+        cur.execute(
+            f"INSERT INTO {fts} (rowid, {names}) VALUES (?, {', '.join('?' for _ in SEARCH_COLS)})",
+            [rowid] + [str(row.get(c, "") or "") for c in SEARCH_COLS],
+        )
+
+
+def _index_search_rows(cur, rows, replace: bool = True):
+    """
+    Re-index rows this app just wrote to sdi_dataset, inside the same
+    transaction. Skipped when the search index is unavailable (e.g. no FTS5);
+    a failure is logged and left for `search-index rebuild`, never failing
+    the data write itself.
+    """
+    if not rows or _SCHEMA_DONE.get((DB_PATH, SEARCH_TABLE)) != "ok":
+        return
+    cur.execute("SAVEPOINT search_index")
+    try:
+        _write_search_rows(cur, rows, replace)
+    except sqlite3.Error as e:
+        cur.execute("ROLLBACK TO search_index")
+        print(f"?? Search index update failed ({e}); run `python asset_plate_reviewer.py search-index rebuild`")
+    cur.execute("RELEASE search_index")
+
+
+def _search_index_hook(rows, then=None, replace: bool = True):
+    """
+    before_commit for _db_bulk_upsert_rows on sdi_dataset: re-index the rows
+    of `rows` that were written, then call `then` (the caller's own hook).
+    Pass replace=False with update_existing=False, whose existing rows keep their text.
+    """
+    by_key = {_search_key(row): row for row in rows}
+
+    def before_commit(cur, written_keys, failures):
+        _index_search_rows(cur, [by_key[key] for key in written_keys if key in by_key], replace)
+        if then is not None:
+            then(cur, written_keys, failures)
+    return before_commit
+
+
+def _sdi_search_rows(conn) -> dict:
+    """{(QR Code, Building): row} from sdi_dataset, newest row winning on duplicate keys."""
+    available = _db_get_columns(conn, SDI_TABLE)
+    cols = SDI_KEY_COLS + [c for c in SEARCH_COLS if c in available]
+    cur = conn.execute(f"SELECT {', '.join(_quote(c) for c in cols)} FROM {_quote(SDI_TABLE)} ORDER BY rowid")
+    rows = {}
+    for values in cur:
+        row = dict(zip(cols, values))
+        rows[_search_key(row)] = row
+    return rows
+
+
+def rebuild_search_index(conn) -> int:
+    """Re-index every sdi_dataset row from scratch in one transaction; returns the row count."""
+    rows = _sdi_search_rows(conn)
+    with conn:
+        conn.execute(f"DELETE FROM {_quote(SEARCH_TABLE)}")
+        conn.execute(f"DELETE FROM {_quote(SEARCH_KEYS_TABLE)}")
+        _write_search_rows(conn.cursor(), rows.values())
+    return len(rows)
+
+
+def check_search_index(conn, sample: int = 10) -> dict:
+    """
+    Compare the search index with sdi_dataset: rows not indexed ("missing"),
+    index entries whose row is gone ("stale") and rows indexed with other
+    text ("different"), each with up to `sample` keys, plus FTS5's own
+    integrity-check. "ok" is True when all of them are clean.
+    """
+    rows = _sdi_search_rows(conn)
+    indexed = {}
+    cur = conn.execute(
+        f'SELECT k."QR Code", k."Building", {", ".join("s." + _quote(c) for c in SEARCH_COLS)} '
+        f"FROM {_quote(SEARCH_KEYS_TABLE)} AS k JOIN {_quote(SEARCH_TABLE)} AS s ON s.rowid = k.id"
+    )
+    for values in cur:
+        indexed[tuple(values[:2])] = tuple(values[2:])
+    missing = [key for key in rows if key not in indexed]
+    stale = [key for key in indexed if key not in rows]
+    different = [
+        key for key, row in rows.items()
+        if key in indexed and indexed[key] != tuple(str(row.get(c, "") or "") for c in SEARCH_COLS)
+    ]
+    try:
+        conn.execute(f"INSERT INTO {_quote(SEARCH_TABLE)} ({_quote(SEARCH_TABLE)}) VALUES ('integrity-check')")
+        fts_integrity = "ok"
+    except sqlite3.Error as e:
+        fts_integrity = str(e)
+    report = {"rows": len(rows), "indexed": len(indexed), "fts_integrity": fts_integrity}
+    for label, keys in (("missing", missing), ("stale", stale), ("different", different)):
+        report[label] = len(keys)
+        report[f"{label}_sample"] = [list(key) for key in keys[:sample]]
+    report["ok"] = not (missing or stale or different) and fts_integrity == "ok"
+    return report
+
+
+def search_index_cli(argv) -> int:
+    """python asset_plate_reviewer.py search-index {rebuild|check}"""
+    parser = argparse.ArgumentParser(
+        prog="asset_plate_reviewer.py search-index",
+        description="Maintain the sdi_search full-text index. `check` compares it with sdi_dataset "
+                    "(exit status 1 when they differ); `rebuild` re-indexes every row, e.g. after "
+                    "other programs changed sdi_dataset.",
+    )
+    parser.add_argument("action", choices=["rebuild", "check"])
+    args = parser.parse_args(argv)
+    if not _connectable():
+        print(f"!! Database not found: {DB_PATH}", file=sys.stderr)
+        return 1
+    with _db_connection() as conn:
+        state = ensure_schema(conn).get(SEARCH_TABLE)
+        if state not in ("ok", "created"):
+            print(f"!! Search index unavailable: {state}", file=sys.stderr)
+            return 1
+        if args.action == "rebuild":
+            print(json.dumps({"rebuilt": rebuild_search_index(conn)}))
+            return 0
+        report = check_search_index(conn)
+    print(json.dumps(report, indent=2))
+    return 0 if report["ok"] else 1
+
+
+def explain_key_lookups(conn) -> dict:
+    """{lookup: EXPLAIN QUERY PLAN detail} for SCHEMA_KEY_LOOKUPS, None when the table is missing."""
+    plans = {}
+    for label, (table, cols) in SCHEMA_KEY_LOOKUPS.items():
+        where = " AND ".join(f"{_quote(c)} = ?" for c in cols)
+        try:
+            rows = conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT 1 FROM {_quote(table)} WHERE {where}", [""] * len(cols)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            plans[label] = None
+            continue
+        plans[label] = "; ".join(str(r[-1]) for r in rows)
+    return plans
+
+
+def verify_query_plans(conn) -> list:
+    """Key lookups that would scan their table instead of using an index (empty when all good)."""
+    return [
+        f"{label}: {plan}" for label, plan in explain_key_lookups(conn).items()
+        if plan is not None and " USING " not in plan
+    ]
+
+
+def _fetch_column_values(conn, table: str, col: str):
+    """Return sorted unique non-empty strings for dropdowns."""
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    query = f'SELECT "{col}" AS val FROM "{table}" WHERE "{col}" IS NOT NULL'
+    cur.execute(query)
+    vals = [str(r["val"]).strip() for r in cur.fetchall() if str(r["val"]).strip()]
+    uniq = sorted(set(vals), key=lambda s: (s.lower(), s))
+    return uniq
+
+
+# --- Reference data (dropdown options) ---
+REFERENCE_LISTS = {
+    "asset_group": (ASSET_GROUP_TABLE, ASSET_GROUP_COL),
+    "attribute": (ATTRIBUTE_TABLE, ATTRIBUTE_COL),
+}
+
+
+class DataVersionWatch:
+    """
+    Dedicated connection whose PRAGMA data_version changes whenever another
+    connection (pool, sync worker, other processes) commits. Used by the
+    in-memory caches of small tables to reload only after a commit.
+    Not thread-safe: callers hold their own lock.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._path = None
+        self.seen = None  # data_version the caller last loaded at
+
+    def connection(self):
+        if self._conn is None or self._path != DB_PATH:
+            if self._conn is not None:
+                self._conn.close()
+            self._path = DB_PATH
+            self._conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+            self.seen = None
+        return self._conn
+
+    def current(self):
+        """data_version now, or None when nothing changed since `seen`."""
+        version = self.connection().execute("PRAGMA data_version").fetchone()[0]
+        return None if version == self.seen else version
+
+
+class ReferenceCache:
+    """
+    In-memory copy of the dropdown option lists.
+
+    The lists are re-read only after some other connection committed (see
+    DataVersionWatch); the ETag is a hash of the values, so it stays stable
+    across unrelated commits. Each list also keeps its <option> HTML
+    rendered once.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._watch = DataVersionWatch()
+        self._lists = {}  # name -> {"values": [...], "etag": str, "html": str}
+        self._stats = {"checks": 0, "reloads": 0, "changes": 0}
+
+    def _refresh(self):
+        """Re-read the lists if the database changed; caller holds self._lock."""
+        self._stats["checks"] += 1
+        if not _connectable():
+            self._lists = {}
+            return
+        version = self._watch.current()
+        if version is None:
+            return
+        lists = {}
+        for name, (table, col) in REFERENCE_LISTS.items():
+            values = _fetch_column_values(self._watch.connection(), table, col)
+            old = self._lists.get(name)
+            if old is not None and old["values"] == values:
+                lists[name] = old
+                continue
+            self._stats["changes"] += 1
+            lists[name] = {
+                "values": values,
+                "etag": hashlib.sha1("\n".join(values).encode("utf-8")).hexdigest()[:16],
+                "html": "".join(f'<option value="{escape(v)}">{escape(v)}</option>' for v in values),
+            }
+        self._stats["reloads"] += 1
+        self._lists = lists
+        self._watch.seen = version
+
+    def get(self, name: str):
+        """{"values", "etag", "html"} for one list, or None if unavailable."""
+        with self._lock:
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"?? Reference data refresh failed: {e}")
+                self._watch.seen = None  # retry on the next request
+            return self._lists.get(name)
+
+    def values(self, name: str):
+        entry = self.get(name)
+        return list(entry["values"]) if entry else []
+
+    def options_html(self, name: str, selected: str = "") -> Markup:
+        """Pre-rendered <option> list with `selected` marked (blank option first)."""
+        entry = self.get(name)
+        html = entry["html"] if entry else ""
+        if selected:
+            value = escape(selected)
+            html = html.replace(f'<option value="{value}">', f'<option value="{value}" selected>', 1)
+        return Markup('<option value=""></option>' + html)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "data_version": self._watch.seen,
+                    "lists": {name: len(entry["values"]) for name, entry in self._lists.items()}}
+
+
+REFERENCE_CACHE = ReferenceCache()
 
 
 def get_asset_group_options():
-    return _fetch_column_values(ASSET_GROUP_TABLE, ASSET_GROUP_COL)
+    return REFERENCE_CACHE.values("asset_group")
 
 
 def get_attribute_options():
-    return _fetch_column_values(ATTRIBUTE_TABLE, ATTRIBUTE_COL)
+    return REFERENCE_CACHE.values("attribute")
 
 
 def _compute_description(asset_group: str, ubc_tag: str) -> str:
@@ -273,72 +1920,818 @@ def _is_me_filename(filename: str) -> bool:
     return asset_type_mid.upper() == "ME"
 
 
-def load_json_items():
-    """Load ME-only items for the dashboard."""
-    items = []
-    for filename in os.listdir(JSON_DIR):
-        if not filename.endswith(".json") or filename.endswith("_raw_ocr.json"):
-            continue
-        if not _is_me_filename(filename):
-            continue
+def _build_asset_item(doc_id: str, qr: str, building: str, raw: dict):
+    """
+    Build the dashboard dict for one ME JSON document (without photo fields).
+    Returns None when 'structured_data' is not a dict.
+    """
+    data = raw.get("structured_data") or {}
+    if not isinstance(data, dict):
+        return None
+    data = dict(data)
+
+    # Ensure keys
+    data.setdefault("Manufacturer", "")
+    data.setdefault("Model", "")
+    data.setdefault("Serial Number", "")
+    data.setdefault("Year", "")
+    data.setdefault("UBC Tag", "")
+    data.setdefault("Technical Safety BC", "")
+    data.setdefault("Asset Group", "")
+    data.setdefault("Attribute", "")
+    data.setdefault("Diameter", "")
+    data.setdefault("Flagged", "false")
+    data.setdefault("Approved", "")  # blank = False
+
+    # Derived
+    data["Description"] = _compute_description(
+        data.get("Asset Group"),
+        data.get("UBC Tag")
+    )
+
+    return {
+        "doc_id": doc_id,
+        "qr_code": qr,
+        "building": building,
+        "asset_type": "ME",  # enforced by filter
+        "Flagged": data.get("Flagged", "false"),
+        "Approved": data.get("Approved", ""),
+        "Modified": raw.get("modified", False),
+        **data
+    }
+
+
+def _photo_status(qr: str, building: str) -> dict:
+    """Missed Photo fields for one asset, read from the image index."""
+    # Missing photos (-0, -1, -2)
+    missing_tags = [tag for tag in SEQ_CHECK if not find_image(qr, building, tag)]
+    missing_photo = len(missing_tags) > 0
+    friendly_map = {'-0': 'Asset Plate', '-1': 'UBC Tag', '-2': 'Main Picture'}
+    missing_friendly = ", ".join(friendly_map.get(tag, tag) for tag in missing_tags)
+    return {
+        "Missed Photo": "YES" if missing_photo else "NO",
+        "Missing List": missing_friendly,
+        "Photos Summary": f"{3 - len(missing_tags)}/3",
+    }
+
+
+# Flags tracked incrementally by the asset index (membership sets + counters)
+ASSET_FLAGS = {
+    "flagged": lambda item: item.get("Flagged") == "true",
+    "modified": lambda item: bool(item.get("Modified")),
+    "missed": lambda item: item.get("Missed Photo") == "YES",
+    "approved": lambda item: item.get("Approved") == "True",
+}
 
-        m = JSON_NAME_RE.match(filename)
-        if not m:
-            continue
 
-        qr, asset_type_mid, building = m.groups()
-        doc_id = filename[:-5]  # strip ".json"
+class _SortedKeys:
+    """Sorted list of strings with O(1) membership and O(log n) neighbour lookup."""
 
+    def __init__(self):
+        self._keys = []
+        self._set = set()
+
+    def add(self, key: str):
+        if key not in self._set:
+            self._set.add(key)
+            insort(self._keys, key)
+
+    def discard(self, key: str):
+        if key in self._set:
+            self._set.discard(key)
+            del self._keys[bisect_left(self._keys, key)]
+
+    def __contains__(self, key):
+        return key in self._set
+
+    def __len__(self):
+        return len(self._keys)
+
+    def walk(self, key: str, step: int):
+        """
+        Keys after (step=1) or before (step=-1) `key`, nearest first; `key` need
+        not be present. Reads the list in place (no copy of the tail), so the
+        caller must hold the lock that guards add/discard while iterating.
+        """
+        keys = self._keys
+        if step > 0:
+            indices = range(bisect_right(keys, key), len(keys))
+        else:
+            indices = range(bisect_left(keys, key) - 1, -1, -1)
+        for i in indices:
+            yield keys[i]
+
+
+# --- Change feed (row deltas for live dashboards) ---
+CHANGE_FEED_BACKLOG = int(os.environ.get("CHANGE_FEED_BACKLOG", 5000))  # events kept for resume
+CHANGE_FEED_HEARTBEAT = 15.0     # seconds between keep-alive comments on an idle stream
+CHANGE_FEED_MAX_SECONDS = 300.0  # streams end after this; EventSource reconnects with Last-Event-ID
+CHANGE_FEED_RETRY_MS = 2000
+CHANGE_PHOTO_FIELDS = ("Missed Photo", "Missing List", "Photos Summary")
+
+
+def _change_kinds(old, new):
+    """What changed between two index items, as feed event kinds; () when nothing visible did."""
+    if old is None:
+        return () if new is None else ("added",)
+    if new is None:
+        return ("removed",)
+    kinds = []
+    if old.get("Approved") != new.get("Approved"):
+        kinds.append("approved")
+    if old.get("Flagged") != new.get("Flagged"):
+        kinds.append("flagged")
+    if any(old.get(field) != new.get(field) for field in CHANGE_PHOTO_FIELDS):
+        kinds.append("photos")
+    if any(old.get(field) != new.get(field) for field in DASHBOARD_ROW_FIELDS
+           if field not in ("Approved", "Flagged") and field not in CHANGE_PHOTO_FIELDS):
+        kinds.append("edited")
+    return tuple(kinds)
+
+
+class ChangeFeed:
+    """
+    Ring buffer of (seq, doc_id, kinds) published by the asset index. Event ids
+    are "<BOOT_ID>-<seq>", so a client resuming with an id from another process,
+    or one older than the backlog, is told to reset instead of missing changes.
+    Events carry no row data: subscribers read the current row when sending.
+    """
+
+    def __init__(self, backlog: int = CHANGE_FEED_BACKLOG):
+        self._cond = Condition()
+        self._events = deque(maxlen=backlog)
+        self._seq = 0
+        self.clients = 0
+
+    def publish(self, doc_id: str, kinds):
+        if not kinds:
+            return
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, doc_id, kinds))
+            self._cond.notify_all()
+
+    def cursor(self) -> int:
+        with self._cond:
+            return self._seq
+
+    @contextmanager
+    def subscribed(self):
+        """Count an open stream for /metrics while the block runs."""
+        with self._cond:
+            self.clients += 1
         try:
-            with open(os.path.join(JSON_DIR, filename), 'r', encoding='utf-8') as f:
-                raw = json.load(f)
+            yield
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+    def event_id(self, seq: int) -> str:
+        return f"{BOOT_ID}-{seq}"
+
+    def parse(self, event_id):
+        """Sequence number from an event id of this process, else None."""
+        boot, _, seq = (event_id or "").rpartition("-")
+        if boot != BOOT_ID or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def wait(self, after: int, timeout: float):
+        """
+        (events, reset) after sequence `after`, waiting up to `timeout` seconds
+        for one. reset is True when events after `after` were already dropped.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after, timeout)
+            if self._seq <= after:
+                return [], after > self._seq
+            if self._events[0][0] > after + 1:
+                return [], True
+            start = len(self._events) - (self._seq - after)
+            return list(islice(self._events, start, None)), False
+
+
+CHANGE_FEED = ChangeFeed()
+
+
+# Cold loads: parse JSON in worker processes once enough files changed
+INDEX_LOAD_WORKERS = min(8, os.cpu_count() or 1)
+INDEX_PARALLEL_MIN = 500   # below this many files, parse in-process
+INDEX_LOAD_CHUNK = 256     # files per worker task
+# Warm starts: the parsed index is pickled next to the DB (trusted local file)
+INDEX_SNAPSHOT_PATH = Path(os.environ.get("INDEX_SNAPSHOT_PATH", DATA_DIR / "asset_index.pickle"))
+INDEX_SNAPSHOT_FORMAT = 1       # bump when _build_asset_item's output changes
+INDEX_SNAPSHOT_INTERVAL = 300   # min seconds between snapshot saves from the sync worker
+
+
+def _load_asset_chunk(paths):
+    return [AssetIndex._load(path, os.path.basename(path)) for path in paths]
+
+
+def _load_asset_files(paths):
+    """Parse ME JSON files into dashboard items, in a process pool for large batches."""
+    if len(paths) < INDEX_PARALLEL_MIN or INDEX_LOAD_WORKERS < 2:
+        return _load_asset_chunk(paths)
+    chunks = [paths[i:i + INDEX_LOAD_CHUNK] for i in range(0, len(paths), INDEX_LOAD_CHUNK)]
+    try:
+        # spawn, not fork: the server process has live threads and locks
+        with ProcessPoolExecutor(max_workers=INDEX_LOAD_WORKERS,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [item for chunk in pool.map(_load_asset_chunk, chunks) for item in chunk]
+    except Exception as e:
+        print(f"?? Parallel index load failed ({e}); loading serially")
+        return _load_asset_chunk(paths)
 
-            data = raw.get("structured_data") or {}
-            if not isinstance(data, dict):
-                print(f"?? Skipped {filename}: 'structured_data' is not a dict")
-                continue
 
-            # Ensure keys
-            data.setdefault("Manufacturer", "")
-            data.setdefault("Model", "")
-            data.setdefault("Serial Number", "")
-            data.setdefault("Year", "")
-            data.setdefault("UBC Tag", "")
-            data.setdefault("Technical Safety BC", "")
-            data.setdefault("Asset Group", "")
-            data.setdefault("Attribute", "")
-            data.setdefault("Diameter", "")
-            data.setdefault("Flagged", "false")
-            data.setdefault("Approved", "")  # blank = False
-
-            # Derived
-            data["Description"] = _compute_description(
-                data.get("Asset Group"),
-                data.get("UBC Tag")
-            )
+class AssetIndex:
+    """
+    Process-wide cache of parsed ME JSON documents, keyed by doc_id.
+
+    refresh() stats JSON_DIR and re-reads only files whose mtime or size
+    changed since the last pass; entries for deleted files are dropped.
+    Write endpoints call update() so their own edits never need a re-read,
+    and apply_photo_changes() re-derives the photo fields for assets whose
+    images changed in the image index. save_snapshot()/load_snapshot()
+    persist the parsed entries so a restart only re-parses changed files.
+    """
 
-            # Missing photos (-0, -1, -2)
-            missing_tags = [tag for tag in SEQ_CHECK if not find_image(qr, building, tag)]
-            missing_photo = len(missing_tags) > 0
-            friendly_map = {'-0': 'Asset Plate', '-1': 'UBC Tag', '-2': 'Main Picture'}
-            missing_friendly = ", ".join(friendly_map.get(tag, tag) for tag in missing_tags)
-
-            items.append({
-                "doc_id": doc_id,
-                "qr_code": qr,
-                "building": building,
-                "asset_type": "ME",  # enforced by filter
-                "Flagged": data.get("Flagged", "false"),
-                "Approved": data.get("Approved", ""),
-                "Modified": raw.get("modified", False),
-                "Missed Photo": "YES" if missing_photo else "NO",
-                "Missing List": missing_friendly,
-                "Photos Summary": f"{3 - len(missing_tags)}/3",
-                **data
-            })
+    def __init__(self):
+        self._lock = Lock()
+        self._refresh_lock = Lock()  # one refresh() at a time; parsing runs outside self._lock
+        self._save_lock = Lock()  # warm-up, sync worker and atexit may all save a snapshot
+        self._entries = {}  # doc_id -> (mtime_ns, size, item or None)
+        self._by_asset = {}  # (qr, building) -> {doc_id, ...}
+        self._search_text = {}  # doc_id -> lower-cased text for dashboard search
+        # Incrementally maintained aggregates: membership sets per flag and per building,
+        # counters overall and per building / asset group
+        self._members = {flag: set() for flag in ASSET_FLAGS}
+        self._by_building = {}  # building -> {doc_id, ...}
+        self._counts = dict.fromkeys(("total",) + tuple(ASSET_FLAGS), 0)
+        self._building_counts = {}
+        self._group_counts = {}
+        # Review navigation order ("<doc_id>.json", like the old sorted listdir), overall and per flag
+        self._nav = {name: _SortedKeys() for name in ("all",) + tuple(ASSET_FLAGS)}
+        self._loaded = False
+        self.version = 0  # bumped on every change; keys derived caches
+        self._snapshot_version = None
+        self._snapshot_at = 0.0
+
+    @staticmethod
+    def _bump(counts: dict, flags, delta: int):
+        counts["total"] += delta
+        for flag in flags:
+            counts[flag] += delta
+
+    def _account(self, doc_id: str, item: dict, delta: int):
+        """Add (delta=1) or remove (delta=-1) one item from every aggregate."""
+        flags = [flag for flag, test in ASSET_FLAGS.items() if test(item)]
+        building = item["building"]
+        group = item.get("Asset Group") or ""
+
+        for flag in flags:
+            if delta > 0:
+                self._members[flag].add(doc_id)
+                self._nav[flag].add(f"{doc_id}.json")
+            else:
+                self._members[flag].discard(doc_id)
+                self._nav[flag].discard(f"{doc_id}.json")
+        ids = self._by_building.setdefault(building, set())
+        if delta > 0:
+            ids.add(doc_id)
+        else:
+            ids.discard(doc_id)
+            if not ids:
+                del self._by_building[building]
+
+        self._bump(self._counts, flags, delta)
+        for breakdown, key in ((self._building_counts, building), (self._group_counts, group)):
+            counts = breakdown.setdefault(key, dict.fromkeys(("total",) + tuple(ASSET_FLAGS), 0))
+            self._bump(counts, flags, delta)
+            if counts["total"] == 0:
+                del breakdown[key]
+
+    def _set(self, doc_id: str, mtime_ns: int, size: int, item):
+        if item is not None:
+            item.update(_photo_status(item["qr_code"], item["building"]))
+            self._account(doc_id, item, 1)
+            self._by_asset.setdefault((item["qr_code"], item["building"]), set()).add(doc_id)
+            self._search_text[doc_id] = "\x1f".join(
+                str(item.get(field, "") or "") for field in DASHBOARD_SEARCH_FIELDS
+            ).lower()
+        self._nav["all"].add(f"{doc_id}.json")
+        self._entries[doc_id] = (mtime_ns, size, item)
+        self.version += 1
+
+    def _changed(self, doc_id: str, old, new):
+        # The first load is not news: subscribers only hear about later changes
+        if self._loaded:
+            CHANGE_FEED.publish(doc_id, _change_kinds(old, new))
+
+    def _drop(self, doc_id: str):
+        _mtime_ns, _size, item = self._entries.pop(doc_id)
+        self._search_text.pop(doc_id, None)
+        self._nav["all"].discard(f"{doc_id}.json")
+        self.version += 1
+        if item is not None:
+            self._account(doc_id, item, -1)
+            key = (item["qr_code"], item["building"])
+            docs = self._by_asset.get(key, set())
+            docs.discard(doc_id)
+            if not docs:
+                self._by_asset.pop(key, None)
+
+    @timed_phase("json")
+    def refresh(self):
+        """Bring the index in line with JSON_DIR. Returns the number of files re-read."""
+        with self._refresh_lock:
+            if not os.path.isdir(JSON_DIR):
+                with self._lock:
+                    for doc_id in list(self._entries):
+                        self._changed(doc_id, self._entries[doc_id][2], None)
+                        self._drop(doc_id)
+                    self._loaded = True
+                return 0
+
+            current = {}  # doc_id -> (mtime_ns, size)
+            paths = {}
+            for entry in JSON_LAYOUT.scan(JSON_DIR):
+                filename = entry.name
+                if not filename.endswith(".json") or filename.endswith("_raw_ocr.json"):
+                    continue
+                if not _is_me_filename(filename):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                current[filename[:-5]] = (st.st_mtime_ns, st.st_size)  # strip ".json"
+                paths[filename[:-5]] = entry.path
+
+            with self._lock:
+                stale = [doc_id for doc_id, sig in current.items()
+                         if self._entries.get(doc_id, (None, None))[:2] != sig]
+                gone = [doc_id for doc_id in self._entries if doc_id not in current]
+
+            # Parse without holding the index lock, so readers are not blocked
+            items = _load_asset_files([paths[doc_id] for doc_id in stale])
+
+            with self._lock:
+                for doc_id, item in zip(stale, items):
+                    cached = self._entries.get(doc_id)
+                    if cached:
+                        if cached[:2] == current[doc_id]:
+                            continue  # update() recorded this version meanwhile
+                        self._drop(doc_id)
+                    self._set(doc_id, *current[doc_id], item)
+                    self._changed(doc_id, cached and cached[2], item)
+                for doc_id in gone:
+                    if doc_id in self._entries:
+                        self._changed(doc_id, self._entries[doc_id][2], None)
+                        self._drop(doc_id)
+                self._loaded = True
+            return len(stale)
+
+    def save_snapshot(self, path=None) -> bool:
+        """Pickle the parsed entries (with their file signatures) atomically, one save at a time."""
+        path = Path(path or INDEX_SNAPSHOT_PATH)
+        with self._save_lock:
+            with self._lock:
+                version = self.version
+                if version == self._snapshot_version:
+                    return True  # a concurrent save already wrote this version
+                entries = dict(self._entries)  # items are replaced, never mutated, once indexed
+            payload = {
+                "format": INDEX_SNAPSHOT_FORMAT,
+                "json_dir": os.path.abspath(JSON_DIR),
+                "saved_at": time.time(),
+                "entries": entries,
+            }
+            tmp = None
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp",
+                                                 delete=False) as f:
+                    tmp = f.name
+                    pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except Exception as e:
+                print(f"?? Index snapshot save failed: {e}")
+                if tmp is not None:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+                return False
+            with self._lock:
+                self._snapshot_version = version
+                self._snapshot_at = time.time()
+            return True
+
+    def load_snapshot(self, path=None) -> int:
+        """
+        Seed an empty index from a snapshot; refresh() then re-reads only files
+        whose signature changed. Returns the number of entries loaded.
+        """
+        path = Path(path or INDEX_SNAPSHOT_PATH)
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            print(f"?? Ignoring unreadable index snapshot {path}: {e}")
+            return 0
+        if payload.get("format") != INDEX_SNAPSHOT_FORMAT or payload.get("json_dir") != os.path.abspath(JSON_DIR):
+            print(f"?? Ignoring index snapshot {path}: different format or JSON_DIR")
+            return 0
+        with self._lock:
+            if self._entries:
+                return 0  # already populated; the live data wins
+            for doc_id, (mtime_ns, size, item) in payload["entries"].items():
+                self._set(doc_id, mtime_ns, size, item)  # photo fields are re-derived here
+            self._loaded = True
+            self._snapshot_version = self.version
+            self._snapshot_at = time.time()
+            return len(self._entries)
+
+    def snapshot_due(self) -> bool:
+        """True when the index changed since the last snapshot and the interval has passed."""
+        with self._lock:
+            return (self._loaded and self.version != self._snapshot_version
+                    and time.time() - self._snapshot_at >= INDEX_SNAPSHOT_INTERVAL)
+
+    @staticmethod
+    def _load(filepath: str, filename: str):
+        qr, _asset_type_mid, building = JSON_NAME_RE.match(filename).groups()
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            item = _build_asset_item(filename[:-5], qr, building, raw)
+            if item is None:
+                print(f"?? Skipped {filename}: 'structured_data' is not a dict")
+            return item
         except Exception as e:
             print(f"? Error loading {filename}: {e}")
-    return items
+            return None
+
+    def update(self, doc_id: str, json_data: dict):
+        """
+        Replace one entry from an in-memory document. The signature is the file's
+        current one, so a queued (not yet written) edit is not undone by refresh().
+        """
+        filename = f"{doc_id}.json"
+        if not _is_me_filename(filename):
+            return
+        qr, _asset_type_mid, building = JSON_NAME_RE.match(filename).groups()
+        path = JSON_LAYOUT.locate(JSON_DIR, filename)
+        try:
+            st = os.stat(path) if path else None
+        except FileNotFoundError:
+            st = None
+        if st is None:
+            return
+        item = _build_asset_item(doc_id, qr, building, json_data)
+        with self._lock:
+            cached = self._entries.get(doc_id)
+            if cached:
+                self._drop(doc_id)
+            self._set(doc_id, st.st_mtime_ns, st.st_size, item)
+            self._changed(doc_id, cached and cached[2], item)
+
+    def apply_photo_changes(self, assets):
+        """Recompute photo fields for the given (qr, building) keys."""
+        with self._lock:
+            for key in assets:
+                for doc_id in self._by_asset.get(key, ()):
+                    mtime_ns, size, item = self._entries[doc_id]
+                    # Replace rather than mutate: callers may hold the old dict
+                    new_item = {**item, **_photo_status(*key)}
+                    self._account(doc_id, item, -1)
+                    self._account(doc_id, new_item, 1)
+                    self._entries[doc_id] = (mtime_ns, size, new_item)
+                    self.version += 1
+                    self._changed(doc_id, item, new_item)
+
+    def items(self):
+        """Snapshot of the indexed dashboard dicts (shared; treat as read-only)."""
+        with self._lock:
+            return [entry[2] for entry in self._entries.values() if entry[2] is not None]
+
+    def snapshot(self):
+        """(version, items) taken atomically, for caches keyed by version."""
+        with self._lock:
+            return self.version, [entry[2] for entry in self._entries.values() if entry[2] is not None]
+
+    def ensure_loaded(self):
+        """Populate the index on first use; afterwards the sync worker keeps it fresh."""
+        if not self._loaded:
+            refresh_indexes()
+
+    def neighbour(self, doc_id: str, step: int, flags=()):
+        """
+        doc_id of the next (step=1) or previous (step=-1) ME document in filename
+        order, optionally only among documents carrying every flag in `flags`.
+        Returns None at either end, or when doc_id is not indexed.
+        """
+        name = f"{doc_id}.json"
+        with self._lock:
+            if name not in self._nav["all"]:
+                return None
+            # Walk the smallest list; check the remaining flags by set membership
+            lists = sorted((self._nav[flag] for flag in flags), key=len) or [self._nav["all"]]
+            others = [self._members[flag] for flag in flags]
+            for candidate in lists[0].walk(name, step):
+                candidate_id = candidate[:-5]
+                if all(candidate_id in members for members in others):
+                    return candidate_id
+            return None
+
+    def counters(self) -> dict:
+        """Dashboard counters, overall and broken down by building and asset group."""
+        with self._lock:
+            return {
+                "version": self.version,
+                **self._counts,
+                "by_building": {k: dict(v) for k, v in self._building_counts.items()},
+                "by_asset_group": {k: dict(v) for k, v in self._group_counts.items()},
+            }
+
+    def buildings(self):
+        with self._lock:
+            return sorted(self._by_building)
+
+    def select(self, flags=(), building=None, approved=None):
+        """
+        doc_ids matching every flag in `flags` (see ASSET_FLAGS), the building and
+        the approved state ("True"/"False"), from the membership sets.
+        Returns None when nothing is filtered.
+        """
+        with self._lock:
+            sets = [self._members[flag] for flag in flags]
+            if building:
+                sets.append(self._by_building.get(building, set()))
+            if approved == "True":
+                sets.append(self._members["approved"])
+            if sets:
+                sets.sort(key=len)
+                result = sets[0].intersection(*sets[1:])
+            elif approved == "False":
+                result = {doc_id for doc_id, entry in self._entries.items() if entry[2] is not None}
+            else:
+                return None
+            if approved == "False":
+                result -= self._members["approved"]
+            return result
+
+    def matching(self, term: str):
+        """doc_ids whose dashboard text contains `term` (case-insensitive)."""
+        term = term.lower()
+        with self._lock:
+            return {doc_id for doc_id, text in self._search_text.items() if term in text}
+
+    def get(self, doc_id: str):
+        """The indexed dashboard dict for doc_id, or None (shared; treat as read-only)."""
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            return entry[2] if entry else None
+
+    def __contains__(self, doc_id):
+        with self._lock:
+            return doc_id in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+ASSET_INDEX = AssetIndex()
+
+
+@atexit.register
+def _save_index_snapshot_at_exit():
+    if ASSET_INDEX._loaded and ASSET_INDEX.version != ASSET_INDEX._snapshot_version:
+        ASSET_INDEX.save_snapshot()
+
+
+def refresh_indexes():
+    """Bring the image and asset indexes in line with IMG_DIR / JSON_DIR (scans both)."""
+    photo_changes = IMAGE_INDEX.refresh()
+    ASSET_INDEX.refresh()
+    if photo_changes:
+        ASSET_INDEX.apply_photo_changes(photo_changes)
+
+
+def ensure_index_current():
+    """
+    For request handlers: while this process's sync worker runs, it keeps the
+    indexes fresh and requests only read them; without it, refresh inline.
+    """
+    if SYNC_WORKER.running:
+        ASSET_INDEX.ensure_loaded()
+    else:
+        refresh_indexes()
+
+
+def load_json_items():
+    """Load ME-only items for the dashboard."""
+    ensure_index_current()
+    return ASSET_INDEX.items()
+
+
+# --- Warm start ---
+class IndexWarmup:
+    """
+    Background warm-up after a restart: refresh the image index, seed the
+    asset index from its snapshot, revalidate it against JSON_DIR (re-parsing
+    only changed files) and save a fresh snapshot. /ready reports progress,
+    separately from /health, so load balancers can hold traffic until done.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._thread = None
+        self._phase = "cold"
+        self._started = None
+        self._finished = None
+        self._from_snapshot = 0
+        self._reparsed = 0
+        self._error = None
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started = time.time()
+            self._thread = Thread(target=self.run, name="index-warmup", daemon=True)
+            self._thread.start()
+
+    def _enter(self, phase: str):
+        with self._lock:
+            self._phase = phase
+
+    def run(self):
+        try:
+            self._enter("images")
+            IMAGE_INDEX.refresh()
+            self._enter("snapshot")
+            self._from_snapshot = ASSET_INDEX.load_snapshot()
+            self._enter("revalidate")
+            self._reparsed = ASSET_INDEX.refresh()
+            if self._reparsed or not self._from_snapshot:
+                ASSET_INDEX.save_snapshot()
+            self._enter("ready")
+        except Exception as e:
+            print(f"?? Index warm-up failed: {e}")
+            with self._lock:
+                self._error = str(e)
+                self._phase = "failed"
+        finally:
+            with self._lock:
+                self._finished = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self._phase == "ready"
+
+    def status(self) -> dict:
+        with self._lock:
+            end = self._finished or time.time()
+            return {
+                "ready": self._phase == "ready",
+                "phase": self._phase,
+                "seconds": round(end - self._started, 3) if self._started else None,
+                "from_snapshot": self._from_snapshot,
+                "reparsed": self._reparsed,
+                "indexed": len(ASSET_INDEX),
+                "error": self._error,
+            }
+
+
+INDEX_WARMUP = IndexWarmup()
+
+
+# --- HTTP caching & compression ---
+IMAGE_CACHE_MAX_AGE = 86400     # photos and renditions; revalidated by ETag afterwards
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = {"text/html", "text/plain", "text/css", "text/csv", "application/json", "application/javascript"}
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+COMPRESS_CACHE_ENTRIES = 64     # compressed bodies kept, keyed by body digest + encoding
+BOOT_ID = f"{os.getpid():x}-{time.time_ns():x}"  # templates may change across restarts
+
+_COMPRESS_CACHE = OrderedDict()
+_COMPRESS_LOCK = Lock()
+
+
+def _file_etag(st) -> str:
+    """Strong ETag from file identity (mtime + size), no content hashing."""
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _send_cached(path, mimetype=None):
+    """send_file with a file-identity ETag, long-lived Cache-Control, 304s and Range support."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    response = send_file(path, mimetype=mimetype, etag=_file_etag(st), conditional=True,
+                         max_age=IMAGE_CACHE_MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+
+def _accepted_encoding():
+    accept = request.accept_encodings
+    return "br" if brotli is not None and accept["br"] else ("gzip" if accept["gzip"] else None)
+
+
+def _compress_stream(chunks, encoding: str):
+    """Compress a byte-chunk stream, flushing after every chunk so the client sees it at once."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def _buffered(chunks, size: int, flush_at: str = None):
+    """Join small template chunks into ~size-byte blocks; flush early right after `flush_at`."""
+    buf, pending = [], 0
+    for chunk in chunks:
+        buf.append(chunk)
+        pending += len(chunk)
+        marker = flush_at is not None and flush_at in chunk
+        if marker or pending >= size:
+            if marker:
+                flush_at = None
+            yield "".join(buf).encode("utf-8")
+            buf, pending = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def _compressed(body: bytes, encoding: str) -> bytes:
+    key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+    with _COMPRESS_LOCK:
+        data = _COMPRESS_CACHE.get(key)
+        if data is not None:
+            _COMPRESS_CACHE.move_to_end(key)
+    METRICS.inc("apr_cache_requests_total", cache="compress", result="miss" if data is None else "hit")
+    if data is not None:
+        return data
+    if encoding == "br":
+        data = brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    else:
+        data = gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+    with _COMPRESS_LOCK:
+        _COMPRESS_CACHE[key] = data
+        while len(_COMPRESS_CACHE) > COMPRESS_CACHE_ENTRIES:
+            _COMPRESS_CACHE.popitem(last=False)
+    return data
+
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli for large text responses; repeated bodies reuse the cached result."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(_compressed(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)  # the compressed bytes differ from the identity ones
+    return response
+
+
+def _dashboard_etag(*query) -> str:
+    """Weak ETag for the dashboard shell: index version + quick filters + process."""
+    raw = f"{BOOT_ID}:{ASSET_INDEX.version}:{query}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def _render(template: str, **context):
+    """render_template, timed as the "render" phase."""
+    with timed("render"):
+        return render_template(template, **context)
 
 
 # --- Healthcheck (plain text) ---
@@ -347,41 +2740,373 @@ def health():
     return "Asset Plate Reviewer App working!", 200, {"Content-Type": "text/plain; charset=utf-8"}
 
 
+@app.route("/ready")
+def ready():
+    """Readiness: 200 once the index warm-up finished, 503 before."""
+    status = INDEX_WARMUP.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+
+# Dashboard table columns, in the order dashboard.html lays them out
+DASHBOARD_COLUMNS = [
+    "qr_code", "building", "Manufacturer", "Model", "Serial Number", "Year", "UBC Tag",
+    "Technical Safety BC", "Asset Group", "Attribute", "Description",
+    "Approved", "Flagged", "Modified", "Missed Photo", "doc_id",
+]
+DASHBOARD_SEARCH_FIELDS = DASHBOARD_COLUMNS[:11]
+DASHBOARD_ROW_FIELDS = DASHBOARD_COLUMNS + ["Missing List", "Photos Summary"]
+DASHBOARD_MAX_PAGE = 1000
+# "ajax": page shell + /api/assets (default); "stream": whole table streamed in the page (?render=stream)
+DASHBOARD_RENDER_MODE = os.environ.get("DASHBOARD_RENDER_MODE", "ajax")
+DASHBOARD_STREAM_CHUNK = 16 * 1024
+
+# (index version, column) -> items sorted ascending by that column
+_DASHBOARD_SORT_CACHE = {}
+
+
+def _dashboard_sort_key(value):
+    """Numbers sort numerically (QR codes, years), everything else case-insensitively."""
+    if isinstance(value, bool):
+        return (0, int(value), "")
+    text = str(value or "").strip()
+    if text.isdigit():
+        return (0, int(text), "")
+    return (1, 0, text.lower())
+
+
+def _dashboard_sorted(version: int, items: list, column: str):
+    key = (version, column)
+    cached = _DASHBOARD_SORT_CACHE.get(key)
+    METRICS.inc("apr_cache_requests_total", cache="dashboard_sort", result="miss" if cached is None else "hit")
+    if cached is None:
+        # Only the current index version is worth keeping
+        _DASHBOARD_SORT_CACHE.clear()
+        cached = sorted(items, key=lambda item: _dashboard_sort_key(item.get(column)))
+        _DASHBOARD_SORT_CACHE[key] = cached
+    return cached
+
+
+def _dashboard_flags(flagged_filter=None, modified_filter=None, missed_filter=None):
+    """Quick-filter query args -> ASSET_FLAGS names."""
+    flags = []
+    if flagged_filter == "true":
+        flags.append("flagged")
+    if modified_filter == "true":
+        flags.append("modified")
+    if missed_filter == "true":
+        flags.append("missed")
+    return flags
+
+
 @app.route("/")
 def index():
     flagged_filter = request.args.get("flagged")
     modified_filter = request.args.get("modified")
     missed_filter = request.args.get("missed")
 
-    all_data = load_json_items()  # ME-only
+    stream = (request.args.get("render") or DASHBOARD_RENDER_MODE) == "stream"
+
+    # Streamed rows carry the export state, so its changes must change the ETag too
+    # (reading it checks PRAGMA data_version; the set is reloaded only after a commit)
+    exported = EXPORTED_CODES.for_display() if stream else None
+    query = (flagged_filter, modified_filter, missed_filter)
+
+    def not_modified(etag):
+        # Unchanged index + same filters: the page is identical, answer 304 without rendering
+        if not request.if_none_match.contains_weak(etag):
+            return None
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"  # always revalidate
+        return response
+
+    if SYNC_WORKER.running and ASSET_INDEX._loaded:
+        # The worker keeps the index current: revalidate before any other work
+        response = not_modified(_dashboard_etag(*query, stream and EXPORTED_CODES.generation))
+        if response is not None:
+            return response
+
+    # Taken before the refresh: the page's change feed replays rather than misses edits
+    feed_id = CHANGE_FEED.event_id(CHANGE_FEED.cursor())
+    ensure_index_current()
+    etag = _dashboard_etag(*query, stream and EXPORTED_CODES.generation)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    if stream:
+        response = _dashboard_stream(*query, exported, feed_id)
+    else:
+        response = make_response(_dashboard_page(*query, feed_id))
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate
+    return response
+
+
+def _dashboard_context(flagged_filter, modified_filter, missed_filter, feed_id) -> dict:
+    counters = ASSET_INDEX.counters()
+    return dict(
+        title="Asset Review Dashboard - Mechanical",
+        buildings=ASSET_INDEX.buildings(),
+        warn_missing=True,
+        flagged_filter=flagged_filter,
+        modified_filter=modified_filter,
+        missed_filter=missed_filter,
+        count_flagged=counters["flagged"],
+        count_modified=counters["modified"],
+        count_missed=counters["missed"],
+        feed_id=feed_id,
+    )
+
+
+def _dashboard_page(flagged_filter, modified_filter, missed_filter, feed_id):
+    # Rows are fetched page by page from /api/assets
+    return _render("dashboard.html", **_dashboard_context(flagged_filter, modified_filter, missed_filter, feed_id))
+
+
+def _dashboard_stream(flagged_filter, modified_filter, missed_filter, exported, feed_id):
+    """
+    Every row in the page, streamed: the head and filter bar go out first, then
+    <tr> blocks rendered lazily from the index, so memory per request does not
+    grow with the fleet (only the list of item references does).
+    """
+    selected = ASSET_INDEX.select(_dashboard_flags(flagged_filter, modified_filter, missed_filter))
+    items = ASSET_INDEX.items()
+    rows = (item for item in items if selected is None or item["doc_id"] in selected)
+    chunks = stream_template(
+        "dashboard.html",
+        stream_rows=rows,
+        exported=exported,
+        review_base=url_for("review", doc_id="__DOC__")[:-len("__DOC__")],
+        **_dashboard_context(flagged_filter, modified_filter, missed_filter, feed_id),
+    )
+    body = _buffered(chunks, DASHBOARD_STREAM_CHUNK, flush_at="<tbody>")
+    encoding = _accepted_encoding()
+    if encoding:
+        body = _compress_stream(body, encoding)
+    response = app.response_class(body, mimetype="text/html")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/api/counters")
+def api_counters():
+    """Dashboard counters for cheap polling; no directory scan, just the index."""
+    return jsonify(ASSET_INDEX.counters())
+
+
+def _sse(event: str, data, event_id=None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route("/api/changes")
+def api_changes():
+    """
+    Server-Sent Events feed of dashboard row changes. Each "row" event carries
+    the doc's current row (null once removed) and what changed (added, removed,
+    approved, flagged, photos, edited); a "counters" event follows each batch.
+    Resume with Last-Event-ID (or ?last_event_id=); "reset" means events were
+    missed and the client should reload its rows.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    resume = CHANGE_FEED.parse(last_event_id)
+
+    def stream():
+        cursor = resume
+        yield f"retry: {CHANGE_FEED_RETRY_MS}\n\n"
+        if cursor is None:
+            cursor = CHANGE_FEED.cursor()
+            if last_event_id:
+                yield _sse("reset", {}, CHANGE_FEED.event_id(cursor))
+        deadline = time.monotonic() + CHANGE_FEED_MAX_SECONDS
+        with CHANGE_FEED.subscribed():
+            while time.monotonic() < deadline:
+                timeout = min(CHANGE_FEED_HEARTBEAT, deadline - time.monotonic())
+                events, reset = CHANGE_FEED.wait(cursor, max(timeout, 0))
+                if reset:
+                    cursor = CHANGE_FEED.cursor()
+                    yield _sse("reset", {}, CHANGE_FEED.event_id(cursor))
+                    continue
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+                # Several edits to one doc in a batch collapse into its latest row
+                batch = {}
+                for seq, doc_id, kinds in events:
+                    _seq, merged = batch.pop(doc_id, (0, ()))
+                    batch[doc_id] = (seq, merged + tuple(k for k in kinds if k not in merged))
+                exported = EXPORTED_CODES.for_display()
+                parts = []
+                for doc_id, (seq, kinds) in batch.items():
+                    item = ASSET_INDEX.get(doc_id)
+                    row = _dashboard_row(item, exported) if item is not None else None
+                    parts.append(_sse("row", {"doc_id": doc_id, "kinds": kinds, "row": row},
+                                      CHANGE_FEED.event_id(seq)))
+                cursor = events[-1][0]
+                counters = ASSET_INDEX.counters()
+                parts.append(_sse("counters", {key: counters[key] for key in ("version", "total") + tuple(ASSET_FLAGS)}))
+                yield "".join(parts)
+
+    response = app.response_class(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # no proxy buffering of the stream
+    return response
+
+
+@app.route("/api/options/<name>")
+def api_options(name):
+    """Dropdown option list with an ETag, so browsers can revalidate instead of refetching."""
+    if name not in REFERENCE_LISTS:
+        return jsonify({"error": "Unknown list"}), 404
+    entry = REFERENCE_CACHE.get(name) or {"values": [], "etag": "empty"}
+    response = jsonify({"name": name, "values": entry["values"]})
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate; 304 when unchanged
+    return response.make_conditional(request)
+
+
+def _dashboard_row(item: dict, exported) -> dict:
+    """One dashboard table row, as /api/assets and the change feed send it."""
+    row = {field: item.get(field, "") for field in DASHBOARD_ROW_FIELDS}
+    row["Exported"] = str(item.get("qr_code", "")) in exported
+    return row
+
+
+def _datatables_column_search(args, index: int) -> str:
+    value = (args.get(f"columns[{index}][search][value]") or "").strip()
+    # The dashboard sends anchored regexes ("^Building$"); accept both forms
+    if value.startswith("^") and value.endswith("$"):
+        value = re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+@app.route("/api/assets")
+def api_assets():
+    """DataTables server-side processing endpoint for the dashboard table."""
+    args = request.args
+    try:
+        draw = int(args.get("draw", 0))
+        start = max(int(args.get("start", 0)), 0)
+        length = int(args.get("length", 15))
+    except ValueError:
+        return jsonify({"error": "Bad paging parameters"}), 400
+    if length < 0 or length > DASHBOARD_MAX_PAGE:
+        length = DASHBOARD_MAX_PAGE
+
+    # Page draws only read the index: the sync worker (or, without one, the
+    # dashboard page load) keeps it current, so paging never rescans JSON_DIR
+    ASSET_INDEX.ensure_loaded()
+    version, items = ASSET_INDEX.snapshot()
+
+    building_col = DASHBOARD_COLUMNS.index("building")
+    approved_col = DASHBOARD_COLUMNS.index("Approved")
+    wanted = ASSET_INDEX.select(
+        flags=_dashboard_flags(args.get("flagged"), args.get("modified"), args.get("missed")),
+        building=_datatables_column_search(args, building_col),
+        approved=_datatables_column_search(args, approved_col),
+    )
+
+    term = (args.get("search[value]") or "").strip()
+    if term:
+        hits = ASSET_INDEX.matching(term)
+        wanted = hits if wanted is None else wanted & hits
+    filtered = items if wanted is None else [item for item in items if item["doc_id"] in wanted]
+
+    try:
+        order_col = int(args.get("order[0][column]", -1))
+    except ValueError:
+        order_col = -1
+    if 0 <= order_col < len(DASHBOARD_COLUMNS):
+        column = DASHBOARD_COLUMNS[order_col]
+        # Walk the cached full ordering and keep the filtered rows
+        ordered = _dashboard_sorted(version, items, column)
+        if args.get("order[0][dir]") == "desc":
+            ordered = ordered[::-1]
+        filtered = ordered if wanted is None else [item for item in ordered if item["doc_id"] in wanted]
+
+    page = filtered[start:start + length]
+    exported = EXPORTED_CODES.for_display()
+    return jsonify({
+        "draw": draw,
+        "recordsTotal": len(items),
+        "recordsFiltered": len(filtered),
+        "data": [_dashboard_row(item, exported) for item in page],
+    })
+
+
+# --- Review prefetch (next / previous docs in the queue) ---
+REVIEW_PREFETCH_DEPTH = int(os.environ.get("REVIEW_PREFETCH_DEPTH", 3))  # next docs warmed server-side; 0 = off
+REVIEW_QUERY_COOKIE = "dashboard_query"  # set by dashboard.html, so GET /review knows the quick filters
+
+_prefetch_pool = None
+_prefetch_pending = set()
+_prefetch_lock = Lock()
+
+
+def _query_flags(dash_q: str):
+    """ASSET_FLAGS names from a dashboard query string ("?flagged=true&...")."""
+    query = parse_qs(dash_q[1:]) if dash_q.startswith("?") else {}
+    return _dashboard_flags(*(query.get(k, [None])[0] for k in ("flagged", "modified", "missed")))
+
+
+def _review_images(qr: str, building: str) -> dict:
+    """SEQ_SHOW tag -> original / thumb / preview URLs of the asset's photos."""
+    images = {}
+    for tag in SEQ_SHOW:
+        filename = find_image(qr, building, tag)
+        if filename:
+            images[tag] = {
+                "exists": True,
+                "url": url_for('serve_image', filename=filename),
+                "thumb_url": url_for('serve_image', filename=filename, size='thumb'),
+                "preview_url": url_for('serve_image', filename=filename, size='preview'),
+            }
+        else:
+            images[tag] = {"exists": False, "url": None, "thumb_url": None, "preview_url": None}
+    return images
+
 
-    count_flagged = sum(1 for item in all_data if item.get("Flagged") == "true")
-    count_modified = sum(1 for item in all_data if item.get("Modified"))
-    count_missed = sum(1 for item in all_data if item.get("Missed Photo") == "YES")
+def _review_queue(doc_id: str, step: int, depth: int, flags=()):
+    """Up to `depth` doc_ids after (step=1) or before (step=-1) doc_id, in save_next order."""
+    queue = []
+    while len(queue) < depth:
+        doc_id = ASSET_INDEX.neighbour(doc_id, step, flags=flags)
+        if doc_id is None:
+            break
+        queue.append(doc_id)
+    return queue
 
-    data = all_data
-    if flagged_filter == "true" and modified_filter == "true":
-        data = [item for item in data if item.get("Flagged") == "true" and item.get("Modified")]
-    elif flagged_filter == "true":
-        data = [item for item in data if item.get("Flagged") == "true"]
-    elif modified_filter == "true":
-        data = [item for item in data if item.get("Modified")]
 
-    if missed_filter == "true":
-        data = [item for item in data if item.get("Missed Photo") == "YES"]
+def _warm_review(doc_id: str):
+    """Pull one doc's JSON and photo renditions into the caches the review page reads."""
+    try:
+        qr, _asset_type_mid, building = JSON_NAME_RE.match(f"{doc_id}.json").groups()
+        PERSIST_QUEUE.load(doc_id)
+        for tag in SEQ_SHOW:
+            filename = find_image(qr, building, tag)
+            if filename:
+                for size in RENDITION_SIZES:
+                    get_rendition(filename, size)
+    except Exception as e:
+        print(f"?? Review prefetch failed for {doc_id}: {e}")
+    finally:
+        with _prefetch_lock:
+            _prefetch_pending.discard(doc_id)
 
-    return render_template(
-        "dashboard.html",
-        title="Asset Review Dashboard - Mechanical",
-        data=data,
-        warn_missing=True,
-        flagged_filter=flagged_filter,
-        modified_filter=modified_filter,
-        missed_filter=missed_filter,
-        count_flagged=count_flagged,
-        count_modified=count_modified,
-        count_missed=count_missed
-    )
+
+def prefetch_reviews(doc_ids):
+    """Warm `doc_ids` on a background thread, in order; docs already queued are skipped."""
+    global _prefetch_pool
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            _prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="review-prefetch")
+        fresh = [doc_id for doc_id in doc_ids if doc_id not in _prefetch_pending]
+        _prefetch_pending.update(fresh)
+    for doc_id in fresh:
+        _prefetch_pool.submit(_warm_review, doc_id)
 
 
 @app.route("/review/<doc_id>")
@@ -394,13 +3119,11 @@ def review(doc_id):
     if asset_type_mid.upper() != "ME":
         return "Not found", 404
 
-    json_path = os.path.join(JSON_DIR, f"{doc_id}.json")
-    if not os.path.exists(json_path):
+    # Pending write-behind edits win over the file on disk
+    loaded = PERSIST_QUEUE.load(doc_id)
+    if loaded is None:
         return "Not found", 404
 
-    with open(json_path, 'r', encoding='utf-8') as f:
-        loaded = json.load(f)
-
     data = loaded.get("structured_data", {}) or {}
     data.setdefault("Asset Group", "")
     data.setdefault("Attribute", "")
@@ -410,19 +3133,31 @@ def review(doc_id):
     data["Description"] = _compute_description(data.get("Asset Group"), data.get("UBC Tag"))
 
     # Images map
-    images = {}
-    for tag in SEQ_SHOW:
-        filename = find_image(qr, building, tag)
-        if filename:
-            images[tag] = {"exists": True, "url": url_for('serve_image', filename=filename)}
-        else:
-            images[tag] = {"exists": False, "url": None}
-
-    # Dropdown options
-    asset_group_options = get_asset_group_options()
-    attribute_options   = get_attribute_options()
-
-    return render_template(
+    if not SYNC_WORKER.running:
+        photo_changes = IMAGE_INDEX.refresh()
+        if photo_changes:
+            ASSET_INDEX.apply_photo_changes(photo_changes)
+    images = _review_images(qr, building)
+
+    # Where save_next / save_prev lead: warm those docs here, and let the browser
+    # prefetch the adjacent pages and their previews while this one is reviewed
+    ASSET_INDEX.ensure_loaded()
+    flags = _query_flags(unquote(request.cookies.get(REVIEW_QUERY_COOKIE, "")))
+    upcoming = _review_queue(doc_id, 1, max(REVIEW_PREFETCH_DEPTH, 1), flags)
+    previous = _review_queue(doc_id, -1, 1, flags)
+    if REVIEW_PREFETCH_DEPTH > 0:
+        prefetch_reviews(upcoming + previous)
+    prefetch_urls = []
+    for neighbour in upcoming[:1] + previous:
+        n_qr, _n_mid, n_building = JSON_NAME_RE.match(f"{neighbour}.json").groups()
+        prefetch_urls.append(url_for("review", doc_id=neighbour))
+        prefetch_urls += [it["preview_url"] for it in _review_images(n_qr, n_building).values() if it["exists"]]
+
+    # Dropdown options (cached, pre-rendered)
+    asset_group_options = REFERENCE_CACHE.options_html("asset_group", data.get("Asset Group", ""))
+    attribute_options   = REFERENCE_CACHE.options_html("attribute", data.get("Attribute", ""))
+
+    response = make_response(_render(
         "review.html",
         title="Asset Review - Mechanical",
         doc_id=doc_id,
@@ -431,9 +3166,15 @@ def review(doc_id):
         asset_type="ME",
         data=data,
         images=images,
+        prefetch_urls=prefetch_urls,
         asset_group_options=asset_group_options,
         attribute_options=attribute_options
-    )
+    ))
+    # The main image is requested as soon as the headers arrive, before the HTML is parsed
+    main = next((it["preview_url"] for it in images.values() if it["exists"]), None)
+    if main:
+        response.headers["Link"] = f"<{main}>; rel=preload; as=image"
+    return response
 
 
 def _db_upsert_qr_approved(qr_code_id: str, approved_text: str):
@@ -446,32 +3187,83 @@ def _db_upsert_qr_approved(qr_code_id: str, approved_text: str):
         print("?? Database file not found; skipping QR_codes upsert.")
         return
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute(f"""
-            INSERT INTO "{QR_CODES_TABLE}" ("{QR_CODE_ID_COL}", "{QR_APPROVED_COL}")
-            VALUES (?, ?)
-            ON CONFLICT("{QR_CODE_ID_COL}") DO UPDATE SET
-                "{QR_APPROVED_COL}" = excluded."{QR_APPROVED_COL}";
-        """, (qr_code_id, approved_text))
+    with _db_connection() as conn:
+        _db_upsert_qr_approved_rows(conn.cursor(), [(qr_code_id, approved_text)])
         conn.commit()
 
 
+def _db_upsert_qr_approved_rows(cur, rows):
+    """executemany form of _db_upsert_qr_approved; runs in the caller's transaction."""
+    cur.executemany(f"""
+        INSERT INTO "{QR_CODES_TABLE}" ("{QR_CODE_ID_COL}", "{QR_APPROVED_COL}")
+        VALUES (?, ?)
+        ON CONFLICT("{QR_CODE_ID_COL}") DO UPDATE SET
+            "{QR_APPROVED_COL}" = excluded."{QR_APPROVED_COL}";
+    """, rows)
+
+
 def _quote(name: str) -> str:
     return f'"{name}"'.replace('""', '"')  # minimal safety
 
 
+# (db path, table) -> (schema_version, frozenset of column names)
+_COLUMN_CACHE = {}
+_COLUMN_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
 def _db_get_columns(conn, table: str):
+    """Column names of `table`, cached until the database schema_version changes."""
     cur = conn.cursor()
+    schema_version = cur.execute("PRAGMA schema_version").fetchone()[0]
+    key = (DB_PATH, table)
+    cached = _COLUMN_CACHE.get(key)
+    if cached and cached[0] == schema_version:
+        _COLUMN_CACHE_STATS["hits"] += 1
+        return cached[1]
+    _COLUMN_CACHE_STATS["misses"] += 1
     cur.execute(f'PRAGMA table_info({_quote(table)})')
-    return {row[1] for row in cur.fetchall()}  # row[1] = column name
+    cols = frozenset(row[1] for row in cur.fetchall())  # row[1] = column name
+    _COLUMN_CACHE[key] = (schema_version, cols)
+    return cols
+
+
+# (db path, table, key columns) -> (schema_version, unique index on the key?)
+_UPSERT_KEY_CACHE = {}
+
+
+def _db_has_unique_key(conn, table: str, key_cols) -> bool:
+    """Whether ON CONFLICT(key_cols) can be used, cached until schema_version changes."""
+    schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    key = (DB_PATH, table, tuple(key_cols))
+    cached = _UPSERT_KEY_CACHE.get(key)
+    if cached and cached[0] == schema_version:
+        return cached[1]
+    unique = _has_index(conn, table, key_cols, unique=True)
+    _UPSERT_KEY_CACHE[key] = (schema_version, unique)
+    return unique
+
+
+@lru_cache(maxsize=64)
+def _upsert_sql(table: str, cols: tuple, key_cols: tuple, update_existing: bool = True) -> str:
+    """Single-statement INSERT ... ON CONFLICT(key) DO UPDATE (or DO NOTHING)."""
+    set_cols = [c for c in cols if c not in key_cols]
+    if update_existing and set_cols:
+        action = "DO UPDATE SET " + ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in set_cols)
+    else:
+        action = "DO NOTHING"
+    return (
+        f'INSERT INTO {_quote(table)} ({", ".join(_quote(c) for c in cols)}) '
+        f'VALUES ({", ".join("?" for _ in cols)}) '
+        f'ON CONFLICT ({", ".join(_quote(k) for k in key_cols)}) {action}'
+    )
 
 
 def _db_upsert_row(conn, table: str, key_cols: list[str], row: dict):
     """
     Schema-aware upsert:
       - Intersects requested columns with actual table columns
-      - UPDATE by key; if 0 rows, INSERT
+      - One INSERT ... ON CONFLICT DO UPDATE when the key has a unique index
+        (see ensure_schema); otherwise UPDATE by key, and INSERT if 0 rows
     """
     existing_cols = _db_get_columns(conn, table)
     if not existing_cols:
@@ -488,9 +3280,14 @@ def _db_upsert_row(conn, table: str, key_cols: list[str], row: dict):
             else:
                 raise RuntimeError(f'Key column "{key}" not found in table "{table}".')
 
+    cur = conn.cursor()
+    if _db_has_unique_key(conn, table, key_cols):
+        cols = tuple(filtered.keys())
+        cur.execute(_upsert_sql(table, cols, tuple(key_cols)), [filtered[c] for c in cols])
+        return
+
     # Build UPDATE (set all non-key columns that exist)
     set_cols = [c for c in filtered.keys() if c not in key_cols]
-    cur = conn.cursor()
     if set_cols:
         set_clause = ", ".join(f'{_quote(c)} = ?' for c in set_cols)
         where_clause = " AND ".join(f'{_quote(k)} = ?' for k in key_cols)
@@ -510,22 +3307,125 @@ def _db_upsert_row(conn, table: str, key_cols: list[str], row: dict):
         cur.execute(sql_ins, params_ins)
 
 
-def _db_upsert_sdi_dataset(qr: str, building: str, structured: dict):
+def _db_bulk_upsert_rows(conn, table: str, key_cols: list[str], rows, chunk_size: int = None,
+                         update_existing: bool = True, before_commit=None):
     """
-    Upsert into sdi_dataset (match by "QR Code" + "Building").
-    Missing fields => blank string.
-    Uses only columns that actually exist in the table.
-    Approved => '1' when True, '0' otherwise.
+    Schema-aware bulk upsert (same column rules as _db_upsert_row):
+      - Resolves the table's columns once for the whole batch
+      - Rows sharing a key are collapsed (last one wins)
+      - Per chunk: executemany INSERT ... ON CONFLICT when the key has a unique
+        index, else one SELECT for existing keys then executemany UPDATE/INSERT;
+        committed once per chunk
+      - A failing chunk is retried row by row so one bad row doesn't lose the rest
+      - update_existing=False only inserts rows whose key is not present yet
+      - before_commit(cur, written_keys, failures) runs inside each chunk's
+        transaction, so callers can record bookkeeping atomically with it
+    Returns (written, failures) where failures is a list of (key tuple, error text).
     """
-    if not _connectable():
-        print("?? Database file not found; skipping sdi_dataset upsert.")
-        return
+    chunk_size = chunk_size or BULK_UPSERT_CHUNK
+    existing_cols = _db_get_columns(conn, table)
+    if not existing_cols:
+        raise RuntimeError(f'Table "{table}" not found or has no columns.')
+    for key in key_cols:
+        if key not in existing_cols:
+            raise RuntimeError(f'Key column "{key}" not found in table "{table}".')
+
+    # Normalise and de-duplicate by key
+    pending = {}
+    for row in rows:
+        filtered = {k: (row.get(k, "") or "") for k in row.keys() if k in existing_cols}
+        for key in key_cols:
+            filtered.setdefault(key, "")
+        pending[tuple(str(filtered[k]) for k in key_cols)] = filtered
+
+    written = 0
+    failures = []
+    items = list(pending.items())
+    cur = conn.cursor()
+    key_match = f'({", ".join(_quote(k) for k in key_cols)})'
+    key_where = " AND ".join(f'{_quote(k)} = ?' for k in key_cols)
+    upsert = _db_has_unique_key(conn, table, key_cols)
+
+    def write(batch, present):
+        if upsert:
+            layouts = {}
+            for _key, row in batch:
+                layouts.setdefault(tuple(row.keys()), []).append(row)
+            for cols, group in layouts.items():
+                cur.executemany(
+                    _upsert_sql(table, cols, tuple(key_cols), update_existing),
+                    ([r[c] for c in cols] for r in group),
+                )
+            return
+        # Group by column layout so each executemany has a single statement
+        layouts = {}
+        for key, row in batch:
+            layouts.setdefault((tuple(row.keys()), key in present), []).append(row)
+        for (cols, exists), group in layouts.items():
+            if exists:
+                set_cols = [c for c in cols if c not in key_cols]
+                if not update_existing or not set_cols:
+                    continue
+                set_clause = ", ".join(f'{_quote(c)} = ?' for c in set_cols)
+                cur.executemany(
+                    f'UPDATE {_quote(table)} SET {set_clause} WHERE {key_where}',
+                    ([r[c] for c in set_cols] + [r[k] for k in key_cols] for r in group),
+                )
+            else:
+                placeholders = ", ".join("?" for _ in cols)
+                cur.executemany(
+                    f'INSERT INTO {_quote(table)} ({", ".join(_quote(c) for c in cols)}) VALUES ({placeholders})',
+                    ([r[c] for c in cols] for r in group),
+                )
+
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        present = set()
+        if not upsert:
+            row_values = ", ".join(f'({", ".join("?" for _ in key_cols)})' for _ in chunk)
+            cur.execute(
+                f'SELECT {", ".join(_quote(k) for k in key_cols)} FROM {_quote(table)} '
+                f'WHERE {key_match} IN (VALUES {row_values})',
+                [v for key, _row in chunk for v in key],
+            )
+            present = {tuple(str(v) for v in r) for r in cur.fetchall()}
+
+        cur.execute("SAVEPOINT bulk_chunk")
+        chunk_failures = []
+        try:
+            write(chunk, present)
+        except sqlite3.Error:
+            cur.execute("ROLLBACK TO bulk_chunk")
+            for key, row in chunk:
+                cur.execute("SAVEPOINT bulk_row")
+                try:
+                    write([(key, row)], present)
+                    cur.execute("RELEASE bulk_row")
+                except sqlite3.Error as e:
+                    cur.execute("ROLLBACK TO bulk_row")
+                    cur.execute("RELEASE bulk_row")
+                    chunk_failures.append((key, str(e)))
+        failed_keys = {key for key, _error in chunk_failures}
+        written_keys = [key for key, _row in chunk if key not in failed_keys]
+        if before_commit is not None:
+            before_commit(cur, written_keys, chunk_failures)
+        cur.execute("RELEASE bulk_chunk")
+        conn.commit()
+        written += len(written_keys)
+        failures.extend(chunk_failures)
+
+    return written, failures
 
+
+def _sdi_row(qr: str, building: str, structured: dict) -> dict:
+    """
+    Desired sdi_dataset row for one asset.
+    Missing fields => blank string. Approved => '1' when True, '0' otherwise.
+    """
     # Convert structured["Approved"] -> '1' or '0'
     approved_flag = "1" if (structured.get("Approved", "") == "True") else "0"
 
-    # Build desired row dict
-    row = {
+    return {
         "QR Code": qr or "",
         "Building": building or "",
         "Manufacturer": str(structured.get("Manufacturer", "") or ""),
@@ -541,110 +3441,426 @@ def _db_upsert_sdi_dataset(qr: str, building: str, structured: dict):
         "Approved": approved_flag,  # now 1/0
     }
 
-    with sqlite3.connect(DB_PATH) as conn:
-        _db_upsert_row(conn, SDI_TABLE, key_cols=["QR Code", "Building"], row=row)
+
+def _db_upsert_sdi_dataset(qr: str, building: str, structured: dict):
+    """
+    Upsert into sdi_dataset (match by "QR Code" + "Building").
+    Missing fields => blank string.
+    Uses only columns that actually exist in the table.
+    Approved => '1' when True, '0' otherwise.
+    """
+    if not _connectable():
+        print("?? Database file not found; skipping sdi_dataset upsert.")
+        return
+
+    row = _sdi_row(qr, building, structured)
+
+    with _db_connection() as conn:
+        _db_upsert_row(conn, SDI_TABLE, key_cols=SDI_KEY_COLS, row=row)
+        _index_search_rows(conn.cursor(), [row])
         conn.commit()
 
 
+def _db_bulk_upsert_sdi_dataset(assets, update_existing: bool = True, before_commit=None):
+    """
+    Bulk variant of _db_upsert_sdi_dataset for the sync jobs.
+    `assets` is an iterable of (qr, building, structured) tuples.
+    Returns {(qr, building): error text} for the rows that failed.
+    """
+    if not _connectable():
+        print("?? Database file not found; skipping sdi_dataset bulk upsert.")
+        return {}
+
+    rows = [_sdi_row(qr, building, structured) for qr, building, structured in assets]
+    with _db_connection() as conn:
+        _written, failures = _db_bulk_upsert_rows(
+            conn, SDI_TABLE, key_cols=SDI_KEY_COLS, rows=rows,
+            update_existing=update_existing, before_commit=_search_index_hook(rows, before_commit, replace=update_existing),
+        )
+    return dict(failures)
+
+
+# --- Write-behind persistence queue ---
+PERSIST_COALESCE_SECONDS = 0.2  # how long the writer lets edits pile up before a batch
+PERSIST_WAIT_SECONDS = 10.0     # default wait for /persist_status?wait=...
+PERSIST_ERRORS_KEPT = 1000
+PERSIST_WORKERS = 4             # parallel JSON reads/writes for bulk batches
+
+
+def _write_json_atomic(path: str, data: dict):
+    """Write JSON via a unique temp file in the same directory + fsync + os.replace."""
+    tmp = None
+    try:
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path) or ".",
+                                         prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                         delete=False) as f:
+            tmp = f.name
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        raise
+
+
+# Parsed ME JSON by doc_id, reused while the file's mtime/size are unchanged
+DOC_CACHE_ENTRIES = 256
+_DOC_CACHE = OrderedDict()  # doc_id -> (mtime_ns, size, parsed json)
+_DOC_CACHE_LOCK = Lock()
+
+
+def _read_doc(doc_id: str, json_path: str) -> dict:
+    """json.load of json_path through the parsed-document cache; callers get a private copy."""
+    st = os.stat(json_path)
+    signature = (st.st_mtime_ns, st.st_size)
+    with _DOC_CACHE_LOCK:
+        cached = _DOC_CACHE.get(doc_id)
+        if cached is not None and cached[:2] == signature:
+            _DOC_CACHE.move_to_end(doc_id)
+    hit = cached is not None and cached[:2] == signature
+    METRICS.inc("apr_cache_requests_total", cache="doc_json", result="hit" if hit else "miss")
+    if hit:
+        return copy.deepcopy(cached[2])
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    with _DOC_CACHE_LOCK:
+        _DOC_CACHE[doc_id] = (*signature, data)
+        _DOC_CACHE.move_to_end(doc_id)
+        while len(_DOC_CACHE) > DOC_CACHE_ENTRIES:
+            _DOC_CACHE.popitem(last=False)
+    return copy.deepcopy(data)
+
+
+class PersistQueue:
+    """
+    Single-writer, write-behind persistence for the review write endpoints.
+
+    edit() applies a change to the latest copy of a document (pending or on
+    disk), updates the asset index at once and returns a ticket. A writer
+    thread coalesces repeated edits of the same doc, writes each JSON
+    atomically, then applies every QR_codes / sdi_dataset change of the
+    batch in one transaction. wait(ticket) confirms durability; flush()
+    drains everything and runs at interpreter exit.
+    """
+
+    SKIP = object()  # returned by an edit's change function: nothing to write
+
+    def __init__(self):
+        self._cond = Condition()
+        self._edit_lock = Lock()
+        self._pending = {}  # doc_id -> {"json": dict, "qr_approved": str or None, "tickets": [int]}
+        self._inflight = {}  # the batch being written; still the latest copy until it is on disk
+        self._last_ticket = 0
+        self._durable = 0   # every ticket <= this has been processed
+        self._errors = {}   # ticket -> error text
+        self._writing = False
+        self._thread = None
+        self._stats = {"submitted": 0, "coalesced": 0, "batches": 0, "written": 0, "failed": 0}
+
+    def _ensure_writer(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self._run, name="persist-writer", daemon=True)
+            self._thread.start()
+
+    @timed_phase("json")
+    def load(self, doc_id: str):
+        """Latest version of a document: the pending or in-flight edit if any, else the file (None if missing)."""
+        with self._cond:
+            entry = self._pending.get(doc_id) or self._inflight.get(doc_id)
+            if entry is not None:
+                return copy.deepcopy(entry["json"])
+        json_path = JSON_LAYOUT.locate(JSON_DIR, f"{doc_id}.json")
+        if json_path is None:
+            return None
+        return _read_doc(doc_id, json_path)
+
+    def _load_for_edit(self, doc_id: str):
+        try:
+            return self.load(doc_id), None
+        except Exception as e:
+            return None, str(e)
+
+    def edit(self, doc_id: str, change):
+        """
+        Run change(json_data) on the latest copy and queue the result.
+        `change` may return the QR_codes Approved text to write ('1' / ''), None,
+        or PersistQueue.SKIP when there is nothing to write.
+        Returns (json_data, ticket), or (None, None) when the document does not exist.
+        """
+        json_data, ticket, error = self.edit_many([doc_id], change)[doc_id]
+        if error:
+            raise RuntimeError(error)
+        return json_data, ticket
+
+    def edit_many(self, doc_ids, change) -> dict:
+        """
+        edit() for many documents: files are read in parallel and every change
+        is queued at once, so the writer commits them in a single batch.
+        Returns {doc_id: (json_data, ticket, error)}; ticket is None for
+        missing or skipped documents.
+        """
+        results = {}
+        with self._edit_lock:  # serialise read-modify-write per process
+            if len(doc_ids) > 1:
+                with ThreadPoolExecutor(max_workers=PERSIST_WORKERS) as pool:
+                    loaded = list(pool.map(self._load_for_edit, doc_ids))
+            else:
+                loaded = [self._load_for_edit(doc_id) for doc_id in doc_ids]
+            entries = []
+            for doc_id, (json_data, error) in zip(doc_ids, loaded):
+                if json_data is None:
+                    results[doc_id] = (None, None, error)
+                    continue
+                try:
+                    qr_approved = change(json_data)
+                except Exception as e:
+                    results[doc_id] = (None, None, str(e))
+                    continue
+                if qr_approved is self.SKIP:
+                    results[doc_id] = (json_data, None, None)
+                    continue
+                entries.append((doc_id, json_data, qr_approved))
+            for (doc_id, json_data, _qr), ticket in zip(entries, self.submit_many(entries)):
+                results[doc_id] = (json_data, ticket, None)
+        return results
+
+    def submit(self, doc_id: str, json_data: dict, qr_approved=None) -> int:
+        return self.submit_many([(doc_id, json_data, qr_approved)])[0]
+
+    def submit_many(self, entries) -> list:
+        """Queue (doc_id, json_data, qr_approved) entries together; returns their tickets."""
+        tickets = []
+        with self._cond:
+            for doc_id, json_data, qr_approved in entries:
+                self._last_ticket += 1
+                ticket = self._last_ticket
+                entry = self._pending.get(doc_id)
+                if entry is not None:
+                    self._stats["coalesced"] += 1
+                    entry["json"] = json_data
+                    entry["tickets"].append(ticket)
+                    if qr_approved is not None:
+                        entry["qr_approved"] = qr_approved
+                else:
+                    self._pending[doc_id] = {"json": json_data, "qr_approved": qr_approved, "tickets": [ticket]}
+                self._stats["submitted"] += 1
+                tickets.append(ticket)
+            if entries:
+                self._ensure_writer()
+                self._cond.notify_all()
+        for doc_id, json_data, _qr in entries:
+            ASSET_INDEX.update(doc_id, json_data)
+        return tickets
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(PERSIST_COALESCE_SECONDS)
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._cond:
+            if self._writing or not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            batch_ticket = self._last_ticket
+            self._writing = True
+        errors = {}
+        try:
+            errors = self._write_batch(batch)
+        except Exception as e:
+            print(f"?? Persist batch failed: {e}")
+            errors = {doc_id: str(e) for doc_id in batch}
+        finally:
+            with self._cond:
+                # Written and committed (or failed, reported per ticket): the file is authoritative again
+                self._inflight = {}
+                for doc_id, error in errors.items():
+                    for ticket in batch[doc_id]["tickets"]:
+                        self._errors[ticket] = error
+                while len(self._errors) > PERSIST_ERRORS_KEPT:
+                    del self._errors[next(iter(self._errors))]
+                self._stats["batches"] += 1
+                self._stats["written"] += len(batch) - len(errors)
+                self._stats["failed"] += len(errors)
+                self._durable = max(self._durable, batch_ticket)
+                self._writing = False
+                self._cond.notify_all()
+
+    def _write_batch(self, batch: dict) -> dict:
+        """Write one batch; returns {doc_id: error} for the documents that failed."""
+        errors = {}
+        written = {}
+
+        def write_json(doc_id):
+            try:
+                filename = f"{doc_id}.json"
+                path = JSON_LAYOUT.locate(JSON_DIR, filename) or JSON_LAYOUT.path(JSON_DIR, filename)
+                _write_json_atomic(path, batch[doc_id]["json"])
+                return None
+            except Exception as e:
+                print(f"?? JSON write failed for {doc_id}: {e}")
+                return str(e)
+
+        if len(batch) > 1:
+            with ThreadPoolExecutor(max_workers=PERSIST_WORKERS) as pool:
+                outcomes = list(pool.map(write_json, batch))
+        else:
+            outcomes = [write_json(doc_id) for doc_id in batch]
+        for (doc_id, entry), error in zip(batch.items(), outcomes):
+            if error:
+                errors[doc_id] = error
+            else:
+                written[doc_id] = entry
+                with self._cond:
+                    superseded = doc_id in self._pending
+                if not superseded:  # a newer queued edit already holds the index
+                    ASSET_INDEX.update(doc_id, entry["json"])  # record the new file signature
+
+        if not written or not _connectable():
+            return errors
+
+        keys = {}
+        rows = []
+        qr_rows = []
+        for doc_id, entry in written.items():
+            qr, _asset_type_mid, building = JSON_NAME_RE.match(f"{doc_id}.json").groups()
+            structured = entry["json"].get("structured_data") or {}
+            keys.setdefault((qr, building), []).append(doc_id)
+            rows.append(_sdi_row(qr, building, structured if isinstance(structured, dict) else {}))
+            if entry["qr_approved"] is not None:
+                qr_rows.append((qr, entry["qr_approved"]))
+
+        def write_qr_codes(cur, _written_keys, _failures):
+            if qr_rows:
+                _db_upsert_qr_approved_rows(cur, qr_rows)
+
+        try:
+            with _db_connection() as conn:
+                _written, failures = _db_bulk_upsert_rows(
+                    conn, SDI_TABLE, key_cols=SDI_KEY_COLS, rows=rows,
+                    chunk_size=len(rows), before_commit=_search_index_hook(rows, write_qr_codes),
+                )
+        except Exception as e:
+            print(f"?? Persist DB transaction failed: {e}")
+            failures = [(key, str(e)) for key in keys]
+        for key, error in failures:
+            for doc_id in keys.get(key, ()):
+                print(f"?? sdi_dataset upsert failed for {doc_id}: {error}")
+                errors[doc_id] = error
+        return errors
+
+    def status(self, ticket: int) -> dict:
+        with self._cond:
+            if ticket > self._last_ticket or ticket < 1:
+                return {"ticket": ticket, "known": False, "durable": False, "error": None}
+            done = ticket <= self._durable
+            error = self._errors.get(ticket)
+            return {"ticket": ticket, "known": True, "durable": done and error is None, "error": error}
+
+    def wait(self, ticket: int, timeout: float = PERSIST_WAIT_SECONDS) -> dict:
+        """Block until `ticket` has been processed (or timeout); returns status()."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._durable >= ticket, timeout=timeout)
+        return self.status(ticket)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write everything queued so far; used at shutdown. Returns True when drained."""
+        with self._cond:
+            target = self._last_ticket
+        self._write_pending()  # don't wait for the coalescing delay
+        with self._cond:
+            return self._cond.wait_for(lambda: self._durable >= target, timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {**self._stats, "pending": len(self._pending), "inflight": len(self._inflight),
+                    "last_ticket": self._last_ticket, "durable_ticket": self._durable}
+
+
+PERSIST_QUEUE = PersistQueue()
+atexit.register(PERSIST_QUEUE.flush, 30.0)
+
+
 @app.route("/review/<doc_id>", methods=["POST"])
 def save_review(doc_id):
-    json_path = os.path.join(JSON_DIR, f"{doc_id}.json")
-    if not os.path.exists(json_path):
-        return "Not found", 404
-
     # parse qr/building for SDI upsert
     m = JSON_NAME_RE.match(f"{doc_id}.json")
     if not m:
         return "Bad ID", 400
-    qr, asset_type_mid, building = m.groups()
-
-    with open(json_path, "r", encoding="utf-8") as f:
-        json_data = json.load(f)
-
-    structured = json_data.get("structured_data", {})
-    if not isinstance(structured, dict):
-        structured = {}
-        json_data["structured_data"] = structured
 
-    # Ensure keys (and keep blanks if missing)
-    structured.setdefault("Manufacturer", "")
-    structured.setdefault("Model", "")
-    structured.setdefault("Serial Number", "")
-    structured.setdefault("Year", "")
-    structured.setdefault("UBC Tag", "")
-    structured.setdefault("Technical Safety BC", "")
-    structured.setdefault("Asset Group", "")
-    structured.setdefault("Attribute", "")
-    structured.setdefault("Diameter", "")
-    structured.setdefault("Approved", "")
-    structured.setdefault("Flagged", "false")
-
-    # Flagged
-    new_flagged = "true" if request.form.get("Flagged") == "on" else "false"
-    if structured.get("Flagged", "false") != new_flagged:
-        json_data["modified"] = True
-    structured["Flagged"] = new_flagged
+    def apply_form(json_data):
+        structured = json_data.get("structured_data", {})
+        if not isinstance(structured, dict):
+            structured = {}
+            json_data["structured_data"] = structured
 
-    # Editable fields (skip Description/Approved)
-    for field in list(structured.keys()):
-        if field in ("Flagged", "Description", "Approved"):
-            continue
-        form_value = request.form.get(field, "")
-        if structured.get(field, "") != form_value:
+        # Ensure keys (and keep blanks if missing)
+        structured.setdefault("Manufacturer", "")
+        structured.setdefault("Model", "")
+        structured.setdefault("Serial Number", "")
+        structured.setdefault("Year", "")
+        structured.setdefault("UBC Tag", "")
+        structured.setdefault("Technical Safety BC", "")
+        structured.setdefault("Asset Group", "")
+        structured.setdefault("Attribute", "")
+        structured.setdefault("Diameter", "")
+        structured.setdefault("Approved", "")
+        structured.setdefault("Flagged", "false")
+
+        # Flagged
+        new_flagged = "true" if request.form.get("Flagged") == "on" else "false"
+        if structured.get("Flagged", "false") != new_flagged:
             json_data["modified"] = True
-        structured[field] = form_value
+        structured["Flagged"] = new_flagged
 
-    # Capture any brand-new fields
-    for field, form_value in request.form.items():
-        if field in ("Flagged", "action", "Description", "dashboard_query"):
-            continue
-        if field not in structured:
+        # Editable fields (skip Description/Approved)
+        for field in list(structured.keys()):
+            if field in ("Flagged", "Description", "Approved"):
+                continue
+            form_value = request.form.get(field, "")
+            if structured.get(field, "") != form_value:
+                json_data["modified"] = True
             structured[field] = form_value
-            json_data["modified"] = True
-
-    # Recompute Description
-    structured["Description"] = _compute_description(
-        structured.get("Asset Group"),
-        structured.get("UBC Tag")
-    )
 
-    # Persist JSON
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=4)
-
-    # --- SDI upsert every save (will write Approved as 1/0) ---
-    try:
-        _db_upsert_sdi_dataset(qr=qr, building=building, structured=structured)
-    except Exception as e:
-        print(f"?? sdi_dataset upsert failed: {e}")
-
-    # Next/Prev navigation (ME-only)
-    all_files = sorted(
-        f for f in os.listdir(JSON_DIR)
-        if f.endswith(".json")
-        and not f.endswith("_raw_ocr.json")
-        and JSON_NAME_RE.match(f)
-        and _is_me_filename(f)
-    )
-    current_name = f"{doc_id}.json"
-    try:
-        current_index = all_files.index(current_name)
-    except ValueError:
-        dash_q = request.form.get("dashboard_query", "")
-        if (dash_q or "").startswith("?"):
-            return redirect(url_for("index") + dash_q)
-        return redirect(url_for("index"))
+        # Capture any brand-new fields
+        for field, form_value in request.form.items():
+            if field in ("Flagged", "action", "Description", "dashboard_query"):
+                continue
+            if field not in structured:
+                structured[field] = form_value
+                json_data["modified"] = True
+
+        # Recompute Description
+        structured["Description"] = _compute_description(
+            structured.get("Asset Group"),
+            structured.get("UBC Tag")
+        )
+        return None  # QR_codes untouched
+
+    # Persist JSON + SDI upsert (Approved as 1/0) through the write-behind queue
+    json_data, _ticket = PERSIST_QUEUE.edit(doc_id, apply_form)
+    if json_data is None:
+        return "Not found", 404
 
+    # Next/Prev navigation (ME-only), following the dashboard quick filters
+    dash_q = request.form.get("dashboard_query", "") or ""
     action = request.form.get("action")
-    if action == "save_next" and current_index + 1 < len(all_files):
-        next_doc = all_files[current_index + 1][:-5]
-        return redirect(url_for("review", doc_id=next_doc))
-    elif action == "save_prev" and current_index > 0:
-        prev_doc = all_files[current_index - 1][:-5]
-        return redirect(url_for("review", doc_id=prev_doc))
-
-    dash_q = request.form.get("dashboard_query", "")
-    if (dash_q or "").startswith("?"):
+    if action in ("save_next", "save_prev"):
+        ASSET_INDEX.ensure_loaded()
+        target = ASSET_INDEX.neighbour(doc_id, 1 if action == "save_next" else -1, flags=_query_flags(dash_q))
+        if target:
+            return redirect(url_for("review", doc_id=target))
+
+    if dash_q.startswith("?"):
         return redirect(url_for("index") + dash_q)
 
     return redirect(url_for("index"))
@@ -653,10 +3869,6 @@ def save_review(doc_id):
 @app.route("/toggle_approved/<doc_id>", methods=["POST"])
 def toggle_approved(doc_id):
     """Toggle Approved in JSON and update QR_codes; also refresh sdi_dataset row with 1/0."""
-    json_path = os.path.join(JSON_DIR, f"{doc_id}.json")
-    if not os.path.exists(json_path):
-        return jsonify({"success": False, "error": "Not found"}), 404
-
     # Parse QR/building
     m = JSON_NAME_RE.match(f"{doc_id}.json")
     if not m:
@@ -664,75 +3876,798 @@ def toggle_approved(doc_id):
     qr, asset_type_mid, building = m.groups()
     if asset_type_mid.upper() != "ME":
         return jsonify({"success": False, "error": "Not allowed"}), 403
+    blocked = []
 
-    try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            json_data = json.load(f)
-
+    def toggle(json_data):
         structured = json_data.get("structured_data", {})
         if not isinstance(structured, dict):
             structured = {}
             json_data["structured_data"] = structured
 
         current = structured.get("Approved", "")
+        if current != "":
+            # Only un-approving needs the export state; approving works without a DB
+            try:
+                exported = EXPORTED_CODES.is_exported(qr)
+            except Exception as e:
+                print(f"!! DB error in /toggle_approved: {e}")
+                raise RuntimeError(f"Database query failed: {e}")
+            if exported:
+                # Already in Planon: un-approving here would leave the two out of step
+                blocked.append(doc_id)
+                return PersistQueue.SKIP
         new_val = "True" if current == "" else ""
         structured["Approved"] = new_val
         json_data["structured_data"] = structured
 
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=4)
-
-        # Update QR_codes (1 / '')
-        db_val = "1" if new_val == "True" else ""
-        _db_upsert_qr_approved(qr_code_id=qr, approved_text=db_val)
-
-        # Ensure sdi_dataset row exists/up-to-date (Approved as 1/0)
-        try:
-            _db_upsert_sdi_dataset(qr=qr, building=building, structured=structured)
-        except Exception as e:
-            print(f"?? sdi_dataset upsert (from toggle) failed: {e}")
+        # QR_codes gets 1 / ''; sdi_dataset is refreshed with 1/0 in the same transaction
+        return "1" if new_val == "True" else ""
 
-        return jsonify({"success": True, "new_value": structured["Approved"]})
+    try:
+        json_data, ticket = PERSIST_QUEUE.edit(doc_id, toggle)
+        if json_data is None:
+            return jsonify({"success": False, "error": "Not found"}), 404
+        if blocked:
+            return jsonify({"success": False, "error": "Asset has already been exported to Planon",
+                            "exported": True}), 409
+        return jsonify({
+            "success": True,
+            "new_value": json_data["structured_data"]["Approved"],
+            "ticket": ticket,
+        })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route("/persist_status/<int:ticket>")
+def persist_status(ticket):
+    """Durability of a write ticket; ?wait=<seconds> blocks until it is written."""
+    try:
+        wait = min(float(request.args.get("wait", 0)), PERSIST_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({"error": "Bad wait"}), 400
+    status = PERSIST_QUEUE.wait(ticket, wait) if wait > 0 else PERSIST_QUEUE.status(ticket)
+    return jsonify(status)
+
+
 @app.route("/check_sdi/<qr_code>")
 def check_sdi(qr_code):
     """
     Checks if a QR code exists in the sdi_print_out table to prevent
     un-approving an asset that has already been exported to Planon.
     """
+    try:
+        return jsonify({"exists": EXPORTED_CODES.lookup([qr_code])[qr_code]})
+    except Exception as e:
+        print(f"!! DB error in /check_sdi: {e}")
+        return jsonify({"error": f"Database query failed: {e}"}), 500
+
+
+@app.route("/check_sdi", methods=["POST"])
+def check_sdi_batch():
+    """Batch form of /check_sdi: {"qr_codes": [...]} -> {"exported": {qr: bool}}."""
+    payload = request.get_json(silent=True) or {}
+    qr_codes = payload.get("qr_codes")
+    if not isinstance(qr_codes, list) or not all(isinstance(q, str) for q in qr_codes):
+        return jsonify({"error": "qr_codes must be a list of strings"}), 400
+    if len(qr_codes) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_MAX_ITEMS} QR codes per request"}), 400
+    try:
+        return jsonify({"exported": EXPORTED_CODES.lookup(qr_codes)})
+    except Exception as e:
+        print(f"!! DB error in /check_sdi: {e}")
+        return jsonify({"error": f"Database query failed: {e}"}), 500
+
+
+BULK_MAX_ITEMS = 5000
+
+
+class ExportedCodes:
+    """
+    QR codes already exported to Planon (present in sdi_print_out), kept in
+    memory as a frozenset and reloaded with one indexed query after some
+    other connection committed (see DataVersionWatch).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._watch = DataVersionWatch()
+        self._codes = frozenset()
+        self.generation = 0  # bumped whenever the set actually changes
+        self._stats = {"checks": 0, "reloads": 0}
+
+    def _refresh(self):
+        self._stats["checks"] += 1
+        version = self._watch.current()
+        if version is None:
+            return
+        conn = self._watch.connection()
+        try:
+            ensure_schema(conn)  # the export job may create sdi_print_out after start-up
+            rows = conn.execute(
+                f"SELECT DISTINCT {_quote(SDI_PRINT_OUT_QR_COL)} FROM {_quote(SDI_PRINT_OUT_TABLE)}"
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e).lower():
+                raise
+            rows = []  # nothing has been exported yet
+        codes = frozenset(str(r[0]) for r in rows if r[0] is not None)
+        if codes != self._codes:
+            self._codes = codes
+            self.generation += 1
+        self._stats["reloads"] += 1
+        self._watch.seen = version
+
+    def codes(self) -> frozenset:
+        """Current exported set; raises when the database cannot be read."""
+        if not _connectable():
+            raise RuntimeError("Database not accessible")
+        with self._lock:
+            try:
+                self._refresh()
+            except Exception:
+                self._watch.seen = None  # retry on the next call
+                raise
+            return self._codes
+
+    def lookup(self, qr_codes) -> dict:
+        codes = self.codes()
+        return {qr: qr in codes for qr in qr_codes}
+
+    def is_exported(self, qr: str) -> bool:
+        """False without a database (nothing can have been exported yet); other read errors raise."""
+        if not _connectable():
+            return False
+        return qr in self.codes()
+
+    def for_display(self) -> frozenset:
+        """codes() for page rendering: a failed read shows nothing as exported
+        (toggle_approved still enforces the rule)."""
+        try:
+            return self.codes()
+        except Exception as e:
+            print(f"?? Exported codes unavailable: {e}")
+            return frozenset()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "codes": len(self._codes), "data_version": self._watch.seen}
+
+
+EXPORTED_CODES = ExportedCodes()
+
+
+def _structured_data(json_data: dict) -> dict:
+    structured = json_data.get("structured_data", {})
+    if not isinstance(structured, dict):
+        structured = {}
+        json_data["structured_data"] = structured
+    return structured
+
+
+def _bulk_set_approved(value: str):
+    def change(json_data):
+        structured = _structured_data(json_data)
+        if structured.get("Approved", "") == value:
+            return PersistQueue.SKIP
+        structured["Approved"] = value
+        return "1" if value == "True" else ""
+    return change
+
+
+def _bulk_set_flagged(value: str):
+    def change(json_data):
+        structured = _structured_data(json_data)
+        if structured.get("Flagged", "false") == value:
+            return PersistQueue.SKIP
+        structured["Flagged"] = value
+        json_data["modified"] = True
+        return None
+    return change
+
+
+BULK_ACTIONS = {
+    "approve": _bulk_set_approved("True"),
+    "unapprove": _bulk_set_approved(""),
+    "flag": _bulk_set_flagged("true"),
+    "unflag": _bulk_set_flagged("false"),
+}
+
+
+@app.route("/bulk_update", methods=["POST"])
+def bulk_update():
+    """
+    Approve / unapprove / flag / unflag many ME assets at once.
+
+    JSON body: {"action": ..., "doc_ids": [...], "wait": bool}. Unapprove is
+    validated against the in-memory exported set; all edits go through the
+    write-behind queue together, so the JSON files are written in parallel and
+    the DB changes land in a single transaction. With "wait" the response is
+    held until that transaction is done. Returns a per-item result list.
+    """
+    payload = request.get_json(silent=True) or {}
+    action = payload.get("action")
+    doc_ids = payload.get("doc_ids")
+    if action not in BULK_ACTIONS:
+        return jsonify({"success": False, "error": "Unknown action"}), 400
+    if not isinstance(doc_ids, list) or not all(isinstance(d, str) for d in doc_ids):
+        return jsonify({"success": False, "error": "doc_ids must be a list of strings"}), 400
+    if len(doc_ids) > BULK_MAX_ITEMS:
+        return jsonify({"success": False, "error": f"At most {BULK_MAX_ITEMS} items per request"}), 400
+
+    results = {}
+    qr_of = {}
+    for doc_id in dict.fromkeys(doc_ids):
+        m = JSON_NAME_RE.match(f"{doc_id}.json")
+        if not m or m.group(2).upper() != "ME":
+            results[doc_id] = {"status": "invalid"}
+        else:
+            qr_of[doc_id] = m.group(1)
+
+    if action == "unapprove" and qr_of:
+        try:
+            exported = EXPORTED_CODES.codes()
+        except Exception as e:
+            print(f"!! DB error in /bulk_update: {e}")
+            return jsonify({"success": False, "error": f"Database query failed: {e}"}), 500
+        for doc_id in [d for d, qr in qr_of.items() if qr in exported]:
+            results[doc_id] = {"status": "exported"}
+            del qr_of[doc_id]
+
+    edits = PERSIST_QUEUE.edit_many(list(qr_of), BULK_ACTIONS[action])
+    tickets = {}
+    for doc_id, (json_data, ticket, error) in edits.items():
+        if error:
+            results[doc_id] = {"status": "error", "error": error}
+        elif json_data is None:
+            results[doc_id] = {"status": "not_found"}
+        elif ticket is None:
+            results[doc_id] = {"status": "unchanged"}
+        else:
+            results[doc_id] = {"status": "updated", "ticket": ticket}
+            tickets[doc_id] = ticket
+
+    if payload.get("wait") and tickets:
+        PERSIST_QUEUE.wait(max(tickets.values()))
+        for doc_id, ticket in tickets.items():
+            status = PERSIST_QUEUE.status(ticket)
+            if status["error"]:
+                results[doc_id] = {"status": "failed", "ticket": ticket, "error": status["error"]}
+
+    summary = {}
+    for result in results.values():
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return jsonify({
+        "success": True,
+        "action": action,
+        "ticket": max(tickets.values(), default=None),
+        "summary": summary,
+        "results": [{"doc_id": doc_id, **results[doc_id]} for doc_id in dict.fromkeys(doc_ids)],
+    })
+
+
+# --- Full-text search & duplicate serials ---
+SEARCH_MAX_RESULTS = 200
+SEARCH_FUZZY_TERMS = 5       # close vocabulary terms tried per unknown word
+SEARCH_FUZZY_CUTOFF = 0.75   # difflib ratio
+SEARCH_FUZZY_POOL = 5000     # most vocabulary terms difflib compares per word
+SEARCH_VOCAB_TTL = 60.0      # seconds a vocabulary copy is used for fuzzy matching
+SEARCH_FIELDS = {"manufacturer": "Manufacturer", "model": "Model", "serial": "Serial", "ubc_tag": "UBC Tag"}
+# Placeholder serials that are not worth reporting as duplicates (compared after _normalise_serial)
+DUPLICATE_SERIAL_IGNORE = {"", "NA", "NONE", "UNKNOWN", "NOSERIAL", "NIL", "TBD", "0"}
+DUPLICATE_SERIAL_MIN_LEN = 3
+
+# Characters the SEARCH_TOKENIZER keeps (letters, digits and its tokenchars)
+SEARCH_TOKEN_RE = re.compile(r"[\w\-./]")
+
+_SEARCH_VOCAB = {"path": None, "loaded": 0.0, "terms": []}
+_SEARCH_VOCAB_LOCK = Lock()
+
+
+def _fts_phrase(term: str, prefix: bool = True) -> str:
+    """One user word as an FTS5 string (quotes escaped), optionally as a prefix query."""
+    return '"' + term.replace('"', '""') + '"' + ("*" if prefix else "")
+
+
+def _search_vocabulary(conn) -> list:
+    """Sorted indexed terms, re-read at most every SEARCH_VOCAB_TTL seconds."""
+    with _SEARCH_VOCAB_LOCK:
+        cached = _SEARCH_VOCAB
+        if cached["path"] != DB_PATH or time.monotonic() - cached["loaded"] > SEARCH_VOCAB_TTL:
+            rows = conn.execute(f"SELECT term FROM {_quote(SEARCH_TABLE + '_vocab')}")
+            cached.update(path=DB_PATH, loaded=time.monotonic(), terms=sorted(r[0] for r in rows))
+        return cached["terms"]
+
+
+def _fuzzy_terms(conn, word: str) -> list:
+    """
+    Indexed terms close to `word` when no term starts with it (the prefix
+    query already finds those). Candidates share its leading characters,
+    lengthened until at most SEARCH_FUZZY_POOL terms remain, and a similar
+    length, so difflib only compares a slice of the vocabulary.
+    """
+    terms = _search_vocabulary(conn)
+    i = bisect_left(terms, word)
+    if i < len(terms) and terms[i].startswith(word):
+        return []
+    n = 1
+    while True:
+        lo = bisect_left(terms, word[:n])
+        hi = bisect_left(terms, word[:n] + "\U0010ffff")
+        if hi - lo <= SEARCH_FUZZY_POOL or n >= len(word) - 1:
+            break
+        n += 1
+    candidates = [t for t in terms[lo:hi] if abs(len(t) - len(word)) <= 2]
+    return difflib.get_close_matches(word, candidates, n=SEARCH_FUZZY_TERMS, cutoff=SEARCH_FUZZY_CUTOFF)
+
+
+def _search_query(conn, text: str, fuzzy: bool, field: str = None):
+    """
+    FTS5 MATCH expression: every word must match, as a prefix; with fuzzy,
+    a word can also match its close vocabulary terms.
+    Returns (expression or None, {word: fuzzy terms used}).
+    Words the tokenizer would drop entirely (only punctuation, like the "&"
+    in "Bell & Gossett") are left out; ValueError when no word remains, as
+    such a query would otherwise match nothing without saying why.
+    """
+    typed = [w for w in re.split(r"\s+", text.lower().strip()) if w]
+    words = [w for w in typed if SEARCH_TOKEN_RE.search(w)]
+    if typed and not words:
+        raise ValueError(f"nothing to search for in {text.strip()!r}")
+    parts, expanded = [], {}
+    for word in words:
+        options = [_fts_phrase(word)]
+        if fuzzy and len(word) >= 3:
+            close = _fuzzy_terms(conn, word)
+            if close:
+                expanded[word] = close
+                options += [_fts_phrase(t, prefix=False) for t in close]
+        parts.append(options[0] if len(options) == 1 else f"({' OR '.join(options)})")
+    if not parts:
+        return None, expanded
+    expression = " AND ".join(parts)
+    if field:
+        expression = f"{_fts_phrase(field, prefix=False)} : ({expression})"
+    return expression, expanded
+
+
+# Index entries back to their current sdi_dataset rows, by key (uses the unique key index)
+_SEARCH_JOIN = (
+    f"FROM {_quote(SEARCH_TABLE)} AS s JOIN {_quote(SEARCH_KEYS_TABLE)} AS k ON k.id = s.rowid "
+    f'JOIN {_quote(SDI_TABLE)} AS d ON d."QR Code" = k."QR Code" AND d."Building" = k."Building"'
+)
+
+
+def search_assets(conn, text: str, fuzzy: bool = False, field: str = None, limit: int = 50) -> dict:
+    """Ranked (bm25) sdi_dataset rows matching `text`; see _search_query."""
+    expression, expanded = _search_query(conn, text, fuzzy, field)
+    if expression is None:
+        return {"query": expression, "expanded": expanded, "results": []}
+    cols = ["QR Code", "Building"] + [c for c in SEARCH_COLS if c in _db_get_columns(conn, SDI_TABLE)]
+    rows = conn.execute(
+        f"SELECT {', '.join('d.' + _quote(c) for c in cols)} {_SEARCH_JOIN} "
+        f"WHERE {_quote(SEARCH_TABLE)} MATCH ? ORDER BY s.rank LIMIT ?",
+        (expression, limit),
+    ).fetchall()
+    results = []
+    for row in rows:
+        item = {c: ("" if v is None else str(v)) for c, v in zip(cols, row)}
+        doc_id = f"{item['QR Code']}_ME_{item['Building']}"
+        item["doc_id"] = doc_id if doc_id in ASSET_INDEX else None
+        results.append(item)
+    return {"query": expression, "expanded": expanded, "results": results}
+
+
+def _normalise_serial(serial) -> str:
+    return re.sub(r"[\s\-_./]", "", str(serial or "")).upper()
+
+
+def duplicate_serials(conn, limit: int = 500) -> list:
+    """
+    Groups of distinct assets sharing a serial number.
+    The 'col' vocabulary lists every Serial token with the number of rows it
+    occurs in, so only tokens seen in two or more rows are looked up (one
+    indexed MATCH each) and rows are grouped by their whole normalised serial;
+    no pairwise comparison of assets.
+    """
+    vocab = _quote(SEARCH_TABLE + "_vocab_col")
+    terms = [r[0] for r in conn.execute(
+        f"SELECT term FROM {vocab} WHERE col = 'Serial' AND doc > 1 ORDER BY doc DESC"
+    )]
+    groups = {}
+    for term in terms:
+        if _normalise_serial(term) in DUPLICATE_SERIAL_IGNORE:
+            continue
+        rows = conn.execute(
+            f"SELECT d.\"QR Code\", d.\"Building\", d.\"Serial\", d.\"Manufacturer\", d.\"Model\" {_SEARCH_JOIN} "
+            f"WHERE {_quote(SEARCH_TABLE)} MATCH ?",
+            (f'"Serial" : {_fts_phrase(term, prefix=False)}',),
+        ).fetchall()
+        for qr, building, serial, manufacturer, model in rows:
+            key = _normalise_serial(serial)
+            if key in DUPLICATE_SERIAL_IGNORE or len(key) < DUPLICATE_SERIAL_MIN_LEN:
+                continue
+            groups.setdefault(key, {})[(str(qr), str(building))] = {
+                "qr_code": str(qr), "building": str(building), "serial": serial or "",
+                "manufacturer": manufacturer or "", "model": model or "",
+            }
+    report = [
+        {"serial": key, "count": len(assets), "assets": sorted(assets.values(), key=lambda a: (a["qr_code"], a["building"]))}
+        for key, assets in groups.items() if len(assets) > 1
+    ]
+    report.sort(key=lambda g: (-g["count"], g["serial"]))
+    return report[:limit]
+
+
+def _search_unavailable(e: Exception):
+    if str(e).startswith("fts5:"):  # e.g. "fts5: syntax error near ..."; the index itself is fine
+        return jsonify({"error": f"Bad search query: {e}"}), 400
+    print(f"!! Search failed: {e}")
+    return jsonify({"error": f"Search index unavailable: {e}"}), 503
+
+
+@app.route("/api/search")
+def api_search():
+    """?q=words (prefix match, all words), &fuzzy=1, &field=manufacturer|model|serial|ubc_tag, &limit=N."""
+    text = (request.args.get("q") or "").strip()
+    field = request.args.get("field")
+    if field and field not in SEARCH_FIELDS:
+        return jsonify({"error": f"field must be one of {sorted(SEARCH_FIELDS)}"}), 400
+    try:
+        limit = min(int(request.args.get("limit", 50)), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return jsonify({"error": "Bad limit"}), 400
     if not _connectable():
         return jsonify({"error": "Database not accessible"}), 500
+    try:
+        with _db_connection() as conn:
+            result = search_assets(conn, text, fuzzy=request.args.get("fuzzy") == "1",
+                                   field=SEARCH_FIELDS.get(field), limit=limit)
+    except ValueError as e:
+        return jsonify({"error": f"Bad search query: {e}"}), 400
+    except sqlite3.OperationalError as e:
+        return _search_unavailable(e)
+    return jsonify({"q": text, **result})
 
-    sdi_print_out_table = "sdi_print_out"
-    qr_col = "QR Code"
 
+@app.route("/api/duplicate_serials")
+def api_duplicate_serials():
+    """Serial numbers shared by two or more assets, largest groups first (?limit=N)."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            query = f"SELECT 1 FROM {_quote(sdi_print_out_table)} WHERE {_quote(qr_col)} = ? LIMIT 1"
-            cur.execute(query, (qr_code,))
-            result = cur.fetchone()
-            return jsonify({"exists": result is not None})
+        limit = int(request.args.get("limit", 500))
+    except ValueError:
+        return jsonify({"error": "Bad limit"}), 400
+    if not _connectable():
+        return jsonify({"error": "Database not accessible"}), 500
+    try:
+        with _db_connection() as conn:
+            groups = duplicate_serials(conn, limit=limit)
     except sqlite3.OperationalError as e:
-        if "no such table" in str(e).lower():
-            # If the table doesn't exist, no items have been exported. Safe to proceed.
-            return jsonify({"exists": False})
-        
-        print(f"!! DB Operational Error in /check_sdi: {e}")
-        return jsonify({"error": f"Database query failed: {e}"}), 500
+        return _search_unavailable(e)
+    return jsonify({"groups": len(groups), "duplicates": groups})
+
+
+# --- Export (CSV / XLSX for Planon) ---
+EXPORT_FETCH_ROWS = 500          # rows per fetchmany() on the export cursor
+EXPORT_CHUNK = 64 * 1024         # bytes per chunk sent to the client
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _export_rows(approved: str = "1", building: str = None, exported: str = "all"):
+    """
+    Yield the header and then one list per sdi_dataset row, columns in
+    SDI_TARGET_COLS order (the same mapping the upserts write).
+    approved: "1" / "0" / "all"; exported: "0" leaves out assets already in
+    sdi_print_out, "1" keeps only those, "all" ignores it.
+    A dedicated query_only connection is walked with fetchmany(), so memory
+    stays flat and WAL lets writers carry on while a long export runs.
+    """
+    codes = EXPORTED_CODES.codes() if exported in ("0", "1") else None
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA query_only = ON")
+        available = _db_get_columns(conn, SDI_TABLE)
+        if not available:
+            raise RuntimeError(f'Table "{SDI_TABLE}" not found or has no columns.')
+        cols = [c for c in SDI_TARGET_COLS if c in available]
+        where, params = [], []
+        if approved == "1":
+            where.append('"Approved" = ?')
+            params.append("1")
+        elif approved == "0":
+            where.append("""COALESCE("Approved", '') != ?""")
+            params.append("1")
+        if building:
+            where.append(f'{_quote("Building")} = ?')
+            params.append(building)
+        sql = f'SELECT {", ".join(_quote(c) for c in cols)} FROM {_quote(SDI_TABLE)}'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f' ORDER BY {", ".join(_quote(k) for k in SDI_KEY_COLS)}'
+        cur = conn.execute(sql, params)
+        qr_pos = cols.index("QR Code") if "QR Code" in cols else None
+        yield cols
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                if codes is not None and qr_pos is not None and (str(row[qr_pos]) in codes) != (exported == "1"):
+                    continue
+                yield ["" if v is None else v for v in row]
+    finally:
+        conn.close()
+
+
+def _csv_chunks(rows):
+    """CSV bytes in EXPORT_CHUNK pieces; starts with a BOM so Excel reads UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object: zipfile streams into it, the generator drains it."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="sdi_dataset" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+# Characters XML 1.0 does not allow, even escaped
+_XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_chunks(rows):
+    """
+    Minimal single-sheet XLSX (inline strings, no styles) written row by row
+    through zipfile into a non-seekable sink, so nothing but the current
+    chunk is held in memory and no spreadsheet library is needed.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _XLSX_PARTS.items():
+            archive.writestr(name, xml)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            pending = []
+            size = 0
+            for row in rows:
+                cells = "".join(
+                    f'<c t="inlineStr"><is><t xml:space="preserve">'
+                    f'{escape(_XML_INVALID_RE.sub("", str(v)))}</t></is></c>'
+                    for v in row
+                )
+                line = f"<row>{cells}</row>"
+                pending.append(line)
+                size += len(line)
+                if size >= EXPORT_CHUNK:
+                    sheet.write("".join(pending).encode("utf-8"))
+                    pending, size = [], 0
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write(("".join(pending) + "</sheetData></worksheet>").encode("utf-8"))
+    yield sink.drain()
+
+
+def _export_chunks(fmt: str, **filters):
+    rows = _export_rows(**filters)
+    return _xlsx_chunks(rows) if fmt == "xlsx" else _csv_chunks(rows)
+
+
+def _export_filters(args) -> dict:
+    filters = {
+        "approved": args.get("approved", "1"),
+        "building": (args.get("building") or "").strip() or None,
+        "exported": args.get("exported", "all"),
+    }
+    if filters["approved"] not in ("0", "1", "all") or filters["exported"] not in ("0", "1", "all"):
+        raise ValueError("approved / exported must be 0, 1 or all")
+    return filters
+
+
+@app.route("/export.<fmt>")
+def export(fmt):
+    """
+    Stream sdi_dataset as CSV or XLSX: ?approved=1|0|all (default 1),
+    ?building=..., ?exported=0|1|all (0 = not yet in Planon).
+    Edits still waiting in the write-behind queue are flushed first.
+    """
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        filters = _export_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not _connectable():
+        return jsonify({"error": "Database not accessible"}), 500
+    PERSIST_QUEUE.flush(PERSIST_WAIT_SECONDS)
+    chunks = _export_chunks(fmt, **filters)
+    try:
+        first = next(chunks)  # surface a broken schema as a 500, not a truncated download
     except Exception as e:
-        print(f"!! UNEXPECTED ERROR in /check_sdi: {e}")
-        return jsonify({"error": str(e)}), 500
+        print(f"!! Export failed: {e}")
+        return jsonify({"error": f"Export failed: {e}"}), 500
+    filename = f"sdi_export_{time.strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    response = app.response_class(chain([first], chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def export_cli(argv) -> int:
+    """python asset_plate_reviewer.py export [--format csv|xlsx] [--approved 1|0|all] ... [-o FILE]"""
+    parser = argparse.ArgumentParser(prog="asset_plate_reviewer.py export",
+                                     description="Write sdi_dataset as CSV or XLSX.")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--approved", choices=["0", "1", "all"], default="1")
+    parser.add_argument("--exported", choices=["0", "1", "all"], default="all")
+    parser.add_argument("--building")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+    if not _connectable():
+        print(f"!! Database not found: {DB_PATH}", file=sys.stderr)
+        return 1
+    chunks = _export_chunks(args.format, approved=args.approved, building=args.building,
+                            exported=args.exported)
+    if args.output:
+        with open(args.output, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    else:
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+@app.route("/sync_state")
+def sync_state():
+    """Per-file sync state: ?status=error|stuck|skipped|ok, ?kind=image|json, ?limit=N."""
+    if not _connectable():
+        return jsonify({"error": "Database not accessible"}), 500
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "Bad limit"}), 400
+    counts, rows = SYNC_STATE.query(
+        status=request.args.get("status"), kind=request.args.get("kind"), limit=limit
+    )
+    return jsonify({"counts": counts, "max_attempts": SYNC_MAX_ATTEMPTS, "files": rows})
+
+
+@app.route("/db_stats")
+def db_stats():
+    return jsonify({
+        "pool": DB_POOL.stats(),
+        "column_cache": {**_COLUMN_CACHE_STATS, "tables": len(_COLUMN_CACHE)},
+        "reference_cache": REFERENCE_CACHE.stats(),
+        "exported_codes": EXPORTED_CODES.stats(),
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus exposition: request/phase histograms, sync and DB counters, cache and index gauges."""
+    if not METRICS_ENABLED:
+        return "Metrics disabled", 404
+    pool = DB_POOL.stats()
+    reference = REFERENCE_CACHE.stats()
+    exported = EXPORTED_CODES.stats()
+    persist = PERSIST_QUEUE.stats()
+    # Caches that keep their own stats are copied into the shared lookup counter
+    for name, (hits, misses) in {
+        "column": (_COLUMN_CACHE_STATS["hits"], _COLUMN_CACHE_STATS["misses"]),
+        "reference": (reference["checks"] - reference["reloads"], reference["reloads"]),
+        "exported": (exported["checks"] - exported["reloads"], exported["reloads"]),
+        "db_pool": (pool["reused"], pool["opened"]),
+    }.items():
+        METRICS.set("apr_cache_requests_total", hits, cache=name, result="hit")
+        METRICS.set("apr_cache_requests_total", misses, cache=name, result="miss")
+    lookups = {}
+    for labels, value in METRICS.counter_values("apr_cache_requests_total").items():
+        labels = dict(labels)
+        lookups.setdefault(labels["cache"], {})[labels["result"]] = value
+    extra = [
+        ("apr_asset_index_entries", "gauge", "Documents in the asset index.", [({}, len(ASSET_INDEX))]),
+        ("apr_image_index_entries", "gauge", "Photos in the image index.", [({}, len(IMAGE_INDEX))]),
+        ("apr_exported_codes", "gauge", "QR codes already exported to Planon.", [({}, exported["codes"])]),
+        ("apr_change_feed_clients", "gauge", "Open dashboard change-feed streams.", [({}, CHANGE_FEED.clients)]),
+        ("apr_cache_hit_ratio", "gauge", "Cache hits / lookups since start.",
+         [({"cache": name}, round(r.get("hit", 0) / (r.get("hit", 0) + r.get("miss", 0)), 4))
+          for name, r in sorted(lookups.items()) if r.get("hit", 0) + r.get("miss", 0)]),
+        ("apr_db_pool_in_use", "gauge", "Pooled connections currently borrowed.", [({}, pool["in_use"])]),
+        ("apr_persist_pending", "gauge", "Documents waiting in the write-behind queue.", [({}, persist["pending"])]),
+        ("apr_persist_failed_total", "counter", "Write-behind documents that failed to persist.", [({}, persist["failed"])]),
+        ("apr_ready", "gauge", "1 once the index warm-up is complete.", [({}, int(INDEX_WARMUP.ready))]),
+    ]
+    return METRICS.render(extra), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 
 @app.route("/images/<path:filename>")
 def serve_image(filename):
-    return send_from_directory(IMG_DIR, filename)
+    """Original image, or a cached rendition with ?size=thumb|preview."""
+    size = request.args.get("size")
+    if size and size != "full":
+        rendition = get_rendition(filename, size)
+        if rendition is not None:
+            return _send_cached(rendition, mimetype=RENDITION_MIMETYPES[RENDITION_FORMAT])
+    path = IMG_LAYOUT.locate(IMG_DIR, filename)
+    if path is None:
+        abort(404)
+    return _send_cached(path)
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5002, debug=True)
+    if sys.argv[1:2] == ["sync-worker"]:
+        # Standalone worker; run the web app with SYNC_WORKER_ENABLED=0 alongside it
+        SYNC_WORKER.run_forever()
+    elif sys.argv[1:2] == ["export"]:
+        sys.exit(export_cli(sys.argv[2:]))
+    elif sys.argv[1:2] == ["migrate-layout"]:
+        sys.exit(migrate_layout_cli(sys.argv[2:]))
+    elif sys.argv[1:2] == ["dedupe-keys"]:
+        sys.exit(dedupe_keys_cli(sys.argv[2:]))
+    elif sys.argv[1:2] == ["search-index"]:
+        sys.exit(search_index_cli(sys.argv[2:]))
+    else:
+        INDEX_WARMUP.ensure_started()
+        app.run(host='0.0.0.0', port=5002, debug=True)
 
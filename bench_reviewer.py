@@ -0,0 +1,416 @@
+"""
+Synthetic-fleet benchmark for asset_plate_reviewer.py.
+
+Builds fleets of N ME assets (JSON documents, photos with some missing and a
+SQLite DB with the tables the app expects) in a temp directory, points the app
+at them through the JSON_DIR / IMG_DIR / DB_PATH environment variables and
+times the main code paths through the Flask test client:
+
+    python bench_reviewer.py                          # 1k, 10k and 100k assets
+    python bench_reviewer.py --sizes 1000 --samples 200 --out bench.json
+    python bench_reviewer.py --layout building        # per-building shard directories
+
+Each fleet size runs in its own interpreter, so peak RSS and the /proc/self/io
+counters belong to that size alone. The report is JSON: per operation the
+latency percentiles in ms, read/write syscall deltas and the os.stat / lstat /
+scandir / listdir calls it made (which /proc/self/io does not count), per run
+the peak RSS and the EXPLAIN QUERY PLAN of the key lookups (a full scan fails
+the run, as does any failed request). From WARM_BUDGET_MIN_SIZE assets on, a
+no-change GET / with the sync worker running must also stay within
+--budget-ms (p50) and --budget-fs-calls (per request), or the run fails.
+Compare two reports with any JSON diff tool.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_SAMPLES = 50
+BUILDINGS = ["101", "202", "303-1", "404", "505-2", "606", "707", "808"]
+MANUFACTURERS = ["Trane", "Carrier", "Daikin", "Grundfos", "Armstrong", "Lennox", "York", "Bell & Gossett"]
+PHOTO_PRESENT = {"0": 0.95, "1": 0.9, "2": 0.9, "3": 0.3}  # probability per photo sequence number
+EXPORTED_RATE = 0.01
+# SOI + EOI: enough for the app, which never decodes photos unless asked for a rendition
+TINY_JPEG = b"\xff\xd8\xff\xd9"
+FS_CALLS = ("stat", "lstat", "scandir", "listdir")  # os functions counted per operation
+WARM_BUDGET_MIN_SIZE = 10000  # fleets from this size on get the warm GET / budget check
+DEFAULT_BUDGET_MS = 5.0       # p50 of a no-change GET / with the sync worker running
+DEFAULT_BUDGET_FS_CALLS = 0   # filesystem calls per such request (the index answers it)
+SYNC_WORKER_WAIT = 600        # seconds to wait for the worker's first pass
+
+
+# --- Fleet ---
+def build_fleet(app_module, size: int, seed: int = 1):
+    """Write `size` ME assets into the app's JSON_DIR / IMG_DIR / DB_PATH, using its table layout."""
+    m = app_module
+    rng = random.Random(seed)
+    for path in (m.JSON_DIR, m.IMG_DIR, os.path.dirname(m.DB_PATH)):
+        os.makedirs(path, exist_ok=True)
+
+    qr_rows = []
+    exported = []
+    for i in range(size):
+        qr = str(100000 + i)
+        building = rng.choice(BUILDINGS)
+        approved = rng.random() < 0.1
+        doc = {
+            "structured_data": {
+                "Manufacturer": rng.choice(MANUFACTURERS),
+                "Model": f"M-{rng.randrange(1000):03d}",
+                "Serial Number": f"SN{rng.randrange(size * 2)}",
+                "Year": str(rng.randrange(1980, 2025)),
+                "UBC Tag": f"UBC-{i}",
+                "Technical Safety BC": "",
+                "Asset Group": f"Group {rng.randrange(40)}",
+                "Attribute": f"ATTR{rng.randrange(60)}",
+                "Diameter": "",
+                "Approved": "True" if approved else "",
+                "Flagged": "true" if rng.random() < 0.05 else "false",
+            },
+            "modified": rng.random() < 0.1,
+        }
+        with open(os.path.join(m.JSON_DIR, f"{qr}_ME_{building}.json"), "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=4)
+        for tag, chance in PHOTO_PRESENT.items():
+            if rng.random() < chance:
+                with open(os.path.join(m.IMG_DIR, f"{qr} {building} ME - {tag}.jpg"), "wb") as f:
+                    f.write(TINY_JPEG)
+        qr_rows.append((qr, "1" if approved else ""))
+        if rng.random() < EXPORTED_RATE:
+            exported.append((qr,))
+
+    conn = sqlite3.connect(m.DB_PATH)
+    try:
+        q = m._quote
+        conn.execute(f"CREATE TABLE {q(m.QR_CODES_TABLE)} ({q(m.QR_CODE_ID_COL)} TEXT PRIMARY KEY, {q(m.QR_APPROVED_COL)} TEXT)")
+        conn.execute(f"CREATE TABLE {q(m.SDI_TABLE)} ({', '.join(f'{q(c)} TEXT' for c in m.SDI_TARGET_COLS)})")
+        conn.execute(f"CREATE TABLE {q(m.SDI_PRINT_OUT_TABLE)} ({q(m.SDI_PRINT_OUT_QR_COL)} TEXT)")
+        conn.execute(f"CREATE TABLE {q(m.ASSET_GROUP_TABLE)} ({q(m.ASSET_GROUP_COL)} TEXT)")
+        conn.execute(f"CREATE TABLE {q(m.ATTRIBUTE_TABLE)} ({q(m.ATTRIBUTE_COL)} TEXT)")
+        conn.executemany(f"INSERT INTO {q(m.QR_CODES_TABLE)} VALUES (?, ?)", qr_rows)
+        conn.executemany(f"INSERT INTO {q(m.SDI_PRINT_OUT_TABLE)} VALUES (?)", exported)
+        conn.executemany(f"INSERT INTO {q(m.ASSET_GROUP_TABLE)} VALUES (?)", [(f"Group {n}",) for n in range(40)])
+        conn.executemany(f"INSERT INTO {q(m.ATTRIBUTE_TABLE)} VALUES (?)", [(f"ATTR{n}",) for n in range(60)])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# --- Measurement ---
+def read_proc_io() -> dict:
+    """Counters from /proc/self/io (Linux); empty elsewhere."""
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+class FsCalls:
+    """
+    Count the os.stat / lstat / scandir / listdir calls (FS_CALLS) made on the
+    calling thread while installed. os.path and pathlib go through these, so
+    exists(), getmtime(), Path.stat() and os.walk() are included; DirEntry
+    methods and calls on other threads (sync worker, persist queue) are not.
+    """
+
+    def __enter__(self):
+        self.counts = dict.fromkeys(FS_CALLS, 0)
+        self._originals = {name: getattr(os, name) for name in FS_CALLS}
+        ident = threading.get_ident()
+
+        def counting(name, original):
+            def wrapper(*args, **kwargs):
+                if threading.get_ident() == ident:
+                    self.counts[name] += 1
+                return original(*args, **kwargs)
+            return wrapper
+
+        for name, original in self._originals.items():
+            setattr(os, name, counting(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+        return False
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # bytes on macOS, KiB elsewhere
+
+
+def summarize(samples_ms) -> dict:
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))], 3)
+
+    return {
+        "count": len(ordered),
+        "min_ms": round(ordered[0], 3),
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1], 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.ops = {}
+
+    def run(self, name: str, fn, samples: int = 1):
+        """
+        Call fn(i) `samples` times; record latencies, failures, /proc/self/io
+        deltas and the filesystem calls (FsCalls) in total and per sample.
+        """
+        io_before = read_proc_io()
+        times = []
+        failures = 0
+        with FsCalls() as fs:
+            for i in range(samples):
+                started = time.perf_counter()
+                ok = fn(i)
+                times.append((time.perf_counter() - started) * 1000)
+                if ok is False:
+                    failures += 1
+        io_after = read_proc_io()
+        self.ops[name] = {
+            **summarize(times),
+            "failures": failures,
+            "io": {k: io_after[k] - io_before.get(k, 0) for k in ("syscr", "syscw", "rchar", "wchar") if k in io_after},
+            "fs_calls": fs.counts,
+            "fs_calls_per_sample": round(sum(fs.counts.values()) / samples, 2),
+        }
+        return self.ops[name]
+
+
+# --- Child: one fleet size in a fresh interpreter ---
+def run_size(size: int, samples: int, seed: int, budget_ms: float = DEFAULT_BUDGET_MS,
+             budget_fs_calls: float = DEFAULT_BUDGET_FS_CALLS) -> dict:
+    sys.path.insert(0, HERE)
+    import asset_plate_reviewer as m
+
+    started = time.perf_counter()
+    build_fleet(m, size, seed)
+    build_seconds = time.perf_counter() - started
+    doc_ids = sorted(name[:-5] for name in os.listdir(m.JSON_DIR) if name.endswith(".json"))
+
+    rng = random.Random(seed + 1)
+    client = m.app.test_client()
+    rec = Recorder()
+    if m.STORAGE_LAYOUT != "flat":
+        rec.run(f"migrate-layout {m.STORAGE_LAYOUT}", lambda i: m.migrate_storage(m.STORAGE_LAYOUT))
+    pick = [rng.choice(doc_ids) for _ in range(samples)]
+
+    def ok(response, *codes):
+        return response.status_code in (codes or (200,))
+
+    rec.run("sync_image_directory_to_db (cold)", lambda i: m.sync_image_directory_to_db())
+    rec.run("sync_image_directory_to_db (warm)", lambda i: m.sync_image_directory_to_db(), 3)
+    rec.run("sync_json_directory_to_db (cold)", lambda i: m.sync_json_directory_to_db())
+    rec.run("sync_json_directory_to_db (warm)", lambda i: m.sync_json_directory_to_db(), 3)
+
+    rec.run("GET / (cold)", lambda i: ok(client.get("/")))
+    rec.run("GET /", lambda i: ok(client.get("/")), samples)
+    rec.run("GET /api/assets", lambda i: ok(client.get(
+        f"/api/assets?draw={i + 1}&start={rng.randrange(max(1, size - 15))}&length=15")), samples)
+    rec.run("GET /api/assets (search)", lambda i: ok(client.get(
+        f"/api/assets?draw={i + 1}&start=0&length=15&search[value]={quote(rng.choice(MANUFACTURERS))}")), samples)
+    rec.run("GET /api/search", lambda i: ok(client.get(
+        f"/api/search?q={quote(rng.choice(MANUFACTURERS)[:4])}&limit=50")), samples)
+    def fuzzy(i):
+        name = rng.choice(MANUFACTURERS)
+        return ok(client.get(f"/api/search?q={quote(name[:2] + name[3:])}&fuzzy=1&limit=50"))  # one letter dropped
+
+    rec.run("GET /api/search (fuzzy)", fuzzy, samples)
+    rec.run("GET /api/duplicate_serials", lambda i: ok(client.get("/api/duplicate_serials")))
+    rec.run("GET /review/<doc_id>", lambda i: ok(client.get(f"/review/{pick[i]}")), samples)
+
+    def save(i):
+        form = {
+            "Manufacturer": rng.choice(MANUFACTURERS), "Model": f"M-{i:03d}", "Serial Number": f"SN{i}",
+            "Year": "2001", "UBC Tag": f"UBC-{i}", "Technical Safety BC": "", "Asset Group": "Group 1",
+            "Attribute": "ATTR1", "Diameter": "", "action": "save_next", "dashboard_query": "",
+        }
+        return ok(client.post(f"/review/{pick[i]}", data=form), 302)
+
+    rec.run("POST /review/<doc_id> (save_review)", save, samples)
+
+    # Stepping through the queue: each review page warms the docs save_next leads to
+    walk = [doc_ids[0]]
+    client.get(f"/review/{walk[0]}")
+
+    def save_next(i):
+        response = client.post(f"/review/{walk[-1]}", data={"action": "save_next", "dashboard_query": ""},
+                               follow_redirects=True)
+        walk.append(response.request.path.rsplit("/", 1)[-1])
+        return ok(response)
+
+    rec.run("POST save_next + GET next review", save_next, samples)
+    rec.run("POST /toggle_approved/<doc_id>", lambda i: ok(client.post(f"/toggle_approved/{pick[i]}")), samples)
+    rec.run("persist queue flush", lambda i: m.PERSIST_QUEUE.flush(120))
+    rec.run("GET /export.csv?approved=all", lambda i: ok(client.get("/export.csv?approved=all")))
+
+    # Steady state in production: the sync worker keeps the index fresh and
+    # nothing changed on disk, so GET / should be answered from memory
+    m.SYNC_WORKER.ensure_started()
+    deadline = time.monotonic() + SYNC_WORKER_WAIT
+    while m.SYNC_WORKER.status()["runs"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    client.get("/")
+    warm = rec.run("GET / (warm, worker)", lambda i: ok(client.get("/")), samples)
+    m.SYNC_WORKER.stop()
+    budget_problems = []
+    if size >= WARM_BUDGET_MIN_SIZE:
+        if warm["p50_ms"] > budget_ms:
+            budget_problems.append(f"GET / (warm, worker) p50 {warm['p50_ms']} ms > {budget_ms} ms")
+        if warm["fs_calls_per_sample"] > budget_fs_calls:
+            budget_problems.append(f"GET / (warm, worker) makes {warm['fs_calls_per_sample']} filesystem calls "
+                                   f"per request > {budget_fs_calls} ({warm['fs_calls']})")
+
+    # The key lookups behind the upserts and export checks must stay index-backed
+    with m._db_connection() as conn:
+        plans = m.explain_key_lookups(conn)
+        plan_problems = m.verify_query_plans(conn)
+
+    return {
+        "size": size,
+        "samples": samples,
+        "layout": m.STORAGE_LAYOUT,
+        "build_seconds": round(build_seconds, 3),
+        "peak_rss_kb": peak_rss_kb(),
+        "ops": rec.ops,
+        "query_plans": plans,
+        "plan_problems": plan_problems,
+        "budget_problems": budget_problems,
+    }
+
+
+# --- Parent ---
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(sizes, samples: int, seed: int, keep: bool, verbose: bool, layout: str = "flat",
+            budget_ms: float = DEFAULT_BUDGET_MS, budget_fs_calls: float = DEFAULT_BUDGET_FS_CALLS) -> dict:
+    runs = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"apr-bench-{size}-")
+        result_path = os.path.join(workdir, "result.json")
+        env = {
+            **os.environ,
+            "JSON_DIR": os.path.join(workdir, "json"),
+            "IMG_DIR": os.path.join(workdir, "img"),
+            "DB_PATH": os.path.join(workdir, "data", "QR_codes.db"),
+            "RENDITION_DIR": os.path.join(workdir, "data", "image_cache"),
+            "INDEX_SNAPSHOT_PATH": os.path.join(workdir, "data", "asset_index.pickle"),
+            "SYNC_WORKER_ENABLED": "0",
+            "RENDITION_PREGENERATE": "0",
+            "STORAGE_LAYOUT": layout,
+        }
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", str(size),
+               "--result", result_path, "--samples", str(samples), "--seed", str(seed),
+               "--budget-ms", str(budget_ms), "--budget-fs-calls", str(budget_fs_calls)]
+        print(f"-> {size} assets in {workdir}", file=sys.stderr)
+        try:
+            proc = subprocess.run(cmd, env=env, stdout=None if verbose else subprocess.DEVNULL)
+            if proc.returncode != 0:
+                runs.append({"size": size, "error": f"benchmark child exited with {proc.returncode}"})
+                continue
+            with open(result_path, encoding="utf-8") as f:
+                runs.append(json.load(f))
+        finally:
+            if not keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": seed,
+            "budget_ms": budget_ms,
+            "budget_fs_calls": budget_fs_calls,
+        },
+        "runs": runs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark asset_plate_reviewer.py on synthetic fleets.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated fleet sizes (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="requests per timed operation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the generated fleets")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    parser.add_argument("--layout", choices=["flat", "building"], default="flat",
+                        help="storage layout; fleets are generated flat and migrated")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"max p50 of a no-change GET / with the sync worker running, for fleets of "
+                             f"{WARM_BUDGET_MIN_SIZE}+ assets (default: %(default)s)")
+    parser.add_argument("--budget-fs-calls", type=float, default=DEFAULT_BUDGET_FS_CALLS,
+                        help="max stat/lstat/scandir/listdir calls per such request (default: %(default)s)")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_size(args.child, args.samples, args.seed, args.budget_ms, args.budget_fs_calls)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = run_all(sizes, args.samples, args.seed, args.keep, args.verbose, args.layout,
+                     args.budget_ms, args.budget_fs_calls)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for run in report["runs"]:
+        for problem in run.get("plan_problems", []):
+            print(f"!! {run['size']} assets: full scan in {problem}", file=sys.stderr)
+        for problem in run.get("budget_problems", []):
+            print(f"!! {run['size']} assets: over budget: {problem}", file=sys.stderr)
+        for name, op in run.get("ops", {}).items():
+            if op["failures"]:
+                print(f"!! {run['size']} assets: {name} failed {op['failures']} of {op['count']} times",
+                      file=sys.stderr)
+    failed = [run for run in report["runs"]
+              if "error" in run or run.get("plan_problems") or run.get("budget_problems")
+              or any(op["failures"] for op in run.get("ops", {}).values())]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
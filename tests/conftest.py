@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+# The app reads its paths from the environment at import time; each test then
+# repoints them at its own fleet (see the `fleet` fixture)
+_DEFAULT_FLEET = Path(tempfile.mkdtemp(prefix="apr-test-"))
+os.environ.update(
+    JSON_DIR=str(_DEFAULT_FLEET / "json"),
+    IMG_DIR=str(_DEFAULT_FLEET / "img"),
+    DB_PATH=str(_DEFAULT_FLEET / "data" / "QR_codes.db"),
+    INDEX_SNAPSHOT_PATH=str(_DEFAULT_FLEET / "data" / "asset_index.pickle"),
+    RENDITION_DIR=str(_DEFAULT_FLEET / "data" / "image_cache"),
+    SYNC_WORKER_ENABLED="0",
+    RENDITION_PREGENERATE="0",
+)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+import asset_plate_reviewer as apr  # noqa: E402
+
+
+def write_doc(fleet, doc_id: str, structured: dict, **extra) -> Path:
+    """Write one JSON document into the fleet's JSON_DIR (flat layout)."""
+    path = Path(fleet.json) / f"{doc_id}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"structured_data": structured, **extra}, f)
+    return path
+
+
+def create_db(path, unique_keys: bool = False):
+    """
+    The tables the app expects, shaped like the production DB (no indexes;
+    ensure_schema adds them). unique_keys=True creates sdi_dataset's unique
+    key up front, as a migrated DB would have.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        q = apr._quote
+        conn.execute(f"CREATE TABLE {q(apr.QR_CODES_TABLE)} ({q(apr.QR_CODE_ID_COL)} TEXT PRIMARY KEY, "
+                     f"{q(apr.QR_APPROVED_COL)} TEXT)")
+        conn.execute(f"CREATE TABLE {q(apr.SDI_TABLE)} ({', '.join(f'{q(c)} TEXT' for c in apr.SDI_TARGET_COLS)})")
+        conn.execute(f"CREATE TABLE {q(apr.SDI_PRINT_OUT_TABLE)} ({q(apr.SDI_PRINT_OUT_QR_COL)} TEXT)")
+        if unique_keys:
+            conn.execute(f"CREATE UNIQUE INDEX ux_test_sdi_key ON {q(apr.SDI_TABLE)} "
+                         f"({', '.join(q(c) for c in apr.SDI_KEY_COLS)})")
+        conn.commit()
+    finally:
+        conn.close()
+    apr._connectable.cache_clear()  # the app checks for the DB file once
+
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    """
+    Empty JSON / image / data directories for one test with the app pointed at
+    them. No database is created; use the `db` fixture (or create_db) for one.
+    """
+    paths = types.SimpleNamespace(
+        root=tmp_path, json=str(tmp_path / "json"), img=str(tmp_path / "img"),
+        data=tmp_path / "data", db=str(tmp_path / "data" / "QR_codes.db"),
+    )
+    for directory in (paths.json, paths.img, paths.data):
+        os.makedirs(directory, exist_ok=True)
+    monkeypatch.setattr(apr, "JSON_DIR", paths.json)
+    monkeypatch.setattr(apr, "IMG_DIR", paths.img)
+    monkeypatch.setattr(apr, "DB_PATH", paths.db)
+    monkeypatch.setattr(apr, "DATA_DIR", paths.data)
+    monkeypatch.setattr(apr, "RENDITION_DIR", paths.data / "image_cache")
+    monkeypatch.setattr(apr, "INDEX_SNAPSHOT_PATH", paths.data / "asset_index.pickle")
+    monkeypatch.setattr(apr, "PROCESSED_LOG", paths.data / "processed_images.log")
+    monkeypatch.setattr(apr, "PROCESSED_JSON_LOG", paths.data / "processed_json.log")
+    apr._connectable.cache_clear()
+    yield paths
+    assert apr.PERSIST_QUEUE.flush(10), "persist queue did not drain"
+    apr._connectable.cache_clear()
+
+
+@pytest.fixture
+def db(fleet):
+    create_db(fleet.db)
+    return fleet.db
+
+
+@pytest.fixture
+def client(fleet):
+    return apr.app.test_client()
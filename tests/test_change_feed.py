@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import asset_plate_reviewer as apr
+from conftest import write_doc
+
+DOC_ID = "1000_ME_101"
+
+
+@pytest.fixture
+def doc(fleet):
+    write_doc(fleet, DOC_ID, {"Manufacturer": "Acme", "Approved": ""})
+    apr.refresh_indexes()
+    return DOC_ID
+
+
+def _events(response, count):
+    """The first `count` SSE events of a streamed response, as (event, id, data)."""
+    events = []
+    chunks = iter(response.response)
+    try:
+        while len(events) < count:
+            chunk = next(chunks)
+            text = chunk.decode() if isinstance(chunk, bytes) else chunk
+            for block in text.split("\n\n"):
+                fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+                if "event" in fields:
+                    events.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    finally:
+        response.close()
+    return events[:count]
+
+
+def test_resume_replays_missed_changes(doc, client):
+    last_seen = apr.CHANGE_FEED.event_id(apr.CHANGE_FEED.cursor())
+    client.post(f"/toggle_approved/{DOC_ID}")
+    assert apr.PERSIST_QUEUE.flush(10)
+
+    response = client.get("/api/changes", headers={"Last-Event-ID": last_seen}, buffered=False)
+    assert response.mimetype == "text/event-stream"
+    (event, event_id, data), (counters, _id, totals) = _events(response, 2)
+    assert event == "row"
+    assert data["doc_id"] == DOC_ID
+    assert "approved" in data["kinds"]
+    assert data["row"]["Approved"] == "True"
+    assert apr.CHANGE_FEED.parse(event_id) > apr.CHANGE_FEED.parse(last_seen)
+    assert counters == "counters" and totals["approved"] == 1
+
+
+@pytest.mark.parametrize("last_event_id", ["another-process-7", "garbage"])
+def test_foreign_event_id_resets(doc, client, last_event_id):
+    response = client.get("/api/changes", headers={"Last-Event-ID": last_event_id}, buffered=False)
+    [(event, event_id, data)] = _events(response, 1)
+    assert event == "reset" and data == {}
+    assert event_id == apr.CHANGE_FEED.event_id(apr.CHANGE_FEED.cursor())
+
+
+def test_ids_older_than_the_backlog_reset():
+    feed = apr.ChangeFeed(backlog=2)
+    for n in range(3):
+        feed.publish(f"doc{n}", ("edited",))
+    assert feed.wait(0, 0) == ([], True)  # event 1 was dropped
+    events, reset = feed.wait(1, 0)
+    assert not reset and [doc_id for _seq, doc_id, _kinds in events] == ["doc1", "doc2"]
+    assert feed.wait(3, 0) == ([], False)  # up to date: nothing new, no reset
@@ -0,0 +1,64 @@
+import csv
+import io
+import sqlite3
+import zipfile
+
+import pytest
+
+import asset_plate_reviewer as apr
+
+# (QR Code, Building, Approved)
+ROWS = [("1000", "101", "1"), ("1001", "101", "0"), ("1002", "202", "1"), ("1003", "202", None)]
+EXPORTED = ["1002"]
+
+
+@pytest.fixture
+def export_db(db):
+    conn = sqlite3.connect(db)
+    conn.executemany(f'INSERT INTO {apr.SDI_TABLE} ("QR Code", "Building", "Approved") VALUES (?, ?, ?)', ROWS)
+    conn.executemany(f"INSERT INTO {apr.SDI_PRINT_OUT_TABLE} VALUES (?)", [(qr,) for qr in EXPORTED])
+    conn.commit()
+    conn.close()
+    return db
+
+
+def _qrs(client, **params):
+    response = client.get("/export.csv", query_string=params)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.headers["Content-Disposition"].startswith("attachment;")
+    text = response.get_data(as_text=True)
+    assert text.startswith("\ufeff")  # BOM so Excel reads UTF-8
+    rows = list(csv.reader(io.StringIO(text[1:])))
+    assert rows[0] == list(apr.SDI_TARGET_COLS)
+    return [row[0] for row in rows[1:]]
+
+
+@pytest.mark.parametrize("params, expected", [
+    ({}, ["1000", "1002"]),                                   # approved only by default
+    ({"approved": "0"}, ["1001", "1003"]),                    # NULL counts as not approved
+    ({"approved": "all"}, ["1000", "1001", "1002", "1003"]),
+    ({"approved": "all", "building": "202"}, ["1002", "1003"]),
+    ({"exported": "0"}, ["1000"]),                            # not yet in Planon
+    ({"exported": "1"}, ["1002"]),
+    ({"approved": "all", "exported": "0", "building": "101"}, ["1000", "1001"]),
+])
+def test_csv_filters(export_db, client, params, expected):
+    assert _qrs(client, **params) == expected
+
+
+@pytest.mark.parametrize("params", [{"approved": "yes"}, {"exported": "2"}])
+def test_bad_filter_is_rejected(export_db, client, params):
+    assert client.get("/export.csv", query_string=params).status_code == 400
+
+
+def test_xlsx_and_unknown_format(export_db, client):
+    response = client.get("/export.xlsx?approved=all")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as workbook:
+        sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+    assert all(qr in sheet for qr, _building, _approved in ROWS)
+    assert client.get("/export.pdf").status_code == 404
+
+
+def test_export_without_database(fleet, client):
+    assert client.get("/export.csv").status_code == 500
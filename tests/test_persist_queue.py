@@ -0,0 +1,102 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import asset_plate_reviewer as apr
+from conftest import write_doc
+
+DOC_ID = "1000_ME_101"
+
+
+@pytest.fixture
+def doc(fleet, db):
+    write_doc(fleet, DOC_ID, {"Manufacturer": "Acme", "Approved": ""})
+    apr.refresh_indexes()
+    return DOC_ID
+
+
+def _approved_on_disk():
+    path = apr.JSON_LAYOUT.locate(apr.JSON_DIR, f"{DOC_ID}.json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["structured_data"]["Approved"]
+
+
+def test_toggle_during_write_is_not_lost(client, doc, monkeypatch):
+    """A toggle that arrives while the previous one is being written must build on it."""
+    queue = apr.PERSIST_QUEUE
+    write_batch = queue._write_batch
+    writing = threading.Event()
+
+    def slow_write_batch(batch):
+        writing.set()
+        time.sleep(0.3)  # hold the batch in flight
+        return write_batch(batch)
+
+    monkeypatch.setattr(queue, "_write_batch", slow_write_batch)
+
+    first = client.post(f"/toggle_approved/{DOC_ID}").get_json()
+    assert writing.wait(5), "writer never picked up the first toggle"
+    second = client.post(f"/toggle_approved/{DOC_ID}").get_json()
+    assert queue.flush(10)
+
+    assert first["new_value"] == "True"
+    assert second["new_value"] == ""
+    assert _approved_on_disk() == ""
+    assert apr.ASSET_INDEX.get(DOC_ID)["Approved"] == ""
+
+
+def test_ticket_becomes_durable_with_json_and_db_written(client, doc, db):
+    ticket = client.post(f"/toggle_approved/{DOC_ID}").get_json()["ticket"]
+
+    status = client.get(f"/persist_status/{ticket}?wait=5").get_json()
+    assert status == {"ticket": ticket, "known": True, "durable": True, "error": None}
+    assert _approved_on_disk() == "True"
+    conn = sqlite3.connect(db)
+    try:
+        assert conn.execute(f"SELECT {apr.QR_APPROVED_COL} FROM {apr.QR_CODES_TABLE} "
+                            f"WHERE {apr.QR_CODE_ID_COL} = '1000'").fetchall() == [("1",)]
+        assert conn.execute(f'SELECT "Approved" FROM {apr.SDI_TABLE} '
+                            f'WHERE "QR Code" = \'1000\' AND "Building" = \'101\'').fetchall() == [("1",)]
+    finally:
+        conn.close()
+
+    unknown = client.get(f"/persist_status/{ticket + 1000}").get_json()
+    assert unknown["known"] is False and unknown["durable"] is False
+
+
+def test_ticket_is_not_durable_until_written(client, doc, monkeypatch):
+    queue = apr.PERSIST_QUEUE
+    write_batch = queue._write_batch
+    release = threading.Event()
+
+    def held_write_batch(batch):
+        release.wait(5)
+        return write_batch(batch)
+
+    monkeypatch.setattr(queue, "_write_batch", held_write_batch)
+    ticket = client.post(f"/toggle_approved/{DOC_ID}").get_json()["ticket"]
+    assert client.get(f"/persist_status/{ticket}").get_json()["durable"] is False
+    assert _approved_on_disk() == ""
+
+    release.set()
+    assert queue.flush(10)
+    assert queue.status(ticket)["durable"] is True
+    stats = queue.stats()
+    assert stats["pending"] == 0 and stats["inflight"] == 0
+    assert stats["durable_ticket"] >= ticket
+
+
+def test_failed_write_is_reported_on_its_ticket(client, doc, monkeypatch):
+    def failing_write(path, data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(apr, "_write_json_atomic", failing_write)
+    ticket = client.post(f"/toggle_approved/{DOC_ID}").get_json()["ticket"]
+    status = apr.PERSIST_QUEUE.wait(ticket, 5)
+    assert status["known"] is True
+    assert status["durable"] is False
+    assert "disk full" in status["error"]
+    assert _approved_on_disk() == ""
@@ -0,0 +1,86 @@
+import sqlite3
+
+import asset_plate_reviewer as apr
+from conftest import create_db
+
+
+def _connect(path):
+    # A plain connection: the pool would run ensure_schema on open
+    return sqlite3.connect(path, isolation_level=None)
+
+
+def _upsert_statements(conn, row):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        apr._db_upsert_row(conn, apr.SDI_TABLE, key_cols=apr.SDI_KEY_COLS, row=row)
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if not s.startswith("PRAGMA")]
+
+
+def test_ensure_schema_makes_key_lookups_index_backed(fleet):
+    create_db(fleet.db)
+    conn = _connect(fleet.db)
+    try:
+        assert apr.verify_query_plans(conn), "fixture tables should start without indexes"
+        assert not apr._db_has_unique_key(conn, apr.SDI_TABLE, apr.SDI_KEY_COLS)
+
+        states = apr.ensure_schema(conn)
+        assert states["ux_sdi_dataset_qr_building"] == "created"
+        assert apr.verify_query_plans(conn) == []
+        assert apr.ensure_schema(conn)["ux_sdi_dataset_qr_building"] == "ok"  # settled, not re-created
+
+        # With the unique key in place the upsert is one INSERT ... ON CONFLICT statement
+        assert apr._db_has_unique_key(conn, apr.SDI_TABLE, apr.SDI_KEY_COLS)
+        row = {"QR Code": "1000", "Building": "101", "Manufacturer": "Acme"}
+        statements = _upsert_statements(conn, row)
+        assert len(statements) == 1 and "ON CONFLICT" in statements[0]
+        _upsert_statements(conn, {**row, "Manufacturer": "Zenith"})
+        assert conn.execute(f"SELECT Manufacturer FROM {apr.SDI_TABLE}").fetchall() == [("Zenith",)]
+    finally:
+        conn.close()
+
+
+def test_duplicate_keys_keep_the_update_then_insert_path(fleet):
+    create_db(fleet.db)
+    conn = _connect(fleet.db)
+    try:
+        conn.executemany(f'INSERT INTO {apr.SDI_TABLE} ("QR Code", "Building", "Manufacturer") VALUES (?, ?, ?)',
+                         [("1000", "101", "Old"), ("1000", "101", "New")])
+        states = apr.ensure_schema(conn)
+        assert states["ux_sdi_dataset_qr_building"] == "duplicates"
+        assert conn.execute(f"SELECT COUNT(*) FROM {apr.SDI_TABLE}").fetchone()[0] == 2  # nothing deleted
+
+        assert not apr._db_has_unique_key(conn, apr.SDI_TABLE, apr.SDI_KEY_COLS)
+        statements = _upsert_statements(conn, {"QR Code": "1000", "Building": "101", "Manufacturer": "Acme"})
+        assert statements[0].startswith("UPDATE")
+        assert conn.execute(f"SELECT DISTINCT Manufacturer FROM {apr.SDI_TABLE}").fetchall() == [("Acme",)]
+    finally:
+        conn.close()
+
+
+def test_dedupe_keys_keeps_the_newest_row(fleet):
+    create_db(fleet.db)
+    conn = _connect(fleet.db)
+    conn.executemany(f'INSERT INTO {apr.SDI_TABLE} ("QR Code", "Building", "Manufacturer") VALUES (?, ?, ?)',
+                     [("1000", "101", "Oldest"), ("1001", "101", "Only"), ("1000", "101", "Newer"),
+                      ("1000", "101", "Newest")])
+    conn.close()
+
+    report = apr.dedupe_keys()
+    assert report["ux_sdi_dataset_qr_building"] == {
+        "table": apr.SDI_TABLE, "key": apr.SDI_KEY_COLS, "duplicates": 2, "removed": 0, "index": "missing"}
+
+    report = apr.dedupe_keys(apply=True)
+    assert report["ux_sdi_dataset_qr_building"]["removed"] == 2
+    assert report["ux_sdi_dataset_qr_building"]["index"] == "created"
+    conn = _connect(fleet.db)
+    try:
+        rows = conn.execute(f'SELECT "QR Code", Manufacturer FROM {apr.SDI_TABLE} ORDER BY "QR Code"').fetchall()
+        assert rows == [("1000", "Newest"), ("1001", "Only")]
+        assert apr.verify_query_plans(conn) == []
+        assert apr._db_has_unique_key(conn, apr.SDI_TABLE, apr.SDI_KEY_COLS)
+    finally:
+        conn.close()
+    assert apr.dedupe_keys()["ux_sdi_dataset_qr_building"]["index"] == "ok"
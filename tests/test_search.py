@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+import asset_plate_reviewer as apr
+
+ROWS = [
+    ("1000", "101", "Bell & Gossett", "e-90", "SN-1042/B"),
+    ("1001", "101", "Bell & Gossett", "e-1510", "SN-1042/B"),
+    ("1002", "202", "Grundfos", "UPS 15", "77-AB"),
+]
+
+
+@pytest.fixture
+def search_db(db):
+    conn = sqlite3.connect(db)
+    conn.executemany(f'INSERT INTO {apr.SDI_TABLE} ("QR Code", "Building", "Manufacturer", "Model", "Serial") '
+                     f'VALUES (?, ?, ?, ?, ?)', ROWS)
+    conn.commit()
+    conn.close()
+    return db
+
+
+def _qrs(response):
+    assert response.status_code == 200, response.get_json()
+    return sorted(r["QR Code"] for r in response.get_json()["results"])
+
+
+def test_punctuation_words_are_ignored(search_db, client):
+    assert _qrs(client.get("/api/search", query_string={"q": "Bell & Gossett"})) == ["1000", "1001"]
+    assert _qrs(client.get("/api/search", query_string={"q": "bell & goset", "fuzzy": "1"})) == ["1000", "1001"]
+
+
+def test_query_without_searchable_words_is_rejected(search_db, client):
+    response = client.get("/api/search", query_string={"q": "& !!"})
+    assert response.status_code == 400
+    assert "nothing to search for" in response.get_json()["error"]
+    assert _qrs(client.get("/api/search", query_string={"q": ""})) == []
+
+
+def test_field_and_prefix_match(search_db, client):
+    assert _qrs(client.get("/api/search", query_string={"q": "sn-1042/b", "field": "serial"})) == ["1000", "1001"]
+    assert _qrs(client.get("/api/search", query_string={"q": "grund"})) == ["1002"]
+    assert _qrs(client.get("/api/search", query_string={"q": "grund", "field": "model"})) == []
+
+
+def test_new_rows_are_indexed_on_upsert(search_db, client):
+    client.get("/api/search", query_string={"q": "x"})  # creates the index from the existing rows
+    apr._db_upsert_sdi_dataset("1003", "303", {"Manufacturer": "Zebulon", "Serial Number": "Z-1"})
+    assert _qrs(client.get("/api/search", query_string={"q": "zebulon"})) == ["1003"]
+    with apr._db_connection() as conn:
+        assert apr.check_search_index(conn)["ok"]
+
+
+def test_duplicate_serials(search_db, client):
+    groups = client.get("/api/duplicate_serials").get_json()["duplicates"]
+    assert [(g["serial"], [a["qr_code"] for a in g["assets"]]) for g in groups] == [("SN1042B", ["1000", "1001"])]
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import asset_plate_reviewer as apr
+from conftest import write_doc
+
+DOCS = {"1000_ME_101": "101", "1001_ME_303-1": "303-1", "1002_ME_202": "202"}
+PHOTOS = ["1000 101 ME - 0.jpg", "1001 303-1 ME - 1.jpg", "1002 202 ME - 3.jpg"]
+
+
+@pytest.fixture
+def flat_fleet(fleet):
+    for doc_id in DOCS:
+        write_doc(fleet, doc_id, {"Manufacturer": doc_id})
+    for photo in PHOTOS:
+        with open(os.path.join(fleet.img, photo), "wb") as f:
+            f.write(photo.encode())
+    return fleet
+
+
+def _files(root):
+    """{relative path: content} of every file under root."""
+    found = {}
+    for directory, _dirs, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                found[os.path.relpath(path, root)] = f.read()
+    return found
+
+
+def test_round_trip(flat_fleet):
+    json_before, img_before = _files(flat_fleet.json), _files(flat_fleet.img)
+
+    assert apr.migrate_storage("building", dry_run=True) == {
+        "json": {"moved": 3, "conflicts": 0}, "images": {"moved": 3, "conflicts": 0}}
+    assert _files(flat_fleet.json) == json_before  # dry run moves nothing
+
+    apr.migrate_storage("building")
+    assert sorted(_files(flat_fleet.json)) == sorted(os.path.join(b, f"{d}.json") for d, b in DOCS.items())
+    assert sorted(_files(flat_fleet.img)) == sorted(os.path.join(p.split()[1], p) for p in PHOTOS)
+    layout = apr.make_layout("building", apr.JSON_NAME_RE, 3)
+    assert layout.locate(flat_fleet.json, "1001_ME_303-1.json") == os.path.join(flat_fleet.json, "303-1",
+                                                                                "1001_ME_303-1.json")
+
+    assert apr.migrate_storage("flat") == {
+        "json": {"moved": 3, "conflicts": 0}, "images": {"moved": 3, "conflicts": 0}}
+    assert _files(flat_fleet.json) == json_before
+    assert _files(flat_fleet.img) == img_before
+    assert sorted(os.listdir(flat_fleet.json)) == sorted(f"{d}.json" for d in DOCS)  # empty shards removed
+
+
+def test_rerun_after_interruption(flat_fleet, monkeypatch):
+    rename = os.rename
+    calls = []
+
+    def interrupted_rename(src, dst):
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(src)
+        rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", interrupted_rename)
+    with pytest.raises(KeyboardInterrupt):
+        apr.migrate_storage("building")
+    monkeypatch.setattr(os, "rename", rename)
+
+    # Half-migrated: the sharded layout still finds every document
+    layout = apr.make_layout("building", apr.JSON_NAME_RE, 3)
+    assert all(layout.locate(flat_fleet.json, f"{d}.json") for d in DOCS)
+
+    report = apr.migrate_storage("building")
+    assert report == {"json": {"moved": 1, "conflicts": 0}, "images": {"moved": 3, "conflicts": 0}}
+    assert apr.migrate_storage("building") == {
+        "json": {"moved": 0, "conflicts": 0}, "images": {"moved": 0, "conflicts": 0}}
+    assert sorted(_files(flat_fleet.json)) == sorted(os.path.join(b, f"{d}.json") for d, b in DOCS.items())
+
+
+def test_existing_destination_is_a_conflict(flat_fleet):
+    os.makedirs(os.path.join(flat_fleet.json, "101"))
+    write_doc(flat_fleet, os.path.join("101", "1000_ME_101"), {"Manufacturer": "other copy"})
+    report = apr.migrate_storage("building")
+    assert report["json"] == {"moved": 2, "conflicts": 1}
+    assert os.path.exists(os.path.join(flat_fleet.json, "1000_ME_101.json"))  # left alone, not overwritten
@@ -0,0 +1,42 @@
+import json
+import sqlite3
+
+import asset_plate_reviewer as apr
+from conftest import write_doc
+
+DOC_ID = "1000_ME_101"
+
+
+def _approved_on_disk(fleet):
+    with open(f"{fleet.json}/{DOC_ID}.json", encoding="utf-8") as f:
+        return json.load(f)["structured_data"]["Approved"]
+
+
+def test_toggle_without_database(fleet, client):
+    """No DB file: approving and un-approving still work on the JSON (nothing can be exported)."""
+    write_doc(fleet, DOC_ID, {"Manufacturer": "Acme", "Approved": ""})
+
+    response = client.post(f"/toggle_approved/{DOC_ID}")
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["new_value"] == "True"
+    assert apr.PERSIST_QUEUE.flush(10)
+    assert _approved_on_disk(fleet) == "True"
+
+    response = client.post(f"/toggle_approved/{DOC_ID}")
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["new_value"] == ""
+    assert apr.PERSIST_QUEUE.flush(10)
+    assert _approved_on_disk(fleet) == ""
+
+
+def test_unapprove_exported_asset_is_refused(fleet, db, client):
+    write_doc(fleet, DOC_ID, {"Manufacturer": "Acme", "Approved": "True"})
+    conn = sqlite3.connect(db)
+    conn.execute(f"INSERT INTO {apr.SDI_PRINT_OUT_TABLE} VALUES ('1000')")
+    conn.commit()
+    conn.close()
+
+    response = client.post(f"/toggle_approved/{DOC_ID}")
+    assert response.status_code == 409
+    assert response.get_json()["exported"] is True
+    assert _approved_on_disk(fleet) == "True"